@@ -1,3 +1,14 @@
-from channels.routing import ProtocolTypeRouter
+from django.core.asgi import get_asgi_application
 
-application = ProtocolTypeRouter({})
\ No newline at end of file
+# Set up Django before importing consumers, which import models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+
+from quotes.routing import websocket_urlpatterns
+
+application = ProtocolTypeRouter({
+    "http": django_asgi_app,
+    "websocket": AllowedHostsOriginValidator(URLRouter(websocket_urlpatterns)),
+})
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,6 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, to time the whole request. Only active when PROFILING is set
+    'quotes.profiling.ProfilingMiddleware',
+
     'django.middleware.security.SecurityMiddleware',
 
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -119,6 +122,72 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# File based so that management commands (e.g. getyfdata) and web workers share entries
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / '.cache')),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+
+# Memory-mapped copy of the price data for analytics reads (see quotes/price_store.py)
+# Disabled when unset: prices are then read from the database
+
+PRICE_STORE_DIR = config('PRICE_STORE_DIR', default=None)
+
+
+# Trading days a missing quote is replaced by the last one when aligning instruments (see quotes/alignment.py)
+
+PRICE_MAX_STALENESS = config('PRICE_MAX_STALENESS', default=5, cast=int)
+
+
+# Background jobs of Dash callbacks (see quotes/jobs.py): threads per process, and seconds results are kept
+
+JOB_WORKERS = config('JOB_WORKERS', default=2, cast=int)
+JOB_RETENTION = config('JOB_RETENTION', default=600, cast=int)
+
+
+# Threads of a Monte Carlo projection (see quotes/projection.py), within one background job
+
+PROJECTION_WORKERS = config('PROJECTION_WORKERS', default=1, cast=int)
+
+
+# Live valuations pushed over websockets (see quotes/live.py): each process watches the market data version every
+# LIVE_VALUATION_INTERVAL seconds and notifies its own consumers, so the in-memory channel layer is enough
+
+CHANNEL_LAYERS = {
+    'default': {'BACKEND': config('CHANNEL_LAYER_BACKEND', default='channels.layers.InMemoryChannelLayer')},
+}
+LIVE_VALUATION_INTERVAL = config('LIVE_VALUATION_INTERVAL', default=5, cast=float)
+
+
+# Profiling of views and Dash callbacks (see quotes/profiling.py)
+
+PROFILING = config('PROFILING', default=False, cast=bool)
+
+# /metrics is served to staff users, and to clients connecting from one of METRICS_ALLOWED_IPS (comma separated,
+# ex. the Prometheus server). Behind a reverse proxy every client connects from the proxy: leave it empty then
+
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='', cast=Csv())
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'quotes': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -166,4 +235,8 @@ CRISPY_TEMPLATE_PACK = 'django_bootstrap5'
 
 ASGI_APPLICATION = 'pea_project.routing.application'
 
-#PLOTLY_DASH = {"serve_locally": True}
+PLOTLY_DASH = {
+    #"serve_locally": True,
+    # Dash apps are imported on their first request rather than with the URLconf
+    "stateless_loader": "quotes.dash_loader.load_dash_app",
+}
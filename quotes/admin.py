@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.apps import apps
-from .models import AccountOwner, Portfolio, FinancialObject, Order, FinancialData
+from .models import AccountOwner, Portfolio, FinancialObject, Order, FinancialData, DataQualityFlag, CorporateAction, TargetWeight, CashMovement
 # Register your models here.
 
 admin.site.register(AccountOwner)
@@ -26,4 +26,31 @@ class FinancialDataAdmin(admin.ModelAdmin):
 	list_display = ["id_object", "date", "field", "value", "origin"]
 	list_filter = ["id_object", "date", "field"]
 	search_fields = ["id_object", "date", "field"]
-	ordering = ["id"]
\ No newline at end of file
+	ordering = ["id"]
+@admin.register(DataQualityFlag)
+class DataQualityFlagAdmin(admin.ModelAdmin):
+	list_display = ["data", "kind", "score"]
+	list_filter = ["kind", "data__id_object"]
+	search_fields = ["data__id_object__name", "kind"]
+	ordering = ["-data__date"]
+
+@admin.register(CorporateAction)
+class CorporateActionAdmin(admin.ModelAdmin):
+	list_display = ["date", "id_object", "action", "ratio", "old_isin", "new_isin"]
+	list_filter = ["action", "id_object"]
+	search_fields = ["id_object__name", "old_isin", "new_isin"]
+	date_hierarchy = "date"
+	ordering = ["-date"]
+
+@admin.register(TargetWeight)
+class TargetWeightAdmin(admin.ModelAdmin):
+	list_display = ["portfolio", "id_object", "weight"]
+	list_filter = ["portfolio"]
+	ordering = ["portfolio", "-weight"]
+
+@admin.register(CashMovement)
+class CashMovementAdmin(admin.ModelAdmin):
+	list_display = ["date", "portfolio", "kind", "amount"]
+	list_filter = ["portfolio", "kind"]
+	date_hierarchy = "date"
+	ordering = ["-date"]
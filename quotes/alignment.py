@@ -0,0 +1,59 @@
+"""
+Alignment of price matrices of instruments quoted on different calendars (exchanges, holidays, late NAVs).
+
+Prices are put on the union of the trading days of the instruments, and a missing quote is replaced
+by the last one for at most PRICE_MAX_STALENESS trading days. Analytics work on the aligned prices,
+and use the masks to know which values are actual quotes.
+"""
+from dataclasses import dataclass
+
+import pandas as pd
+from django.conf import settings
+
+
+@dataclass
+class AlignedPrices:
+    """
+    Prices on a common calendar.
+
+    Args:
+        prices: (dates x instruments) prices, forward-filled within the staleness limit
+        gaps: (dates x instruments) True where an instrument has no quote of its own on a date of the calendar
+        stale: (dates x instruments) True where there is still no price after filling, i.e. before the first
+            quote of an instrument or after more than the staleness limit without a quote
+    """
+    prices: pd.DataFrame
+    gaps: pd.DataFrame
+    stale: pd.DataFrame
+
+    def quoted(self, columns=None) -> pd.Series:
+        """
+        Dates on which at least one of the columns (default: all) has a quote of its own.
+        """
+        gaps = self.gaps if columns is None else self.gaps[columns]
+        return ~gaps.all(axis=1)
+
+    def priced(self, columns=None) -> pd.Series:
+        """
+        Dates on which all of the columns (default: all) have a price, filled or not.
+        """
+        stale = self.stale if columns is None else self.stale[columns]
+        return ~stale.any(axis=1)
+
+
+def align_prices(prices: pd.DataFrame, max_staleness: int | None = None) -> AlignedPrices:
+    """
+    Align a (dates x instruments) price matrix, as returned by YahooFinanceQuery.get_price_matrix.
+
+    Args:
+        max_staleness: number of consecutive trading days a quote is carried over (default: PRICE_MAX_STALENESS)
+    """
+    if max_staleness is None:
+        max_staleness = settings.PRICE_MAX_STALENESS
+
+    # Union calendar: dates on which at least one instrument is quoted
+    prices = prices.dropna(axis=0, how="all").sort_index()
+    gaps = prices.isna()
+
+    filled = prices.ffill(limit=max_staleness) if max_staleness > 0 else prices
+    return AlignedPrices(prices=filled, gaps=gaps, stale=filled.isna())
@@ -0,0 +1,76 @@
+"""
+Portfolio analytics persisted in the cache, shared by all web workers.
+
+Entries are computed on first use, or ahead of time for all portfolios by the recompute_analytics
+command, and are stale as soon as prices or orders change.
+"""
+import pandas as pd
+from django.core.cache import cache
+
+from quotes.cache import cache_key, get_market_data_version, get_orders_version, get_or_compute
+from quotes.models import Portfolio
+
+PORTFOLIO_SERIES = "portfolio-series"
+PORTFOLIO_WEIGHTS = "portfolio-weights"
+
+
+def get_series_versions() -> tuple[str, str]:
+    """
+    Versions of the data portfolio time series are computed from.
+    """
+    return get_market_data_version(), get_orders_version()
+
+
+def to_series_frame(ts_val: pd.Series, ts_ret: pd.Series, ts_cumul_ret: pd.Series, ts_cash: pd.Series,
+                    ts_external: pd.Series) -> pd.DataFrame:
+    return pd.DataFrame({"value": ts_val, "return": ts_ret, "cumulative_return": ts_cumul_ret, "cash": ts_cash,
+                         "external": ts_external}).sort_index()
+
+
+def get_portfolio_series(portfolio: Portfolio) -> pd.DataFrame:
+    """
+    Value, return, cumulative return, cash and cumulative net external flows of a portfolio by date.
+    """
+    def compute() -> pd.DataFrame:
+        portfolio.get_TS()
+        return to_series_frame(portfolio.ts_val, portfolio.ts_ret, portfolio.ts_cumul_ret, portfolio.ts_cash,
+                               portfolio.ts_external)
+
+    return get_or_compute(PORTFOLIO_SERIES, (portfolio.id,), get_series_versions(), compute)
+
+
+def load_portfolio_series(portfolio: Portfolio) -> None:
+    """
+    Set the time series attributes of a portfolio (as get_TS does) from the cache.
+    """
+    series = get_portfolio_series(portfolio)
+    portfolio.ts_val = series["value"].dropna()
+    portfolio.ts_ret = series["return"].dropna()
+    portfolio.ts_cumul_ret = series["cumulative_return"].dropna()
+    portfolio.ts_cash = series["cash"].dropna()
+    portfolio.ts_external = series["external"].dropna()
+
+
+def set_portfolio_series(series: dict[int, pd.DataFrame], versions: tuple[str, str]) -> None:
+    """
+    Store the time series of several portfolios (by id) at once.
+    """
+    cache.set_many({cache_key(PORTFOLIO_SERIES, (id,), versions): frame for id, frame in series.items()})
+
+
+def get_portfolio_weights(portfolio: Portfolio) -> pd.DataFrame:
+    """
+    Weight of each object (dates x object ids) in the value of a portfolio.
+    """
+    def compute() -> pd.DataFrame:
+        return Portfolio.compute_weights(*portfolio.get_ledger())
+
+    return get_or_compute(PORTFOLIO_WEIGHTS, (portfolio.id,), get_series_versions(), compute)
+
+
+def set_portfolio_weights(weights: dict[int, pd.DataFrame], versions: tuple[str, str]) -> None:
+    """
+    Store the weights of several portfolios (by id) at once.
+    """
+    cache.set_many({cache_key(PORTFOLIO_WEIGHTS, (id,), versions): frame for id, frame in weights.items()})
+
@@ -0,0 +1,251 @@
+"""
+Read-only HTTP API on portfolio and instrument time series, as streamed JSON or CSV.
+
+Responses are produced by generators, a chunk of rows at a time. ETag and Last-Modified are derived
+from the version tokens of the data (see quotes.cache), so that conditional GETs of unchanged data
+are answered with a 304 before anything is computed.
+
+Query parameters: from and to (ISO dates), field (depends on the endpoint) and format (json or csv).
+"""
+import csv
+import hashlib
+import json
+import math
+from datetime import date, datetime
+from functools import wraps
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_GET
+
+from quotes.analytics import get_portfolio_series
+from quotes.cache import get_corporate_actions_version, get_market_data_version, get_orders_version, version_time
+from quotes.consolidation import ConsolidatedView, get_consolidation
+from quotes.corporate_actions import get_adjustment_factors
+from quotes.models import AccountOwner, FinancialData, FinancialObject, Portfolio
+
+CHUNK_SIZE = 1000
+
+SERIES_FIELDS = ["value", "return", "cumulative_return"]
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class Echo:
+    """
+    File-like object returning what is written to it, for csv.writer to format lines one by one.
+    """
+    def write(self, value: str) -> str:
+        return value
+
+
+def chunks(rows: Iterable, size: int = CHUNK_SIZE) -> Iterator[list]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def to_json_value(value):
+    """
+    JSON serializable value: dates as ISO strings, numpy numbers as Python ones, NaN as null.
+    """
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def stream_json(columns: list[str], rows: Iterable[tuple]) -> Iterator[str]:
+    yield "["
+    for i, chunk in enumerate(chunks(rows)):
+        yield ("," if i else "") + ",".join(
+            json.dumps({column: to_json_value(value) for column, value in zip(columns, row)}) for row in chunk)
+    yield "]"
+
+
+def stream_csv(columns: list[str], rows: Iterable[tuple]) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for chunk in chunks(rows):
+        yield "".join(writer.writerow([to_json_value(value) for value in row]) for row in chunk)
+
+
+def streaming_response(request, filename: str, columns: list[str], rows: Iterable[tuple]) -> StreamingHttpResponse:
+    """
+    Stream rows in the format asked for by the format parameter.
+    """
+    if get_format(request) == "csv":
+        response = StreamingHttpResponse(stream_csv(columns, rows), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+        return response
+    return StreamingHttpResponse(stream_json(columns, rows), content_type="application/json")
+
+
+def get_format(request) -> str:
+    fmt = request.GET.get("format", "json")
+    if fmt not in ("json", "csv"):
+        raise BadRequest(f"Unknown format {fmt!r}, expected json or csv")
+    return fmt
+
+
+def get_date(request, name: str, default: date | None = None) -> date | None:
+    value = request.GET.get(name)
+    if value is None:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f"Invalid {name} date {value!r}, expected YYYY-MM-DD")
+
+
+def get_field(request, fields: list[str], default: str) -> str:
+    field = request.GET.get("field", default)
+    if field not in fields:
+        raise BadRequest(f"Unknown field {field!r}, expected one of {', '.join(fields)}")
+    return field
+
+
+def versioned(*get_versions: Callable[[], str]):
+    """
+    Decorator answering conditional GETs from data versions, and turning BadRequest into 400 responses.
+    The ETag also depends on the URL, parameters included.
+    """
+    def etag(request, *args, **kwargs):
+        versions = [get_version() for get_version in get_versions]
+        return hashlib.md5(f"{':'.join(versions)}|{request.get_full_path()}".encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        times = [version_time(get_version()) for get_version in get_versions]
+        return max(times) if all(times) else None
+
+    def decorator(view):
+        conditional_view = require_GET(condition(etag_func=etag, last_modified_func=last_modified)(view))
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                return conditional_view(request, *args, **kwargs)
+            except BadRequest as e:
+                return JsonResponse({"error": str(e)}, status=400)
+
+        return wrapper
+
+    return decorator
+
+
+@versioned(get_market_data_version, get_orders_version)
+def portfolio_series(request, pk: int):
+    """
+    Time series of a portfolio. field: value (default), return or cumulative_return.
+    """
+    portfolio = Portfolio.objects.filter(id=pk).first()
+    if portfolio is None or not portfolio.orders.exists():
+        raise Http404(f"No portfolio with orders with id {pk}")
+
+    field = get_field(request, SERIES_FIELDS, "value")
+    from_date, until_date = get_date(request, "from", date.min), get_date(request, "to", date.max)
+    get_format(request)
+
+    series = get_portfolio_series(portfolio)[field].dropna()
+    series = series[(series.index >= from_date) & (series.index <= until_date)]
+
+    return streaming_response(request, f"portfolio_{pk}_{field}", ["date", field], series.items())
+
+
+@versioned(get_orders_version, get_corporate_actions_version)
+def portfolio_inventory(request, pk: int):
+    """
+    Positions of a portfolio at the end of a date (default: today).
+    """
+    portfolio = Portfolio.objects.filter(id=pk).first()
+    if portfolio is None:
+        raise Http404(f"No portfolio with id {pk}")
+
+    as_of = get_date(request, "date", date.today())
+    get_format(request)
+
+    inventory = portfolio.get_inventory(as_of)
+    rows = ((entry.fin_obj.id, entry.fin_obj.name, entry.fin_obj.isin, entry.nb, entry.pru) for entry in inventory.portfolio_entries)
+
+    return streaming_response(request, f"portfolio_{pk}_inventory_{as_of}", ["id", "name", "isin", "number", "pru"], rows)
+
+
+def consolidated_view(pk: int | None) -> ConsolidatedView:
+    """
+    View of the portfolios of an owner, or of all owners if pk is None.
+    """
+    consolidation = get_consolidation()
+    if pk is None:
+        return consolidation.household
+    if pk not in consolidation.owners:
+        raise Http404(f"No owner with orders with id {pk}")
+    return consolidation.owners[pk]
+
+
+@versioned(get_market_data_version, get_orders_version)
+def consolidated_series(request, pk: int | None = None):
+    """
+    Time series of the portfolios of an owner, or of all owners, consolidated. field: as portfolio_series.
+    """
+    if pk is not None and not AccountOwner.objects.filter(id=pk).exists():
+        raise Http404(f"No owner with id {pk}")
+
+    field = get_field(request, SERIES_FIELDS, "value")
+    from_date, until_date = get_date(request, "from", date.min), get_date(request, "to", date.max)
+    get_format(request)
+
+    series = consolidated_view(pk).series[field].dropna()
+    series = series[(series.index >= from_date) & (series.index <= until_date)]
+
+    return streaming_response(request, f"{'household' if pk is None else f'owner_{pk}'}_{field}", ["date", field], series.items())
+
+
+@versioned(get_market_data_version, get_orders_version)
+def consolidated_inventory(request, pk: int | None = None):
+    """
+    Positions of the portfolios of an owner, or of all owners, added up and valued at the latest prices.
+    """
+    if pk is not None and not AccountOwner.objects.filter(id=pk).exists():
+        raise Http404(f"No owner with id {pk}")
+    get_format(request)
+
+    inventory = consolidated_view(pk).inventory
+    rows = inventory[["Name", "Number", "Price", "Value", "Weight"]].itertuples(name=None)
+
+    return streaming_response(request, f"{'household' if pk is None else f'owner_{pk}'}_inventory",
+                              ["id", "name", "number", "price", "value", "weight"], rows)
+
+
+@versioned(get_market_data_version, get_corporate_actions_version)
+def instrument_prices(request, pk: int):
+    """
+    Values of an instrument, in current units. field: NAV (default) or Dividends.
+    Rows are read from the database by chunks, as they are streamed. As in analytics, rows excluded by the data
+    quality scan are left out, and a date with values of several origins gets the last one inserted.
+    """
+    if not FinancialObject.objects.filter(id=pk).exists():
+        raise Http404(f"No instrument with id {pk}")
+
+    field = get_field(request, FinancialData.TimeSeriesField.values, FinancialData.TimeSeriesField.NAV)
+    from_date, until_date = get_date(request, "from", date.min), get_date(request, "to", date.max)
+    get_format(request)
+
+    rows = FinancialData.valid().filter(id_object=pk, field=field, date__gte=from_date, date__lte=until_date)\
+        .order_by("date", "id").values_list("date", "value").iterator(chunk_size=CHUNK_SIZE)
+
+    def adjusted_rows() -> Iterator[tuple[date, float]]:
+        latest = ((day, list(values)[-1][1]) for day, values in groupby(rows, key=itemgetter(0)))
+        factors = get_adjustment_factors()
+        for chunk in chunks(latest):
+            days, values = zip(*chunk)
+            yield from zip(days, (np.array(values, dtype=float) / factors.factors(pk, days)).tolist())
+
+    return streaming_response(request, f"instrument_{pk}_{field}", ["date", field.lower()], adjusted_rows())
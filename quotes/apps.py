@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class QuotesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quotes'
+
+    def ready(self):
+        # Connect the cache invalidation receivers
+        from quotes import signals
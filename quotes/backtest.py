@@ -0,0 +1,219 @@
+"""
+Backtests of hypothetical order schedules over the stored prices, to compare strategies with the real portfolios.
+
+A strategy invests an initial amount on the first trading day, a monthly contribution on the first trading day of
+each month, with target weights, and optionally rebalances to them every few months (see quotes/rebalancing.py):
+lump sum, monthly DCA and periodic rebalancing are the same engine with different parameters.
+
+Orders are in whole shares and pay a fixed fee and a fee rate. Values are those of the positions, and returns
+are computed on the holdings of the day before (orders take effect at the end of the day); the amount invested
+follows PortfolioEntry (buys add their amount and fees, sells remove their proceeds). Money that could not buy a whole share of an object is kept for it
+until the next month.
+
+Sweeps of many strategies run across a process pool: the aligned price matrix is sent once to each worker.
+"""
+import math
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import django
+import numpy as np
+import pandas as pd
+from django.apps import apps
+
+from quotes.alignment import align_prices
+from quotes.models import Order
+from quotes.rebalancing import cash_left, solve
+
+TRADING_DAYS = 252
+
+
+@dataclass
+class Strategy:
+    """
+    Args:
+        weights: target weight of each object (by id), normalized
+        initial: amount invested on the first day
+        monthly: amount invested at the start of each month after the first
+        rebalance_months: months between two rebalancings to the weights, 0 to never sell
+    """
+    name: str
+    weights: dict[int, float]
+    initial: float = 0.
+    monthly: float = 0.
+    rebalance_months: int = 0
+    fixed_fee: float = 0.
+    fee_rate: float = 0.
+
+
+@dataclass
+class BacktestResult:
+    """
+    Args:
+        series: by date, columns value (positions), cash (not invested yet), invested (net amount spent on positions,
+            fees included), return and cumulative_return
+        orders: columns date, id_object, direction, nb_items, price, total_fee, as the orders of a portfolio
+        stats: see performance_stats
+    """
+    name: str
+    series: pd.DataFrame
+    orders: pd.DataFrame | None = None
+    stats: dict[str, float] = field(default_factory=dict)
+
+
+def buy(budgets: np.ndarray, prices: np.ndarray, fixed_fee: float, fee_rate: float) -> np.ndarray:
+    """
+    Whole shares bought with the budget of each object, fees included.
+    """
+    return np.floor(np.maximum(budgets - fixed_fee, 0.) / (prices * (1 + fee_rate)))
+
+
+def backtest(strategy: Strategy, prices: pd.DataFrame) -> BacktestResult:
+    """
+    Replay a strategy over aligned prices (dates x object ids), from the first date all its objects are priced.
+    """
+    ids = list(strategy.weights)
+    values = prices[ids].to_numpy(dtype=float)
+    priced = ~np.isnan(values).any(axis=1)
+    dates, values = prices.index[priced], values[priced]
+    if len(dates) < 2:
+        raise ValueError(f"{strategy.name}: not enough common prices.")
+
+    weights = np.array([strategy.weights[id] for id in ids])
+    weights = weights / weights.sum()
+
+    # Orders on the first trading day of each month
+    months = pd.DatetimeIndex(dates).to_period("M")
+    events = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+
+    # Cash not invested yet, split by object: what one could not buy is kept for it, and not spent on the others
+    holdings, budgets = np.zeros(len(ids)), np.zeros(len(ids))
+    positions = np.empty((len(events), len(ids)))
+    cash_after, spent = np.empty(len(events)), np.empty(len(events))
+    for k, row in enumerate(events):
+        p = values[row]
+        budgets += (strategy.initial if k == 0 else strategy.monthly) * weights
+        cash = budgets.sum()
+
+        if k and strategy.rebalance_months and k % strategy.rebalance_months == 0:
+            new = solve(holdings, p, weights, cash, strategy.fixed_fee, strategy.fee_rate)
+            left = float(cash_left(new, holdings, p, cash, strategy.fixed_fee, strategy.fee_rate))
+            budgets = left * weights
+        else:
+            bought = buy(budgets, p, strategy.fixed_fee, strategy.fee_rate)
+            budgets -= bought * p * (1 + strategy.fee_rate) + (bought > 0) * strategy.fixed_fee
+            new, left = holdings + bought, budgets.sum()
+
+        spent[k], holdings = cash - left, new
+        positions[k], cash_after[k] = holdings, left
+
+    # Holdings, cash and amount invested of each date: those after the last orders on or before it
+    last_event = np.searchsorted(events, np.arange(len(dates)), side="right") - 1
+    held = positions[last_event]
+    value = (held * values).sum(axis=1)
+
+    # Return of a day on the holdings of the day before
+    start_values = (held[:-1] * values[:-1]).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rets = np.where(start_values > 0, (held[:-1] * values[1:]).sum(axis=1) / start_values - 1, 0.)
+    rets = np.r_[0., rets]
+
+    series = pd.DataFrame({
+        "value": value,
+        "cash": cash_after[last_event],
+        "invested": np.cumsum(spent)[last_event],
+        "return": rets,
+        "cumulative_return": np.cumprod(1 + rets),
+    }, index=dates)
+
+    trades = np.diff(positions, axis=0, prepend=0)
+    event, obj = np.nonzero(trades)
+    nb_items, price = trades[event, obj], values[events][event, obj]
+    orders = pd.DataFrame({
+        "date": dates[events][event].date,
+        "id_object": np.array(ids)[obj],
+        "direction": np.where(nb_items > 0, Order.OrderDirection.BUY, Order.OrderDirection.SELL),
+        "nb_items": np.abs(nb_items).astype(int),
+        "price": price,
+        "total_fee": strategy.fixed_fee + np.abs(nb_items) * price * strategy.fee_rate,
+    })
+
+    stats = performance_stats(series["return"], series["cumulative_return"])
+    stats.update({
+        "value": value[-1],
+        "invested": series["invested"].iloc[-1],
+        "pnl": value[-1] - series["invested"].iloc[-1],
+        "fees": orders["total_fee"].sum(),
+    })
+    return BacktestResult(name=strategy.name, series=series, orders=orders, stats=stats)
+
+
+def performance_stats(rets: pd.Series, cumulative_return: pd.Series) -> dict[str, float]:
+    """
+    Time-weighted statistics of daily returns: total and annualized return, volatility, max drawdown and Sharpe ratio
+    (without risk-free rate).
+    """
+    years = (pd.Timestamp(cumulative_return.index[-1]) - pd.Timestamp(cumulative_return.index[0])).days / 365.25
+    total = cumulative_return.iloc[-1] / cumulative_return.iloc[0]
+    annualized = total ** (1 / years) - 1 if years > 0 else math.nan
+    volatility = rets.iloc[1:].std() * math.sqrt(TRADING_DAYS)
+    drawdown = (cumulative_return / cumulative_return.cummax() - 1).min()
+
+    return {
+        "total_return": total - 1,
+        "annualized_return": annualized,
+        "volatility": volatility,
+        "max_drawdown": drawdown,
+        "sharpe": annualized / volatility if volatility else math.nan,
+    }
+
+
+def stats_table(results: list[BacktestResult]) -> pd.DataFrame:
+    """
+    Statistics of several backtests (or portfolios), one row each.
+    """
+    return pd.DataFrame({result.name: result.stats for result in results}).T
+
+
+# Aligned price matrix of the sweep, set once in each worker process
+_prices: pd.DataFrame | None = None
+
+
+def init_worker(prices: pd.DataFrame):
+    global _prices
+    # Workers started with spawn (ex. macOS) import the models again
+    if not apps.ready:
+        django.setup()
+    _prices = prices
+
+
+def run_strategy(strategy: Strategy) -> BacktestResult | str:
+    """
+    Backtest of a strategy on the price matrix of the worker, or the error message.
+    """
+    try:
+        return backtest(strategy, _prices)
+    except Exception as e:
+        return f"{strategy.name}: {type(e).__name__}: {e}"
+
+
+def sweep(strategies: list[Strategy], prices: pd.DataFrame, workers: int = 1) -> tuple[list[BacktestResult], list[str]]:
+    """
+    Backtest many strategies on the same prices (dates x object ids), in worker processes if asked.
+    Returns the results and the errors, in the order of the strategies.
+    """
+    prices = align_prices(prices).prices
+    prices.index = pd.to_datetime(prices.index)
+
+    if workers > 1:
+        # Strategies are sent by chunks, to limit the round trips with the workers
+        chunksize = max(1, len(strategies) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(prices,)) as executor:
+            outcomes = list(executor.map(run_strategy, strategies, chunksize=chunksize))
+    else:
+        init_worker(prices)
+        outcomes = [run_strategy(strategy) for strategy in strategies]
+
+    results = [outcome for outcome in outcomes if isinstance(outcome, BacktestResult)]
+    errors = [outcome for outcome in outcomes if isinstance(outcome, str)]
+    return results, errors
@@ -0,0 +1,116 @@
+"""
+Small layer on top of Django's cache for expensive analytics results.
+
+Entries are keyed by a version token of the data they were computed from: writers only
+bump the token, and every dependent entry becomes unreachable at once.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable
+from uuid import uuid4
+
+from django.core.cache import cache
+
+MARKET_DATA_VERSION_KEY = "quotes:version:market-data"
+ORDERS_VERSION_KEY = "quotes:version:orders"
+CORPORATE_ACTIONS_VERSION_KEY = "quotes:version:corporate-actions"
+
+
+def new_version() -> str:
+    """
+    Unique version token, prefixed with its creation time in ms (see version_time).
+    """
+    return f"{time.time_ns() // 1_000_000:x}.{uuid4().hex}"
+
+
+def version_time(version: str) -> datetime | None:
+    """
+    When a version token was created, or None for tokens without a time.
+    """
+    timestamp, separator, _ = version.partition(".")
+    try:
+        return datetime.fromtimestamp(int(timestamp, 16) / 1000, tz=timezone.utc) if separator else None
+    except ValueError:
+        return None
+
+
+def get_version(key: str) -> str:
+    """
+    Current version token stored under key, created on first access.
+    """
+    version = cache.get(key)
+    if version is None:
+        # add() does not overwrite a token set concurrently by another process
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key: str) -> str:
+    """
+    Replace the version token stored under key, so that entries built on the previous one are stale.
+    """
+    version = new_version()
+    cache.set(key, version, None)
+    return version
+
+
+def get_market_data_version() -> str:
+    """
+    Version of the FinancialData table, bumped after each ingestion.
+    """
+    return get_version(MARKET_DATA_VERSION_KEY)
+
+
+def bump_market_data_version() -> str:
+    return bump_version(MARKET_DATA_VERSION_KEY)
+
+
+def get_orders_version() -> str:
+    """
+    Version of the Order table, bumped on each order change (see quotes.signals) and once per bulk import.
+    """
+    return get_version(ORDERS_VERSION_KEY)
+
+
+def bump_orders_version() -> str:
+    return bump_version(ORDERS_VERSION_KEY)
+
+
+def get_corporate_actions_version() -> str:
+    """
+    Version of the CorporateAction table, bumped on each change (see quotes.signals).
+    """
+    return get_version(CORPORATE_ACTIONS_VERSION_KEY)
+
+
+def bump_corporate_actions_version() -> str:
+    return bump_version(CORPORATE_ACTIONS_VERSION_KEY)
+
+
+def cache_key(name: str, params: tuple, versions: tuple[str, ...]) -> str:
+    """
+    Key of the result of name for params, computed from data at versions.
+    """
+    # repr() rather than hash(): str hashes are salted per process, and entries are shared between processes
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    return f"quotes:{name}:{':'.join(versions)}:{digest}"
+
+
+def get_or_compute(name: str, params: tuple, versions: tuple[str, ...], compute: Callable[[], Any]) -> Any:
+    """
+    Return the cached result of compute() for (name, params), computing and storing it on a miss.
+
+    Args:
+        name: namespace of the cached result (ex. "comparison")
+        params: parameters the result depends on, with a deterministic repr()
+        versions: version tokens of the data the result is computed from
+        compute: function without arguments computing the result
+    """
+    key = cache_key(name, params, versions)
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result)
+    return result
@@ -0,0 +1,110 @@
+"""
+Cash of a portfolio account, so that valuations include the money not invested.
+
+The cash ledger is built on the calendar of the portfolio with cumulative sums:
+- orders: sells bring their proceeds net of fees, buys cost their amount and fees
+- dividends: dividend per share on an ex-date times the number of shares held at the end of the day before
+- deposits and withdrawals (CashMovement), if any are recorded
+Buys not covered by the cash of the account are assumed funded by a deposit on their date: the cumulative
+implicit deposits are the running minimum of the cash balance, when it is negative.
+
+Deposits and withdrawals, explicit or implicit, are external flows: returns are time-weighted, i.e. computed on
+the value of the day before plus the flows of the day.
+"""
+import numpy as np
+import pandas as pd
+
+from quotes.alignment import AlignedPrices
+from quotes.models import Order
+
+CASH_COLUMNS = ["orders", "dividends", "deposits", "implicit", "cash", "external"]
+
+
+def calendar_positions(dates, flow_dates) -> np.ndarray:
+    """
+    Position in the calendar of the first date on or after each flow date (len(dates) after the last one).
+    """
+    return np.searchsorted(np.asarray(dates, dtype="datetime64[D]"), np.asarray(flow_dates, dtype="datetime64[D]"), side="left")
+
+
+def cash_ledger(dates, ledger: pd.DataFrame, holdings: pd.DataFrame, dividends: pd.DataFrame | None = None,
+                movements: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Cash flows and balance of a portfolio at the end of each date, columns CASH_COLUMNS.
+
+    Args:
+        dates: calendar of the portfolio
+        ledger: orders, with columns date, id_object, direction, nb_items, price, total_fee
+        holdings: number of items held (dates x object ids) at the end of each date
+        dividends: dividends per share (dates x object ids)
+        movements: deposits (positive) and withdrawals (negative), with columns date, amount
+    """
+    n = len(dates)
+
+    # Orders of dates after the end of the calendar are booked on its last date
+    amounts = ledger["nb_items"].to_numpy(dtype=float) * ledger["price"].to_numpy(dtype=float)
+    fees = ledger["total_fee"].to_numpy(dtype=float)
+    signed = np.where(ledger["direction"].to_numpy() == Order.OrderDirection.BUY, -amounts - fees, amounts - fees)
+    orders = np.bincount(np.minimum(calendar_positions(dates, ledger["date"]), n - 1), weights=signed, minlength=n)
+
+    income = np.zeros(n)
+    if dividends is not None and not dividends.empty:
+        paid = dividends.reindex(columns=holdings.columns).stack()
+        paid = paid[paid != 0]
+        rows = calendar_positions(dates, paid.index.get_level_values(0))
+        columns = holdings.columns.get_indexer(paid.index.get_level_values(1))
+        # Shares held at the end of the day before the ex-date
+        kept = (rows > 0) & (rows < n)
+        shares = holdings.to_numpy()[rows[kept] - 1, columns[kept]]
+        income = np.bincount(rows[kept], weights=paid.to_numpy()[kept] * shares, minlength=n)
+
+    deposits = np.zeros(n)
+    if movements is not None and not movements.empty:
+        rows = calendar_positions(dates, movements["date"])
+        deposits = np.bincount(rows[rows < n], weights=movements["amount"].to_numpy(dtype=float)[rows < n], minlength=n)
+
+    balance = np.cumsum(orders + income + deposits)
+    implicit_total = np.maximum(0., -np.minimum.accumulate(balance))
+    implicit = np.diff(implicit_total, prepend=0.)
+
+    return pd.DataFrame({
+        "orders": orders,
+        "dividends": income,
+        "deposits": deposits,
+        "implicit": implicit,
+        "cash": balance + implicit_total,
+        "external": deposits + implicit,
+    }, index=dates)
+
+
+def value_series(holdings: np.ndarray, aligned: AlignedPrices, cash: np.ndarray,
+                 external: np.ndarray) -> tuple[pd.Series, pd.Series, pd.Series, pd.Series, pd.Series]:
+    """
+    Value (positions and cash), return, cumulative return, cash balance and cumulative net external flows series,
+    on the dates of aligned prices: value minus external flows is the pnl.
+
+    Args:
+        holdings: number of items held (dates x instruments of the aligned prices) at the end of each date
+        cash: cash balance at the end of each date
+        external: deposits and withdrawals of each date
+    """
+    prices = aligned.prices.to_numpy()
+    held = holdings != 0
+
+    # Valued dates: one of the objects held is quoted (or none is held), and all have a price
+    valued = ((held & ~aligned.gaps.to_numpy()).any(axis=1) | ~held.any(axis=1)) & ~(held & aligned.stale.to_numpy()).any(axis=1)
+    rows = np.flatnonzero(valued)
+    value = (holdings[rows] * np.where(held, prices, 0.)[rows]).sum(axis=1) + cash[rows]
+
+    # Time-weighted return from a valued date to the next one: flows in between are not returns
+    flows = np.cumsum(external)[rows]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rets = (value[1:] - np.diff(flows)) / value[:-1] - 1
+    rets = np.nan_to_num(rets, nan=0., posinf=0., neginf=0.)
+
+    dates = aligned.prices.index[rows]
+    ts_val = pd.Series(value, index=dates)
+    ts_ret = pd.Series(rets, index=dates[1:])
+    ts_cumul_ret = pd.Series(np.cumprod(np.r_[1., 1 + rets]), index=dates)
+    return ts_val, ts_ret, ts_cumul_ret, pd.Series(cash[rows], index=dates), pd.Series(flows, index=dates)
+
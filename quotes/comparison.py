@@ -0,0 +1,125 @@
+"""
+Instrument comparison engine behind the Comparisons Dash app.
+
+All statistics are computed from a single (dates x instruments) price matrix with NumPy, and
+results are cached per (instrument set, benchmark, window) until the next market data ingestion.
+"""
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from quotes.alignment import align_prices
+from quotes.cache import get_market_data_version, get_or_compute
+from quotes.models import FinancialObject, YahooFinanceQuery
+
+
+@dataclass
+class InstrumentComparison:
+    """
+    Result of the comparison of several instruments over a time frame.
+
+    Args:
+        rebased: (dates x names) prices rebased to 100 on the first common date
+        correlation: (names x names) correlation matrix of daily returns
+        rolling_correlation: (dates x names) rolling correlation of daily returns with the benchmark
+        rolling_beta: (dates x names) rolling beta of daily returns against the benchmark
+    """
+    rebased: pd.DataFrame
+    correlation: pd.DataFrame
+    rolling_correlation: pd.DataFrame
+    rolling_beta: pd.DataFrame
+
+
+def correlation_matrix(rets: np.ndarray) -> np.ndarray:
+    """
+    Correlation matrix of the columns of a (dates x instruments) array of returns, with a single matrix product.
+    """
+    centered = rets - rets.mean(axis=0)
+    cov = centered.T @ centered / (rets.shape[0] - 1)
+    std = np.sqrt(np.diag(cov))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return cov / np.outer(std, std)
+
+
+def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Sums over a rolling window along the first axis, from cumulative sums.
+    Row i is the sum of rows i to i + window - 1.
+    """
+    cumsum = np.cumsum(values, axis=0)
+    cumsum = np.concatenate([np.zeros((1,) + values.shape[1:]), cumsum], axis=0)
+    return cumsum[window:] - cumsum[:-window]
+
+
+def rolling_correlation_and_beta(rets: np.ndarray, benchmark: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rolling correlation and beta of every column of rets against the benchmark returns.
+    Returns two (dates - window + 1 x instruments) arrays.
+    """
+    # Centering does not change covariances but keeps the cumulative sums small
+    x = (benchmark - benchmark.mean())[:, None]
+    y = rets - rets.mean(axis=0)
+
+    sum_x, sum_y = rolling_sum(x, window), rolling_sum(y, window)
+    sum_xx, sum_yy, sum_xy = rolling_sum(x * x, window), rolling_sum(y * y, window), rolling_sum(x * y, window)
+
+    cov = (sum_xy - sum_x * sum_y / window) / (window - 1)
+    var_x = (sum_xx - sum_x ** 2 / window) / (window - 1)
+    var_y = (sum_yy - sum_y ** 2 / window) / (window - 1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return cov / np.sqrt(var_x * var_y), cov / var_x
+
+
+def compare_instruments(ids: list[int], benchmark_id: int, from_date: date, until_date: date,
+                        window: int = 60) -> InstrumentComparison:
+    """
+    Compare instruments over a time frame, cached until the next market data update.
+
+    Args:
+        ids: ids of the FinancialObjects to compare
+        benchmark_id: id of the FinancialObject used for rolling correlations and betas
+        window: number of daily returns in the rolling window
+    """
+    ids = sorted(set(ids) | {benchmark_id})
+    params = (tuple(ids), benchmark_id, str(from_date), str(until_date), window)
+
+    return get_or_compute("comparison", params, (get_market_data_version(),),
+                          lambda: _compare_instruments(ids, benchmark_id, from_date, until_date, window))
+
+
+def _compare_instruments(ids: list[int], benchmark_id: int, from_date: date, until_date: date,
+                         window: int) -> InstrumentComparison:
+    fin_objs = list(FinancialObject.objects.filter(id__in=ids).order_by("id"))
+    names = [obj.name for obj in fin_objs]
+
+    prices = YahooFinanceQuery.get_price_matrix(fin_objs, from_date, until_date)
+
+    # Carry last quotes over days one exchange is closed, then keep the period common to all instruments
+    aligned = align_prices(prices)
+    prices = aligned.prices[aligned.priced()]
+    dates = pd.to_datetime(prices.index)
+    values = prices.to_numpy()
+
+    if values.shape[0] < 3:
+        raise ValueError(f"Not enough common data between {from_date} and {until_date} to compare {', '.join(names)}.")
+
+    rets = values[1:] / values[:-1] - 1
+    corr = correlation_matrix(rets)
+
+    window = max(2, min(window, rets.shape[0]))
+    benchmark = rets[:, [obj.id for obj in fin_objs].index(benchmark_id)]
+    rolling_corr, rolling_beta = rolling_correlation_and_beta(rets, benchmark, window)
+
+    # A rolling value is dated on the last return of its window
+    rolling_dates = dates[window:]
+
+    return InstrumentComparison(
+        rebased=pd.DataFrame(values / values[0] * 100, index=dates, columns=names),
+        correlation=pd.DataFrame(corr, index=names, columns=names),
+        rolling_correlation=pd.DataFrame(rolling_corr, index=rolling_dates, columns=names),
+        rolling_beta=pd.DataFrame(rolling_beta, index=rolling_dates, columns=names),
+    )
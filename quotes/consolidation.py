@@ -0,0 +1,161 @@
+"""
+Consolidated views of the portfolios of each owner, and of all owners (the household).
+
+All orders are read at once, with the prices of every instrument ever held in a single matrix. The holdings
+matrix (dates x instruments) and cash ledger (see quotes.cash) of each portfolio are computed once and added to
+those of its owner and of the household: value and return series of a group are then array operations on its
+summed holdings and cash, as in Portfolio.compute_TS.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+
+from quotes.alignment import AlignedPrices, align_prices
+from quotes.analytics import get_series_versions, to_series_frame
+from quotes.cache import cache_key, get_or_compute
+from quotes.cash import calendar_positions, cash_ledger, value_series
+from quotes.corporate_actions import get_adjustment_factors
+from quotes.models import AccountOwner, CashMovement, FinancialData, FinancialObject, Order, Portfolio, YahooFinanceQuery
+
+CONSOLIDATION = "consolidation"
+
+
+@dataclass
+class ConsolidatedView:
+    """
+    Args:
+        series: by date, columns value, return and cumulative_return (as portfolio series)
+        inventory: by object id, columns Name, Number, Price, Value, Weight
+    """
+    name: str
+    portfolio_ids: list[int]
+    series: pd.DataFrame
+    inventory: pd.DataFrame
+
+
+@dataclass
+class Consolidation:
+    """
+    Args:
+        owners: view of the portfolios of each owner, by owner id
+    """
+    owners: dict[int, ConsolidatedView]
+    household: ConsolidatedView
+
+
+def consolidated_inventory(holdings: np.ndarray, aligned: AlignedPrices, names: dict[int, str]) -> pd.DataFrame:
+    """
+    Positions at the end of the last date, valued at the last prices.
+    """
+    last, prices = holdings[-1], aligned.prices.ffill().iloc[-1].to_numpy()
+    columns = np.flatnonzero(last)
+    ids = aligned.prices.columns[columns]
+
+    inventory = pd.DataFrame({
+        "Name": [names.get(id, str(id)) for id in ids],
+        "Number": last[columns],
+        "Price": prices[columns],
+    }, index=ids)
+    inventory["Value"] = inventory["Number"] * inventory["Price"]
+    inventory["Weight"] = inventory["Value"] / inventory["Value"].sum()
+    return inventory.sort_values("Value", ascending=False)
+
+
+def compute_consolidation(ledgers: pd.DataFrame, prices: pd.DataFrame, owners: dict[int, tuple[int, str]],
+                          names: dict[int, str], dividends: pd.DataFrame | None = None,
+                          movements: pd.DataFrame | None = None) -> Consolidation:
+    """
+    Consolidated views without database access.
+
+    Args:
+        ledgers: orders of all portfolios in current units, with columns portfolio, date, id_object, direction,
+            nb_items, price, total_fee
+        prices: NAV (dates x object ids) of all objects of the ledgers, from the first order date
+        owners: (owner id, owner name) of each portfolio, by portfolio id
+        names: name of each object, by id
+        dividends: dividends per share (dates x object ids) of all objects of the ledgers
+        movements: deposits and withdrawals of all portfolios, with columns portfolio, date, amount
+    """
+    aligned = align_prices(prices)
+    dates = aligned.prices.index
+
+    # Summed holdings, cash balance and external flows of each group, and position of its first order
+    groups: dict[int | None, list] = {}
+    portfolio_ids: dict[int, list[int]] = {}
+    for portfolio_id, ledger in ledgers.groupby("portfolio"):
+        holdings = Portfolio.compute_holdings(ledger, dates).reindex(columns=aligned.prices.columns, fill_value=0)
+        portfolio_movements = None if movements is None else movements[movements["portfolio"] == portfolio_id]
+        cash = cash_ledger(dates, ledger, holdings, dividends, portfolio_movements)
+        first = int(calendar_positions(dates, [ledger["date"].min()])[0])
+
+        owner_id = owners[portfolio_id][0]
+        portfolio_ids.setdefault(owner_id, []).append(int(portfolio_id))
+        for key in (owner_id, None):
+            if key in groups:
+                group = groups[key]
+                group[0] += holdings.to_numpy()
+                group[1] += cash["cash"].to_numpy()
+                group[2] += cash["external"].to_numpy()
+                group[3] = min(group[3], first)
+            else:
+                groups[key] = [holdings.to_numpy().copy(), cash["cash"].to_numpy().copy(),
+                               cash["external"].to_numpy().copy(), first]
+
+    def view(name: str, ids: list[int], holdings: np.ndarray, cash: np.ndarray, external: np.ndarray, first: int) -> ConsolidatedView:
+        # From the first order of the group
+        group_aligned = AlignedPrices(aligned.prices.iloc[first:], aligned.gaps.iloc[first:], aligned.stale.iloc[first:])
+        series = to_series_frame(*value_series(holdings[first:], group_aligned, cash[first:], external[first:]))
+        return ConsolidatedView(name=name, portfolio_ids=ids, series=series,
+                                inventory=consolidated_inventory(holdings, aligned, names))
+
+    owner_names = dict(owners.values())
+    return Consolidation(
+        owners={owner_id: view(owner_names[owner_id], portfolio_ids[owner_id], *groups[owner_id]) for owner_id in portfolio_ids},
+        household=view("All owners", [id for ids in portfolio_ids.values() for id in ids], *groups[None]),
+    )
+
+
+def load_consolidation() -> Consolidation:
+    """
+    Consolidated views from the database: one query for the orders, and one matrix of prices and of dividends.
+    """
+    columns = ["portfolio", "date", "id_object", "direction", "nb_items", "price", "total_fee"]
+    ledgers = pd.DataFrame(list(Order.objects.order_by("date").values(*columns)), columns=columns)
+    if ledgers.empty:
+        raise ValueError("No orders to consolidate.")
+    ledgers = get_adjustment_factors().adjust_ledger(ledgers)
+
+    fin_objs = list(FinancialObject.objects.filter(id__in=ledgers["id_object"].unique().tolist()))
+    prices = YahooFinanceQuery.get_price_matrix(fin_objs, ledgers["date"].min(), datetime.today().date())
+    dividends = YahooFinanceQuery.get_price_matrix(fin_objs, ledgers["date"].min(), datetime.today().date(),
+                                                   FinancialData.TimeSeriesField.Dividends)
+    return compute_consolidation(ledgers, prices, get_owners(), {obj.id: obj.name for obj in fin_objs}, dividends,
+                                 CashMovement.signed_amounts(CashMovement.objects.all()))
+
+
+def get_owners() -> dict[int, tuple[int, str]]:
+    """
+    (owner id, owner name) of each portfolio, by portfolio id.
+    """
+    return {id: (owner_id, name) for id, owner_id, name in Portfolio.objects.values_list("id", "owner", "owner__name")}
+
+
+def get_consolidation() -> Consolidation:
+    """
+    Consolidated views, computed on first use after each market data or orders update.
+    """
+    return get_or_compute(CONSOLIDATION, (), get_series_versions(), load_consolidation)
+
+
+def set_consolidation(consolidation: Consolidation, versions: tuple[str, str]) -> None:
+    cache.set(cache_key(CONSOLIDATION, (), versions), consolidation)
+
+
+def get_owner_view(owner: AccountOwner) -> ConsolidatedView | None:
+    """
+    View of the portfolios of an owner, None if they have no orders.
+    """
+    return get_consolidation().owners.get(owner.id)
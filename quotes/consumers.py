@@ -0,0 +1,36 @@
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from quotes import live
+from quotes.models import Portfolio
+
+
+class PortfolioValuationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Sends the valuation of a portfolio on connection, then each time market data is updated.
+    """
+
+    async def connect(self):
+        self.portfolio_id = self.scope["url_route"]["kwargs"]["pk"]
+        if not await sync_to_async(Portfolio.objects.filter(id=self.portfolio_id).exists)():
+            await self.close()
+            return
+
+        await self.channel_layer.group_add(live.MARKET_DATA_GROUP, self.channel_name)
+        live.ensure_watcher()
+        await self.accept()
+        await self.send_valuation()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(live.MARKET_DATA_GROUP, self.channel_name)
+
+    async def market_data(self, event):
+        await self.send_valuation()
+
+    async def send_valuation(self):
+        try:
+            valuation = await sync_to_async(live.get_valuation)(self.portfolio_id)
+        except ValueError as e:
+            await self.send_json({"portfolio": self.portfolio_id, "error": str(e)})
+            return
+        await self.send_json(valuation)
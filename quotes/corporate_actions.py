@@ -0,0 +1,96 @@
+"""
+Adjustment of prices and order quantities for corporate actions (splits, reverse splits, ISIN changes).
+
+Stored data is never rewritten: values are brought to current units (after all recorded actions) when
+read. For each instrument with actions, the cumulative factor of a date is the product of the ratios of
+the actions after that date. Quantities are multiplied by it, prices and dividends per share divided.
+
+Factors are computed once per version of the CorporateAction table and kept in the cache.
+"""
+from dataclasses import dataclass, field
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from quotes.cache import get_corporate_actions_version, get_or_compute
+from quotes.models import CorporateAction
+
+
+@dataclass
+class AdjustmentFactors:
+    """
+    Args:
+        dates: dates of the actions of each instrument (by id), sorted
+        cumulative: for each instrument, cumulative[k] is the product of the ratios of actions k and later,
+            with a final 1 for dates after the last action
+    """
+    dates: dict[int, np.ndarray] = field(default_factory=dict)
+    cumulative: dict[int, np.ndarray] = field(default_factory=dict)
+
+    def factors(self, id_object: int, dates) -> np.ndarray:
+        """
+        Cumulative factors of an instrument on dates.
+        """
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        if id_object not in self.dates:
+            return np.ones(len(dates))
+        return self.cumulative[id_object][np.searchsorted(self.dates[id_object], dates, side="right")]
+
+    def factor(self, id_object: int, on: date) -> float:
+        return float(self.factors(id_object, [on])[0])
+
+    def adjust_matrix(self, matrix: pd.DataFrame, ids: list[int] | None = None) -> pd.DataFrame:
+        """
+        Bring a (dates x instruments) matrix of prices or dividends per share to current units.
+
+        Args:
+            ids: instrument ids of the columns (default: the column labels)
+        """
+        ids = list(matrix.columns) if ids is None else ids
+        adjusted = [i for i, id_object in enumerate(ids) if id_object in self.dates]
+        if not adjusted or matrix.empty:
+            return matrix
+
+        divisors = np.ones(matrix.shape)
+        for i in adjusted:
+            divisors[:, i] = self.factors(ids[i], matrix.index.to_numpy())
+        return matrix / divisors
+
+    def adjust_ledger(self, ledger: pd.DataFrame) -> pd.DataFrame:
+        """
+        Bring the quantities (and prices, if any) of a ledger with columns date, id_object, nb_items to current units.
+        """
+        if ledger.empty or not self.dates:
+            return ledger
+
+        factors = np.ones(len(ledger))
+        for id_object in ledger["id_object"].unique():
+            if id_object in self.dates:
+                mask = (ledger["id_object"] == id_object).to_numpy()
+                factors[mask] = self.factors(id_object, ledger["date"].to_numpy()[mask])
+
+        ledger = ledger.assign(nb_items=ledger["nb_items"] * factors)
+        if "price" in ledger:
+            ledger["price"] = ledger["price"] / factors
+        return ledger
+
+
+def compute_adjustment_factors() -> AdjustmentFactors:
+    actions = pd.DataFrame(list(CorporateAction.objects.order_by("id_object", "date").values_list("id_object", "date", "ratio")),
+                           columns=["id_object", "date", "ratio"])
+
+    factors = AdjustmentFactors()
+    for id_object, group in actions.groupby("id_object"):
+        ratios = group["ratio"].to_numpy(dtype=float)
+        factors.dates[int(id_object)] = group["date"].to_numpy().astype("datetime64[D]")
+        # Products of the ratios of each action and the later ones, then 1 after the last action
+        factors.cumulative[int(id_object)] = np.r_[np.cumprod(ratios[::-1])[::-1], 1.]
+    return factors
+
+
+def get_adjustment_factors() -> AdjustmentFactors:
+    """
+    Factors of all instruments, recomputed only after a corporate action is recorded, changed or deleted.
+    """
+    return get_or_compute("adjustment-factors", (), (get_corporate_actions_version(),), compute_adjustment_factors)
@@ -1,22 +1,41 @@
 import dash
-from dash import dcc, html
+from dash import ClientsideFunction, dcc, html
 import plotly.graph_objects as go
+from plotly.colors import DEFAULT_PLOTLY_COLORS
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
 
 from django_plotly_dash import DjangoDash
 from quotes.models import Portfolio, FinancialData
+from quotes.cache import get_market_data_version, get_orders_version
+from quotes.analytics import load_portfolio_series
+from quotes.consolidation import get_consolidation
 
 from datetime import date, datetime, timedelta
 import pandas as pd
 
 
-## import data (to be fixed with internal Django mechanics)
-portfolios = Portfolio.objects.all()
+# Portfolios with their time series, by market data and orders versions
+_portfolios: dict[tuple[str, str], list[Portfolio]] = {}
 
-for ptf in portfolios:
-    if ptf.ts_ret is None:
-        ptf.get_TS()
+def get_portfolios() -> list[Portfolio]:
+    """
+    All portfolios with their time series (see quotes.analytics), loaded on first use and again after each market data or orders update.
+    """
+    version = (get_market_data_version(), get_orders_version())
+
+    if version not in _portfolios:
+        portfolios = list(Portfolio.objects.select_related("owner"))
+        for ptf in portfolios:
+            load_portfolio_series(ptf)
+
+        _portfolios.clear()
+        _portfolios[version] = portfolios
+
+    return _portfolios[version]
+
+# Series of the last days are sent daily, older ones weekly
+DAILY_DAYS = 366
 
 user_colors = {
     "Guillaume": "darkorange",
@@ -24,8 +43,6 @@ user_colors = {
     "Maman": "darkred"
 }
 
-latest_date = FinancialData.get_price_most_recent_date()
-
 def timeframe_to_limit_date(time_frame: str) -> date:
     """
     From the button pressed (ex. 6m), return the associated start_date assuming the end_date is today.
@@ -48,9 +65,7 @@ def timeframe_to_limit_date(time_frame: str) -> date:
             return date(2000, 1, 1)
 
 
-def get_performance_table() -> dbc.Table:
-
-    global latest_date
+def get_performance_table(portfolios: list[Portfolio], latest_date: date) -> dbc.Table:
 
     columns = ["Portfolio", "1M", "3M", "6M", "YTD", "1Y"]
     header_style = {"background-color": "transparent", "color": "light-blue"}
@@ -78,6 +93,14 @@ def get_performance_table() -> dbc.Table:
     perfs = [
         [ptf.ts_cumul_ret[latest_date] / ptf.ts_cumul_ret[limit_date] -1 for limit_date in limit_dates] for ptf in portfolios]
     
+    # Consolidated rows: owners with several portfolios, then all owners
+    consolidation = get_consolidation()
+    views = [view for view in consolidation.owners.values() if len(view.portfolio_ids) > 1] + [consolidation.household]
+    for view in views:
+        cumul_ret = view.series["cumulative_return"].dropna()
+        row_headers.append(html.B(view.name if view is consolidation.household else f"{view.name} - All portfolios"))
+        perfs.append([cumul_ret.loc[:latest_date].iloc[-1] / cumul_ret.loc[:limit_date].iloc[-1] - 1 for limit_date in limit_dates])
+
     for row_header, perf_ptf in zip(row_headers, perfs):
         rows.append(
             html.Tr([
@@ -95,167 +118,35 @@ def get_performance_table() -> dbc.Table:
                      )
 
 
-# TO DO:
-# 5. Fill table with performance
-# 6. A few benchmarks should be available for charting: MSCI France, CAC40, DAX, SP500, Nasdaq100, MSCI World, MSCI China
-# 7. Background color could change between chart and table (cf. https://github.com/alfonsrv/crypto-tracker)
-
-app = DjangoDash('Dashboard', 
-                 external_stylesheets=["static/assets/buttons.css"]
-                 )   # replaces dash.Dash
-
-app.layout = html.Div(children=[
-    # DB 
-    dbc.Container([
-        
-        html.H1("Portfolio performance comparison", style={"color": "white"}),
-        html.Hr(),
-
-        html.P(f"Most recent nav from Yahoo Finance is {latest_date.strftime('%d/%m/%Y')}", className="lead", style={"color": "white"}),
-
-        html.Div([
-            # Price / Return mode
-            dbc.RadioItems(
-                id="radio-chart-mode", 
-                className="btn-group",
-                inputClassName="btn-check",
-                labelClassName="btn btn-outline-secondary",
-                labelCheckedClassName="active",
-                options=[
-                        {"label": "Prices", "value": "Prices"},
-                        {"label": "Returns", "value": "Returns"},
-                    ],
-                value="Returns",
-            )], className="radio-group"),
-
-            # Dates button (left) + DateRangePicker (right)
-            html.Div([
-                # Buttons for dates
-                html.Div([
-                    dbc.Button(id='btn-horizon-1m', children="1m", color="secondary"),
-                    dbc.Button(id='btn-horizon-3m', children="3m", color="secondary"),
-                    dbc.Button(id='btn-horizon-6m', children="6m", color="secondary"),
-                    dbc.Button(id='btn-horizon-ytd', children="YTD", color="secondary"),
-                    dbc.Button(id='btn-horizon-1y', children="1Y", color="secondary"),
-                    dbc.Button(id='btn-horizon-3y', children="3Y", color="secondary"),
-                    dbc.Button(id='btn-horizon-max', children="Max", color="secondary"),
-                ], style={"float": "left"}),
-
-                # DateRangePicker
-                html.Div([
-                    dmc.DatePicker(
-                        id="date-range-picker",
-                        minDate=date(2020, 5, 8),
-                        maxDate=datetime.now().date(),
-                        value=[datetime.now().date()+ timedelta(days=-5), datetime.now().date()],
-                        style={"width": 300, "right":0, "display": "inline-block"},
-                        styles={"color": 'white'}
-                    ),
-                ], style={"float": "right"}),
-                ], 
-                style={
-                    "display": "flex",
-                    "align-items": "flex-start",
-                    "justify-content": "space-between"
-                }
-            ),
-
-        # The Time Series chart
-        dcc.Graph(id='graph-ts', style={'height': '700px', 'width': '100%'}),
-        get_performance_table()
-    ], fluid=True)
-    ], className="bg-dark")
-
-
-
-##### CALLBACKS
-# Price/Return callback
-@app.callback(
-    dash.dependencies.Output('graph-ts', 'figure'),
-    dash.dependencies.Input('radio-chart-mode', 'value'),
-    dash.dependencies.Input('btn-horizon-1m', 'n_clicks'),
-    dash.dependencies.Input('btn-horizon-3m', 'n_clicks'),
-    dash.dependencies.Input('btn-horizon-6m', 'n_clicks'),
-    dash.dependencies.Input('btn-horizon-ytd', 'n_clicks'),
-    dash.dependencies.Input('btn-horizon-1y', 'n_clicks'),
-    dash.dependencies.Input('btn-horizon-3y', 'n_clicks'),
-    dash.dependencies.Input('btn-horizon-max', 'n_clicks'),
-    dash.dependencies.Input('date-range-picker', 'value')
-)
-def update_the_graph(chart_mode: str, btn_1m, btn_3m, btn_6m, btn_ytd, btn_1y, btn_3y, btn_max, date_range, callback_context):
+def owner_colors(portfolios: list[Portfolio]) -> dict[str, str]:
     """
-    Update the chart when either the buttons, or the daterangepicker is modified.
+    Color of each owner: from user_colors, or else the next color of the default palette.
     """
-    
-    last_modif = None
-
-    # Find the last item changed (either new time or new radio item)
-    if len(callback_context.triggered):
-        last_modif = callback_context.triggered[0]["prop_id"].split(".")[0]
+    colors, palette = {}, iter(DEFAULT_PLOTLY_COLORS * len(portfolios))
+    for ptf in portfolios:
+        if ptf.owner.name not in colors:
+            colors[ptf.owner.name] = user_colors.get(ptf.owner.name) or next(palette)
+    return colors
 
-    if last_modif is None:
-        # First callback: return right series on max time
-        time_frame = 'max'
 
-    elif last_modif in ["date-range-picker", "radio-chart-mode"]:
-        # Prices/returns modif or change of date
-        time_frame = "custom"
-    
-    else:
-        # Change was on time frame (buttons of second row pressed)
-        # Find requested time frame
-        time_frame = last_modif.split("-")[-1]
-
-    chart = get_traces(portfolios=portfolios,
-                       series_mode=chart_mode,
-                       time_frame=time_frame,
-                       custom_dates=date_range)
-
-    return chart
+def downsample(series: pd.DataFrame) -> pd.DataFrame:
+    """
+    Last row of each week before the last DAILY_DAYS days, every row after.
+    """
+    index = pd.to_datetime(series.index)
+    recent = index >= index[-1] - pd.Timedelta(days=DAILY_DAYS)
+    week_ends = ~pd.Series(index.to_period("W")).duplicated(keep="last").to_numpy()
+    return series[recent | week_ends]
 
 
-def get_traces(portfolios: list[Portfolio], series_mode: str, time_frame: str, custom_dates: list[datetime]) -> go.Figure:
+def chart_layout(series_mode: str) -> dict:
     """
-    Depending on the price/return series requested, provide the series to chart on the right time frame.
+    Layout of the chart in Prices or Returns mode.
     """
-    if not series_mode in ["Prices", "Returns"]:
-        raise Exception("Series_mode parameter is not right: either prices or returns.")
-    
-    ts_mode = "ts_val" if series_mode == "Prices" else "ts_cumul_ret"
-
-    # Get relevant series on the adequate time frame
-    if time_frame == "custom":
-        start, end = [datetime.strptime(date, "%Y-%m-%d") for date in custom_dates]
-        l_ts = [
-            getattr(ptf, ts_mode)[(start.date() <= getattr(ptf, ts_mode).index) & (getattr(ptf, ts_mode).index <= end.date())]
-            for ptf in portfolios]
-    
-    else:
-        limit_date = timeframe_to_limit_date(time_frame)
-        l_ts = [
-            getattr(ptf, ts_mode)[getattr(ptf, ts_mode).index >= limit_date]
-            for ptf in portfolios]
-
-    l_traces = []
-
-    for i, ts in enumerate(l_ts):
-        # All start from 0% is returns are requested, else the usual series of prices
-        chart = go.Scatter(
-            x=list(ts.index),
-            y=list(ts.values) if series_mode == "Prices" else list((ts/ts.iloc[0]).values -1),
-            name=portfolios[i].owner.name,
-            line = {"color": user_colors[portfolios[i].owner.name], "width": 4}
-        )
-        l_traces.append(chart)
-        
-    fig = go.Figure(data=l_traces)
-    
-    # Customize the charting options
-    if series_mode == "Returns":
-        fig.update_layout(yaxis={
+    layout = go.Layout(yaxis={
                             "side": "right", 
-                            "tickformat": ".0%", 
-                            "hoverformat": ".2%", 
+                            "tickformat": ".0%" if series_mode == "Returns" else ",.0f", 
+                            "hoverformat": ".2%" if series_mode == "Returns" else ",.0f", 
                             "gridwidth": 1, 
                             "zerolinecolor": "lightgray", 
                             "tickfont": {"color": "white", "size": 14}
@@ -276,58 +167,128 @@ def get_traces(portfolios: list[Portfolio], series_mode: str, time_frame: str, c
                             "xanchor": "right", 
                             "x":1, 
                             "font": {"size": 18, "color": "white"}
-                            }
-                        )
-        
-    elif series_mode == "Prices":
-        fig.update_layout(yaxis={
-                            "side": "right", 
-                            "tickformat": ",.0f", 
-                            "hoverformat": ",.0f", 
-                            "gridwidth": 1, 
-                            "zerolinecolor": "lightgray", 
-                            "tickfont": {"color": "white", "size": 14}
                             },
-                        xaxis={
-                            "dtick": "M1",
-                            "tickformat": "%b\n%Y",
-                            "hoverformat": "%d/%m/%Y",
-                            "ticklabelmode": "period",
-                            "showgrid": False, 
-                            "tickfont": {"color": "white"},
-                            "rangeslider": {"visible": True, "bgcolor": "darkgray"}
-                            },
-                        legend={
-                            "orientation": "h",
-                            "yanchor": "bottom",
-                            "y": 1.02, 
-                            "xanchor": "right", 
-                            "x":1, 
-                            "font": {"size": 18, "color": "white"}
-                            }
-                        )
+                        plot_bgcolor='rgba(0,0,0,0)',
+                        paper_bgcolor='rgba(0,0,0,0)')
+    return layout.to_plotly_json()
 
-    
-    fig.update_layout(plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)')
 
-    return fig
+def get_chart_data(portfolios: list[Portfolio]) -> dict:
+    """
+    Downsampled value and cumulative return series of all portfolios, and the chart layouts, sent once to the browser.
+    """
+    colors = owner_colors(portfolios)
+    traces = []
+    for ptf in portfolios:
+        series = downsample(pd.DataFrame({"value": ptf.ts_val, "cumulative_return": ptf.ts_cumul_ret}).dropna())
+        traces.append({
+            "name": ptf.owner.name,
+            "color": colors[ptf.owner.name],
+            "x": [day.isoformat() for day in series.index],
+            "value": series["value"].tolist(),
+            "cumulative_return": series["cumulative_return"].tolist(),
+        })
+    return {"traces": traces, "layouts": {mode: chart_layout(mode) for mode in ["Prices", "Returns"]}}
 
 
-@app.callback(
-    dash.dependencies.Output('date-range-picker', 'value'),
-    dash.dependencies.Input('graph-ts', 'figure'),
-    prevent_initial_call=True
-)
-def update_date_range_picker(fig: go.Figure):
+# TO DO:
+# 5. Fill table with performance
+# 6. A few benchmarks should be available for charting: MSCI France, CAC40, DAX, SP500, Nasdaq100, MSCI World, MSCI China
+# 7. Background color could change between chart and table (cf. https://github.com/alfonsrv/crypto-tracker)
+
+app = DjangoDash('Dashboard', 
+                 external_stylesheets=["static/assets/buttons.css"],
+                 external_scripts=["/static/assets/dashboard.js"]
+                 )   # replaces dash.Dash
+
+def serve_layout():
     """
-    Whenever the figure changes (i.e. whenever a button is pressed), adjust the values
-    in the date picker.
+    Layout built on page load, rather than when the module is imported.
     """
-    min_dates = [fig["data"][i]["x"][0] for i in range(0, len(fig["data"]))]
-    min_dates = [datetime.strptime(date, "%Y-%m-%d") for date in min_dates]
+    portfolios = get_portfolios()
+    latest_date = FinancialData.get_price_most_recent_date()
+
+    return html.Div(children=[
+        # DB 
+        dbc.Container([
+
+            html.H1("Portfolio performance comparison", style={"color": "white"}),
+            html.Hr(),
+
+            html.P(f"Most recent nav from Yahoo Finance is {latest_date.strftime('%d/%m/%Y')}", className="lead", style={"color": "white"}),
+
+            html.Div([
+                # Price / Return mode
+                dbc.RadioItems(
+                    id="radio-chart-mode", 
+                    className="btn-group",
+                    inputClassName="btn-check",
+                    labelClassName="btn btn-outline-secondary",
+                    labelCheckedClassName="active",
+                    options=[
+                            {"label": "Prices", "value": "Prices"},
+                            {"label": "Returns", "value": "Returns"},
+                        ],
+                    value="Returns",
+                )], className="radio-group"),
+
+                # Dates button (left) + DateRangePicker (right)
+                html.Div([
+                    # Buttons for dates
+                    html.Div([
+                        dbc.Button(id='btn-horizon-1m', children="1m", color="secondary"),
+                        dbc.Button(id='btn-horizon-3m', children="3m", color="secondary"),
+                        dbc.Button(id='btn-horizon-6m', children="6m", color="secondary"),
+                        dbc.Button(id='btn-horizon-ytd', children="YTD", color="secondary"),
+                        dbc.Button(id='btn-horizon-1y', children="1Y", color="secondary"),
+                        dbc.Button(id='btn-horizon-3y', children="3Y", color="secondary"),
+                        dbc.Button(id='btn-horizon-max', children="Max", color="secondary"),
+                    ], style={"float": "left"}),
+
+                    # DateRangePicker
+                    html.Div([
+                        dmc.DatePicker(
+                            id="date-range-picker",
+                            minDate=date(2020, 5, 8),
+                            maxDate=datetime.now().date(),
+                            value=[datetime.now().date()+ timedelta(days=-5), datetime.now().date()],
+                            style={"width": 300, "right":0, "display": "inline-block"},
+                            styles={"color": 'white'}
+                        ),
+                    ], style={"float": "right"}),
+                    ], 
+                    style={
+                        "display": "flex",
+                        "align-items": "flex-start",
+                        "justify-content": "space-between"
+                    }
+                ),
+
+            # The Time Series chart, drawn in the browser from the series of the store
+            dcc.Store(id='store-series', data=get_chart_data(portfolios)),
+            dcc.Graph(id='graph-ts', style={'height': '700px', 'width': '100%'}),
+            get_performance_table(portfolios, latest_date)
+        ], fluid=True)
+    ], className="bg-dark")
+
+app.layout = serve_layout
+
 
-    max_dates = [fig["data"][i]["x"][-1] for i in range(0, len(fig["data"]))]
-    max_dates = [datetime.strptime(date, "%Y-%m-%d") for date in max_dates]
 
-    return (min(min_dates).date(), max(max_dates).date())
\ No newline at end of file
+##### CALLBACKS
+# Horizons, date ranges and modes are charted in the browser from the store (see static/assets/dashboard.js)
+app.clientside_callback(
+    ClientsideFunction(namespace="dashboard", function_name="updateGraph"),
+    dash.dependencies.Output('graph-ts', 'figure'),
+    dash.dependencies.Output('date-range-picker', 'value'),
+    dash.dependencies.Input('radio-chart-mode', 'value'),
+    dash.dependencies.Input('btn-horizon-1m', 'n_clicks'),
+    dash.dependencies.Input('btn-horizon-3m', 'n_clicks'),
+    dash.dependencies.Input('btn-horizon-6m', 'n_clicks'),
+    dash.dependencies.Input('btn-horizon-ytd', 'n_clicks'),
+    dash.dependencies.Input('btn-horizon-1y', 'n_clicks'),
+    dash.dependencies.Input('btn-horizon-3y', 'n_clicks'),
+    dash.dependencies.Input('btn-horizon-max', 'n_clicks'),
+    dash.dependencies.Input('date-range-picker', 'value'),
+    dash.dependencies.State('store-series', 'data'),
+)
@@ -3,14 +3,24 @@ import pandas as pd
 import numpy as np
 import dash
 from dash import dcc, html, dash_table
+from dash.dash_table.Format import Format, Group, Scheme
 import plotly.express as px
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
 
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django_plotly_dash import DjangoDash
-from quotes.models import Portfolio, FinancialData, FinancialObject, Order
+from quotes.models import Portfolio, FinancialData, FinancialObject, Order, YahooFinanceQuery
+from quotes.profiling import profile_callback
+from quotes.analytics import load_portfolio_series, get_portfolio_weights, get_series_versions
+from quotes.cache import get_or_compute
+from quotes.jobs import runner, Job, JobStatus
+from quotes.dividends import PortfolioDividends, get_portfolio_dividends
+from quotes.lots import get_lot_book
+from quotes.projection import PERCENTILES, Projection, ProjectionMethod, project_portfolio
+from quotes.rebalancing import RebalancingPlan, rebalance
 
 from quotes.forms import OrderForm
 
@@ -180,55 +190,143 @@ def get_individual_returns(id_portfolio):
 
     contrib_graph = dcc.Graph(id='contrib-graph', style={"display": "none"})
 
-    return html.Div(children=[date_range, contrib_graph, div_id])
+    # Contributions are computed in a background job, polled until it finishes
+    contrib_progress = html.Div(id="contrib-progress", style={"color": "white"})
+    contrib_interval = dcc.Interval(id="contrib-interval", interval=500, disabled=True)
 
-def performance_overview(id_portfolio):
+    return html.Div(children=[date_range, contrib_progress, contrib_graph, contrib_interval, div_id])
+
+def get_projection(id_portfolio):
+    """
+    Inputs of the Monte Carlo projection of the portfolio value, and the graph of its percentile bands.
+    """
+    input_style = {"background-color": Colors.card_dark, "color": "white"}
+    method_options = [{"label": "Historical months (bootstrap)", "value": ProjectionMethod.BOOTSTRAP},
+                      {"label": "Normal returns", "value": ProjectionMethod.NORMAL}]
+
+    inputs = dbc.Row([
+        dbc.Col([dbc.Label("Years"), dcc.Input(id="projection-years", type="number", min=1, max=40, value=20, style=input_style)]),
+        dbc.Col([dbc.Label("Monthly contribution (€)"),
+                 dcc.Input(id="projection-contribution", type="number", min=0, value=0, debounce=True, style=input_style)]),
+        dbc.Col([dbc.Label("Returns"), dbc.RadioItems(id="projection-method", options=method_options, value=ProjectionMethod.BOOTSTRAP)]),
+    ], style={"color": "white"})
+
+    projection_graph = dcc.Graph(id="projection-graph", style={"display": "none"})
+
+    # The projection is computed in a background job, polled until it finishes
+    projection_progress = html.Div(id="projection-progress", style={"color": "white"})
+    projection_interval = dcc.Interval(id="projection-interval", interval=500, disabled=True)
+
+    return html.Div(children=[inputs, projection_progress, projection_graph, projection_interval])
+
+def get_rebalancing(id_portfolio):
+    """
+    Drift of the current weights from the target weights, weights over time, and the rebalancing solver.
+    """
+    ptf = Portfolio.objects.get(id=id_portfolio)
+    weights = get_portfolio_weights(ptf)
+    names = dict(FinancialObject.objects.filter(id__in=weights.columns).values_list("id", "name"))
+    weights = weights.rename(columns=names)
+    targets = {target.id_object.name: target.weight for target in ptf.target_weights.select_related("id_object")}
+
+    graphs = [dcc.Graph(figure=weights_figure(weights), style={"height": "400px"})]
+    if targets:
+        graphs.insert(0, dcc.Graph(figure=drift_figure(weights, targets), style={"height": "400px"}))
+    else:
+        graphs.insert(0, html.Div("No target weights: add them in the admin to see the drift and rebalance.", style={"color": "white"}))
+
+    input_style = {"background-color": Colors.card_dark, "color": "white"}
+    inputs = dbc.Row([
+        dbc.Col([dbc.Label("Cash to invest (€)"),
+                 dcc.Input(id="rebalancing-cash", type="number", min=0, value=0, debounce=True, style=input_style)]),
+        dbc.Col([dbc.Label("Fee per order (€)"),
+                 dcc.Input(id="rebalancing-fixed-fee", type="number", min=0, value=0, debounce=True, style=input_style)]),
+        dbc.Col([dbc.Label("Fee rate (%)"),
+                 dcc.Input(id="rebalancing-fee-rate", type="number", min=0, value=0, debounce=True, style=input_style)]),
+    ], style={"color": "white", "margin-top": "20px"})
+
+    # The plan is computed in a background job, polled until it finishes
+    rebalancing_progress = html.Div(id="rebalancing-progress", style={"color": "white"})
+    rebalancing_interval = dcc.Interval(id="rebalancing-interval", interval=500, disabled=True)
+    rebalancing_table = html.Div(id="rebalancing-table")
+
+    return html.Div(children=[*graphs, inputs, rebalancing_progress, rebalancing_table, rebalancing_interval])
+
+def get_dividends(id_portfolio):
+    """
+    Dividends received and projected by month, trailing 12 months dividends, and yields of each position.
+    """
+    try:
+        dividends = get_portfolio_dividends(Portfolio.objects.get(id=id_portfolio))
+    except ValueError as e:
+        return html.Div(str(e), style={"color": "white"})
+
+    totals = dividends.totals
+    summary = html.Div(f"Received: {totals['Received']:,.2f}€ - Last 12 months: {totals['TTM Income']:,.2f}€ - "
+                       f"Yield: {totals['TTM Yield']:.2%} - Yield on cost: {totals['Yield on Cost']:.2%} - "
+                       f"Next 12 months: {totals['Next 12M']:,.2f}€", style={"color": "white", "margin": "10px 0"})
+
+    return html.Div(children=[
+        summary,
+        dcc.Graph(figure=dividends_figure(dividends), style={"height": "400px"}),
+        dcc.Graph(figure=ttm_dividends_figure(dividends), style={"height": "400px"}),
+        dividends_table(dividends),
+    ])
+
+def compute_overview(id_portfolio) -> pd.DataFrame:
+    """
+    Positions of the portfolio with their value, PnL and weight, unformatted.
+    """
     ptf = Portfolio.objects.get(id=id_portfolio)
     latest_date = FinancialData.get_price_most_recent_date()
 
-    df = ptf.inventory_df()
+    inventory = ptf.get_inventory()
+    df = inventory.to_df()
     
     df["Amount Paid"] = df["PRU"] * df["Number"]
 
-    prices = [FinancialData.objects
-              .filter(id_object=id, field="NAV", origin="Yahoo Finance", date=latest_date)
-              .values_list("value", flat=True).first() for id in df["Id"].tolist()]
+    prices = YahooFinanceQuery.get_latest_prices(inventory.fin_objs, latest_date)
     
-    df["Current Value"] = np.multiply(df["Number"], np.array(prices))
+    df["Current Value"] = np.multiply(df["Number"], prices.to_numpy())
     df.sort_values(by="Current Value", ascending=False, inplace=True)
 
     df["+/- Value"] = df["Current Value"] - df["Amount Paid"]
+
+    # FIFO lots, kept in the cache and only reprocessed for the objects whose orders changed
+    positions = get_lot_book(ptf).positions(prices.set_axis(inventory.id_objects), latest_date)
+    df["Realized"] = df["Id"].map(positions["Realized"])
+    df["Unrealized"] = df["Id"].map(positions["Unrealized"])
+    df["Held (days)"] = df["Id"].map(positions["Holding Days"])
     
     df["Weight"] = df["Current Value"]/df["Current Value"].sum()
-    df["Weight"] = df["Weight"].map('{:,.1%}'.format)
-    
-    # Formatting
-    numeric_cols = ["PRU", "Amount Paid", "Current Value", "+/- Value"]
-    df[numeric_cols] = df[numeric_cols].map('{:,.2f}'.format)
-    del df["Id"]
+    return df.drop(columns="Id")
 
-    header_style = {"background-color": "#2d2d2d", "color": "white"}
-    row_style = {"color": "white", "background-color": "#2d2d2d"}
-    
-    table_header = [
-        html.Thead(html.Tr([html.Th(col, style=header_style) for col in df.columns]))
-    ]
-    
-    rows = []
-    for item in df.to_dict(orient="records"):
-        rows.append(
-            html.Tr([html.Td(item[col], style=row_style) for col in df.columns])
+# Number formats of the overview columns, applied by the browser
+MONEY = Format(precision=2, scheme=Scheme.fixed, group=Group.yes)
+OVERVIEW_FORMATS = {
+    "Number": Format(precision=0, scheme=Scheme.fixed, group=Group.yes),
+    "PRU": MONEY, "Amount Paid": MONEY, "Current Value": MONEY, "+/- Value": MONEY, "Realized": MONEY, "Unrealized": MONEY,
+    "Held (days)": Format(precision=0, scheme=Scheme.fixed, group=Group.yes),
+    "Weight": Format(precision=1, scheme=Scheme.percentage),
+}
+
+def performance_overview(id_portfolio):
+    """
+    Table of the positions. Numbers are computed once per market data or orders update, and only sent as records.
+    """
+    df = get_or_compute("overview", (str(id_portfolio),), get_series_versions(), lambda: compute_overview(id_portfolio))
+
+    columns = [{"name": col, "id": col, "type": "numeric", "format": OVERVIEW_FORMATS[col]} if col in OVERVIEW_FORMATS
+               else {"name": col, "id": col} for col in df.columns]
+    return dash_table.DataTable(
+        data=df.to_dict("records"),
+        columns=columns,
+        id="tb",
+        style_as_list_view=True,
+        style_header={"backgroundColor": Colors.card_dark, "color": "white", "fontWeight": "bold"},
+        style_data={"backgroundColor": Colors.card_dark, "color": "white"},
+        style_cell={"textAlign": "center", "border": "none"},
         )
-    table_body = [html.Tbody(rows)]
-    table = dbc.Table(table_header + table_body, 
-                      hover=True, 
-                      color="dark",
-                      style={"text-align": "center", "border": "none"},
-                      id="tb",
-                      className="custom-table"
-                     )
-    
-    return table
 
 app = DjangoDash('Portfolio', 
                  add_bootstrap_links=True,
@@ -264,6 +362,8 @@ app.layout = html.Div(children=
                 ], class_name="card-darken"),
             ),
         ], id="row-card-override"),
+        # Polls the background job computing the cards, until it finishes
+        dcc.Interval(id="cards-interval", interval=500, disabled=False),
 
         # Card with various tabs: Overview and Order History
         dbc.Card([
@@ -271,6 +371,9 @@ app.layout = html.Div(children=
                 dbc.Tabs([
                     dbc.Tab(label="Overview", tab_id="overview"),
                     dbc.Tab(label="Order History", tab_id="orders"),
+                    dbc.Tab(label="Projection", tab_id="projection"),
+                    dbc.Tab(label="Rebalancing", tab_id="rebalancing"),
+                    dbc.Tab(label="Dividends", tab_id="dividends"),
                     #dbc.Tab(label="Constituent Analysis", tab_id="constituent"),
                 ], 
                 id="tabs", 
@@ -279,7 +382,9 @@ app.layout = html.Div(children=
                         "font-weight": "bold", "color": "darkgray"}
                 ),
             ),
-            dbc.CardBody(id="order_details")
+            # The overview stays mounted, hidden on other tabs, and is only sent again when its data changes
+            dbc.CardBody([html.Div(id="overview-body"), html.Div(id="order_details")]),
+            dcc.Store(id="overview-versions"),
             ], 
             id="card-tabs", 
             style={"border-radius": "15px", "background-color": "#2d2d2d"}
@@ -363,23 +468,53 @@ app.layout = html.Div(children=
 
 
 ## Callbacks
+@app.callback(
+    dash.dependencies.Output('overview-body', 'children'),
+    dash.dependencies.Output('overview-versions', 'data'),
+    dash.dependencies.Input('tabs', 'active_tab'),
+    dash.dependencies.State('pk', 'title'),
+    dash.dependencies.State('overview-versions', 'data')
+)
+@profile_callback
+def update_overview(active_tab, pk, shown_versions):
+    """
+    Render the overview when its tab is shown, unless the one already mounted is of the same data versions.
+    """
+    versions = [pk, *get_series_versions()]
+    if active_tab != "overview" or versions == shown_versions:
+        return dash.no_update, dash.no_update
+    return performance_overview(pk), versions
+
 @app.callback(
     dash.dependencies.Output('order_details', 'children'),
+    dash.dependencies.Output('overview-body', 'style'),
     dash.dependencies.Input('tabs', 'active_tab'),
     dash.dependencies.State('pk', 'title')
 )
+@profile_callback
 def display_tab_in_cardbody(active_tab, pk):
     """
-    Display the content of the active tab in the card body.
+    Display the content of the active tab in the card body, or show the mounted overview.
     """
     if active_tab == "overview":
-        return performance_overview(pk)
+        return [], {"display": "block"}
     
     elif active_tab == "orders":
-        return get_order_card_body(pk)
+        content = get_order_card_body(pk)
     
     elif active_tab == "constituent":
-        return get_individual_returns(pk)
+        content = get_individual_returns(pk)
+
+    elif active_tab == "projection":
+        content = get_projection(pk)
+
+    elif active_tab == "rebalancing":
+        content = get_rebalancing(pk)
+
+    elif active_tab == "dividends":
+        content = get_dividends(pk)
+
+    return content, {"display": "none"}
 
 @app.callback(
     dash.dependencies.Output("modal", "is_open"),
@@ -387,6 +522,7 @@ def display_tab_in_cardbody(active_tab, pk):
      dash.dependencies.Input("btn-close-modal", "n_clicks")],
     [dash.dependencies.State("modal", "is_open")],
 )
+@profile_callback
 def toggle_modal(n1, n2, is_open):
     """
     Toggle modal with the button to add a new order.
@@ -407,6 +543,7 @@ def toggle_modal(n1, n2, is_open):
      dash.dependencies.Input('total_fee', 'value'),
      dash.dependencies.Input('submit-btn', 'n_clicks')]
 )
+@profile_callback
 def submit_form(portfolio_id, id_object_id, date, direction, nb_items, price, total_fee, n_clicks):
     """
     Callback to submit a new order in the Orders tab.
@@ -430,77 +567,336 @@ def submit_form(portfolio_id, id_object_id, date, direction, nb_items, price, to
         if form.is_valid():
             form.save()
 
+def job_progress(job: Job) -> str:
+    return f"{job.message or 'Computing'}... {job.progress:.0%}"
+
+
+def contributions_figure(contributions: pd.DataFrame) -> go.Figure:
+    # Create a figure from the contributions
+    figure = go.Figure(
+        data=[go.Bar(x=contributions["Total"], y=contributions.index, orientation="h")]
+        )
+
+    figure.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font={"color": "white", "size": 14},
+        xaxis={
+            "title": "weights",
+            "categoryorder": "category ascending",
+            "tickformat": ".0%", 
+            "hoverformat": ".1%",
+        },
+        
+        yaxis={
+            "title": "Instrument",
+        },
+
+        showlegend=False
+        )
+    return figure
+
+
+def compute_contributions(id_portfolio, start_date, end_date) -> pd.DataFrame:
+    return Portfolio.objects.get(id=id_portfolio).get_individual_returns(start_date, end_date)
+
+
 @app.callback(
     dash.dependencies.Output('contrib-graph', 'figure'),
     dash.dependencies.Output('contrib-graph', 'style'),
+    dash.dependencies.Output('contrib-interval', 'disabled'),
+    dash.dependencies.Output('contrib-progress', 'children'),
     dash.dependencies.Input('indiv-ret-start-date', 'value'),
     dash.dependencies.Input('indiv-ret-end-date', 'value'),
+    dash.dependencies.Input('contrib-interval', 'n_intervals'),
     dash.dependencies.State('ptf', 'title')
 )
-def update_graph(start_date, end_date, id_portfolio):
+@profile_callback
+def update_graph(start_date, end_date, n_intervals, id_portfolio):
+    """
+    Submit the computation of contributions on date changes, then poll it. Identical submissions share the same job.
+    """
     if start_date and end_date:
-        ptf = Portfolio.objects.get(id=id_portfolio)
-        contributions = ptf.get_individual_returns(start_date, end_date)
-
-        # Create a figure from the contributions
-        figure = go.Figure(
-            data=[go.Bar(x=contributions["Total"], y=contributions.index, orientation="h")]
-            )
-
-        figure.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font={"color": "white", "size": 14},
-            xaxis={
-                "title": "weights",
-                "categoryorder": "category ascending",
-                "tickformat": ".0%", 
-                "hoverformat": ".1%",
-            },
-            
-            yaxis={
-                "title": "Instrument",
-            },
-
-            showlegend=False
-            )
-        
-        return figure, {"display": "block"}
-    return go.Figure(data=[]), {"display": "none"}
+        job = runner.submit("contributions", (id_portfolio, start_date, end_date), get_series_versions(),
+                            compute_contributions, id_portfolio, start_date, end_date)
+
+        if not job.finished:
+            return dash.no_update, dash.no_update, False, job_progress(job)
+        if job.status == JobStatus.FAILED:
+            return go.Figure(data=[]), {"display": "none"}, True, f"Contributions could not be computed ({job.error})"
+
+        return contributions_figure(job.result), {"display": "block"}, True, ""
+    return go.Figure(data=[]), {"display": "none"}, True, ""
+
+
+def projection_figure(projection: Projection) -> go.Figure:
+    """
+    Percentile bands of the projected value (5-95 and 25-75), median and amount invested, by year.
+    """
+    years = projection.bands.index / 12
+    bands = projection.bands
+    low, high = PERCENTILES[0], PERCENTILES[-1]
+    q1, median, q3 = PERCENTILES[1], PERCENTILES[len(PERCENTILES) // 2], PERCENTILES[-2]
+
+    figure = go.Figure(data=[
+        go.Scatter(x=years, y=bands[high], line={"width": 0}, showlegend=False, hoverinfo="skip"),
+        go.Scatter(x=years, y=bands[low], fill="tonexty", fillcolor="rgba(99, 110, 250, 0.2)", line={"width": 0},
+                   name=f"{low}-{high}th percentiles"),
+        go.Scatter(x=years, y=bands[q3], line={"width": 0}, showlegend=False, hoverinfo="skip"),
+        go.Scatter(x=years, y=bands[q1], fill="tonexty", fillcolor="rgba(99, 110, 250, 0.4)", line={"width": 0},
+                   name=f"{q1}-{q3}th percentiles"),
+        go.Scatter(x=years, y=bands[median], line={"color": "white"}, name="Median"),
+        go.Scatter(x=years, y=projection.invested, line={"color": "darkgray", "dash": "dash"}, name="Invested"),
+    ])
+
+    figure.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font={"color": "white", "size": 14},
+        xaxis={"title": "Years"},
+        yaxis={"title": "Value", "tickformat": ",.0f", "ticksuffix": "€"},
+        hovermode="x unified",
+        title=f"{projection.n_paths:,} simulated paths",
+        )
+    return figure
+
+
+def compute_projection(id_portfolio, years, contribution, method) -> Projection:
+    return project_portfolio(Portfolio.objects.get(id=id_portfolio), years=years, contribution=contribution, method=method,
+                             seed=0, workers=settings.PROJECTION_WORKERS)
 
 
 @app.callback(
-    dash.dependencies.Output('card-ptf-value', 'children'),
-    dash.dependencies.Output('card-ptf-pnl', 'children'),
-    dash.dependencies.Output('card-last-updated', 'children'),
-    dash.dependencies.Input('pk', 'title'),
+    dash.dependencies.Output('projection-graph', 'figure'),
+    dash.dependencies.Output('projection-graph', 'style'),
+    dash.dependencies.Output('projection-interval', 'disabled'),
+    dash.dependencies.Output('projection-progress', 'children'),
+    dash.dependencies.Input('projection-years', 'value'),
+    dash.dependencies.Input('projection-contribution', 'value'),
+    dash.dependencies.Input('projection-method', 'value'),
+    dash.dependencies.Input('projection-interval', 'n_intervals'),
+    dash.dependencies.State('pk', 'title')
 )
-def update_cards(id_portfolio: int):
+@profile_callback
+def update_projection(years, contribution, method, n_intervals, id_portfolio):
     """
-    Callback to update the 3 cards with the portfolio value, pnl and last updated date at the
-    top of the page.
+    Submit the projection on input changes, then poll it. The seed is fixed, so identical inputs share the same job.
+    """
+    if not years:
+        return go.Figure(data=[]), {"display": "none"}, True, ""
+
+    job = runner.submit("projection", (id_portfolio, int(years), float(contribution or 0), method), get_series_versions(),
+                        compute_projection, id_portfolio, int(years), float(contribution or 0), method)
+
+    if not job.finished:
+        return dash.no_update, dash.no_update, False, job_progress(job)
+    if job.status == JobStatus.FAILED:
+        return go.Figure(data=[]), {"display": "none"}, True, f"Projection could not be computed ({job.error})"
+
+    return projection_figure(job.result), {"display": "block", "height": "450px"}, True, ""
+
+
+def drift_figure(weights: pd.DataFrame, targets: dict[str, float]) -> go.Figure:
+    """
+    Deviation of the current weight of each object (by name) from its target.
+    """
+    current = weights.iloc[-1].dropna() if len(weights) else pd.Series(dtype=float)
+    names = sorted(set(current.index) | set(targets))
+    total_target = sum(targets.values())
+    deviation = pd.Series({name: current.get(name, 0.) - targets.get(name, 0.) / total_target for name in names})
+
+    figure = go.Figure(data=[go.Bar(x=deviation, y=deviation.index, orientation="h",
+                                    marker_color=np.where(deviation >= 0, "#00cc96", "#ef553b"))])
+    figure.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font={"color": "white", "size": 14},
+        xaxis={"title": "Deviation from target", "tickformat": "+.0%", "hoverformat": "+.1%"},
+        yaxis={"categoryorder": "category descending"},
+        showlegend=False,
+        title="Drift from target weights",
+        )
+    return figure
+
+
+def weights_figure(weights: pd.DataFrame) -> go.Figure:
+    figure = go.Figure(data=[go.Scatter(x=weights.index, y=weights[name], name=name, stackgroup="weights")
+                             for name in weights.columns])
+    figure.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font={"color": "white", "size": 14},
+        yaxis={"tickformat": ".0%", "hoverformat": ".1%"},
+        hovermode="x unified",
+        title="Weights over time",
+        )
+    return figure
+
+
+def rebalancing_table(plan: RebalancingPlan) -> list:
+    df = plan.trades.reset_index(names="Name")
+    df = df[df["Trade"] != 0].sort_values(by="Trade")
+    for col in ["Target", "Weight", "New Weight"]:
+        df[col] = df[col].map('{:,.1%}'.format)
+    df["Price"] = df["Price"].map('{:,.2f}'.format)
+    for col in ["Number", "Trade", "New Number"]:
+        df[col] = df[col].map('{:,.0f}'.format)
+
+    summary = html.Div(f"Fees: {plan.fees:,.2f}€ - Cash left: {plan.cash_left:,.2f}€ - "
+                       f"Drift: {plan.drift_before:.2e} → {plan.drift_after:.2e}", style={"color": "white", "margin": "10px 0"})
+    table = dash_table.DataTable(
+        data=df.to_dict("records"),
+        columns=[{"name": col, "id": col} for col in df.columns],
+        style_header={"backgroundColor": Colors.dark, "color": "white"},
+        style_data={"backgroundColor": Colors.card_dark, "color": "white"},
+        )
+    return [summary, table]
+
+
+def compute_rebalancing(id_portfolio, cash, fixed_fee, fee_rate) -> RebalancingPlan:
+    return rebalance(Portfolio.objects.get(id=id_portfolio), cash=cash, fixed_fee=fixed_fee, fee_rate=fee_rate)
+
+
+@app.callback(
+    dash.dependencies.Output('rebalancing-table', 'children'),
+    dash.dependencies.Output('rebalancing-interval', 'disabled'),
+    dash.dependencies.Output('rebalancing-progress', 'children'),
+    dash.dependencies.Input('rebalancing-cash', 'value'),
+    dash.dependencies.Input('rebalancing-fixed-fee', 'value'),
+    dash.dependencies.Input('rebalancing-fee-rate', 'value'),
+    dash.dependencies.Input('rebalancing-interval', 'n_intervals'),
+    dash.dependencies.State('pk', 'title')
+)
+@profile_callback
+def update_rebalancing(cash, fixed_fee, fee_rate, n_intervals, id_portfolio):
+    """
+    Submit the rebalancing plan on input changes, then poll it. Target weights are part of the job parameters.
+    """
+    targets = tuple(Portfolio.objects.get(id=id_portfolio).target_weights.order_by("id_object").values_list("id_object", "weight"))
+    if not targets:
+        return [], True, ""
+
+    cash, fixed_fee, fee_rate = float(cash or 0), float(fixed_fee or 0), float(fee_rate or 0) / 100
+    job = runner.submit("rebalancing", (id_portfolio, cash, fixed_fee, fee_rate, targets), get_series_versions(),
+                        compute_rebalancing, id_portfolio, cash, fixed_fee, fee_rate)
+
+    if not job.finished:
+        return dash.no_update, False, job_progress(job)
+    if job.status == JobStatus.FAILED:
+        return [], True, f"Rebalancing could not be computed ({job.error})"
+
+    return rebalancing_table(job.result), True, ""
+
+
+def dividends_figure(dividends: PortfolioDividends) -> go.Figure:
+    """
+    Dividends received, then projected, by month and object.
+    """
+    names = dividends.summary["Name"]
+    figure = go.Figure()
+    for frame, column, opacity, label in [(dividends.received, "received", 1., "received"),
+                                          (dividends.calendar, "expected", 0.5, "projected")]:
+        months = pd.to_datetime(frame["date"]).dt.to_period("M").dt.to_timestamp()
+        by_month = frame.groupby([months, frame["id_object"]])[column].sum().unstack(fill_value=0.)
+        for id_object in by_month.columns:
+            figure.add_trace(go.Bar(x=by_month.index, y=by_month[id_object], opacity=opacity,
+                                    name=f"{names.get(id_object, id_object)} ({label})"))
+
+    figure.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font={"color": "white", "size": 14},
+        barmode="stack",
+        yaxis={"tickformat": ",.0f", "ticksuffix": "€"},
+        hovermode="x unified",
+        title="Dividends by month",
+        )
+    return figure
+
+
+def ttm_dividends_figure(dividends: PortfolioDividends) -> go.Figure:
+    names = dividends.summary["Name"]
+    history = dividends.history
+    figure = go.Figure(data=[go.Scatter(x=history.index, y=history[id_object], name=names.get(id_object, id_object),
+                                        line={"shape": "hv"})
+                             for id_object in history.columns])
+    figure.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font={"color": "white", "size": 14},
+        yaxis={"tickformat": ",.2f"},
+        hovermode="x unified",
+        title="Dividend per share over the last 12 months",
+        )
+    return figure
+
+
+def dividends_table(dividends: PortfolioDividends) -> dash_table.DataTable:
+    df = dividends.summary.sort_values(by="Next 12M", ascending=False)
+    for col in ["TTM Yield", "Yield on Cost"]:
+        df[col] = df[col].map('{:,.2%}'.format)
+    for col in ["Price", "PRU", "Received", "TTM Dividend", "Next 12M"]:
+        df[col] = df[col].map('{:,.2f}'.format)
+    df["Number"] = df["Number"].map('{:,.0f}'.format)
+
+    return dash_table.DataTable(
+        data=df.to_dict("records"),
+        columns=[{"name": col, "id": col} for col in df.columns],
+        style_header={"backgroundColor": Colors.dark, "color": "white"},
+        style_data={"backgroundColor": Colors.card_dark, "color": "white"},
+        )
+
+
+def compute_cards(id_portfolio: int) -> tuple[str, str, date]:
+    """
+    Portfolio value, pnl and last updated date of the cards at the top of the page.
     """
     ptf = Portfolio.objects.get(id=id_portfolio)
     latest_date = FinancialData.get_price_most_recent_date()
-    inventory = ptf.get_inventory(latest_date)
 
     if ptf.ts_val is None:
-        ptf.get_TS()
+        load_portfolio_series(ptf)
 
-    # Portfolio Value
+    # Portfolio Value, cash included
     ptf_value = ptf.ts_val[latest_date]
     
-    # Portfolio PnL
-    pnl = ptf_value - np.dot(inventory.nbs, inventory.prus) 
+    # Portfolio PnL: value less the money brought in
+    pnl = ptf_value - ptf.ts_external[latest_date]
 
     return f"{ptf_value:,.2f}€", f"{pnl:,.2f}€", latest_date
 
 
+@app.callback(
+    dash.dependencies.Output('card-ptf-value', 'children'),
+    dash.dependencies.Output('card-ptf-pnl', 'children'),
+    dash.dependencies.Output('card-last-updated', 'children'),
+    dash.dependencies.Output('cards-interval', 'disabled'),
+    dash.dependencies.Input('pk', 'title'),
+    dash.dependencies.Input('cards-interval', 'n_intervals'),
+)
+@profile_callback
+def update_cards(id_portfolio: int, n_intervals):
+    """
+    Callback to update the 3 cards with the portfolio value, pnl and last updated date at the
+    top of the page. They are computed in a background job (which may compute the portfolio time series),
+    polled until it finishes.
+    """
+    job = runner.submit("cards", (id_portfolio,), get_series_versions(), compute_cards, id_portfolio)
+
+    if not job.finished:
+        return job_progress(job), "", "", False
+    if job.status == JobStatus.FAILED:
+        return "Error", "Error", job.error, True
+
+    return *job.result, True
+
+
 
 @app.callback(
     dash.dependencies.Output('db-price-date', 'children'),
     dash.dependencies.Input('order-table', 'data_previous'),
     dash.dependencies.State('order-table', 'data')
 )
+@profile_callback
 def remove_table_row_and_corresponding_object():
     pass
\ No newline at end of file
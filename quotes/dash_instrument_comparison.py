@@ -11,11 +11,148 @@ import dash_mantine_components as dmc
 from django.core.exceptions import ObjectDoesNotExist
 from django_plotly_dash import DjangoDash
 from quotes.models import Portfolio, FinancialData, FinancialObject, Order
+from quotes.comparison import compare_instruments
+from quotes.profiling import profile_callback
 
 
-app = DjangoDash('Comparisons', 
+HORIZONS = {"1Y": 1, "3Y": 3, "5Y": 5, "10Y": 10, "Max": None}
+ROLLING_WINDOWS = [20, 60, 120, 250]
+
+
+def horizon_to_limit_date(horizon: str) -> dt.date:
+    """
+    From the horizon selected (ex. 3Y), return the associated start date assuming the end date is today.
+    """
+    nb_years = HORIZONS[horizon]
+    if nb_years is None:
+        return dt.date(1900, 1, 1)
+    return (dt.datetime.today() - pd.tseries.offsets.DateOffset(years=nb_years)).date()
+
+
+def style_figure(fig: go.Figure, **layout) -> go.Figure:
+    """
+    Common dark theme of the comparison charts.
+    """
+    fig.update_layout(plot_bgcolor='rgba(0,0,0,0)',
+                      paper_bgcolor='rgba(0,0,0,0)',
+                      font={"color": "white"},
+                      legend={"orientation": "h", "yanchor": "bottom", "y": 1.02, "xanchor": "right", "x": 1},
+                      **layout)
+    return fig
+
+
+def serve_layout():
+    """
+    Layout built on each page load, so that newly added instruments are available.
+    """
+    instrument_options = [{'label': obj.name, 'value': obj.id} for obj in FinancialObject.objects.order_by("name")]
+
+    return html.Div(children=[
+        dbc.Container([
+            html.H1("Instrument comparison", style={"color": "white"}),
+            html.Hr(),
+
+            dbc.Row([
+                dbc.Col([
+                    dbc.Label("Instruments", style={"color": "white"}),
+                    dcc.Dropdown(id="instruments", options=instrument_options, multi=True),
+                ], width=6),
+                dbc.Col([
+                    dbc.Label("Benchmark", style={"color": "white"}),
+                    dcc.Dropdown(id="benchmark", options=instrument_options),
+                ], width=3),
+                dbc.Col([
+                    dbc.Label("Rolling window (days)", style={"color": "white"}),
+                    dcc.Dropdown(id="rolling-window", options=ROLLING_WINDOWS, value=60, clearable=False),
+                ], width=3),
+            ]),
+
+            dbc.RadioItems(
+                id="radio-horizon",
+                className="btn-group",
+                inputClassName="btn-check",
+                labelClassName="btn btn-outline-secondary",
+                labelCheckedClassName="active",
+                options=[{"label": horizon, "value": horizon} for horizon in HORIZONS],
+                value="3Y",
+            ),
+
+            html.Div(id="comparison-message", className="lead", style={"color": "white"}),
+
+            dcc.Graph(id="graph-rebased", style={'height': '500px'}),
+            dbc.Row([
+                dbc.Col(dcc.Graph(id="graph-correlation", style={'height': '500px'}), width=6),
+                dbc.Col([
+                    dcc.Graph(id="graph-rolling-correlation", style={'height': '250px'}),
+                    dcc.Graph(id="graph-rolling-beta", style={'height': '250px'}),
+                ], width=6),
+            ]),
+        ], fluid=True)
+    ], className="bg-dark")
+
+
+app = DjangoDash('Comparisons',
                  add_bootstrap_links=True,
                  external_stylesheets=["/static/assets/cards.css", dbc.themes.BOOTSTRAP])   # replaces dash.Dash
 
-app.layout = html.Div([
-    "Hello World!"])
\ No newline at end of file
+app.layout = serve_layout
+
+
+@app.callback(
+    dash.dependencies.Output('graph-rebased', 'figure'),
+    dash.dependencies.Output('graph-correlation', 'figure'),
+    dash.dependencies.Output('graph-rolling-correlation', 'figure'),
+    dash.dependencies.Output('graph-rolling-beta', 'figure'),
+    dash.dependencies.Output('comparison-message', 'children'),
+    dash.dependencies.Input('instruments', 'value'),
+    dash.dependencies.Input('benchmark', 'value'),
+    dash.dependencies.Input('radio-horizon', 'value'),
+    dash.dependencies.Input('rolling-window', 'value'),
+)
+@profile_callback
+def update_comparison(ids, benchmark_id, horizon, window):
+    """
+    Update all charts at once from a single comparison computation.
+    """
+    empty = [go.Figure(data=[]) for _ in range(4)]
+
+    if not ids:
+        return *empty, "Select instruments to compare."
+
+    benchmark_id = benchmark_id or ids[0]
+
+    try:
+        comparison = compare_instruments(ids, benchmark_id, horizon_to_limit_date(horizon), dt.date.today(), window)
+    except ValueError as e:
+        return *empty, str(e)
+
+    rebased = style_figure(
+        go.Figure(data=[go.Scatter(x=comparison.rebased.index, y=comparison.rebased[name], name=name)
+                        for name in comparison.rebased.columns]),
+        title="Performance (base 100)",
+        yaxis={"side": "right", "hoverformat": ",.2f"})
+
+    correlation = style_figure(
+        go.Figure(data=[go.Heatmap(z=comparison.correlation.values,
+                                   x=comparison.correlation.columns,
+                                   y=comparison.correlation.index,
+                                   zmin=-1, zmax=1, colorscale="RdBu", reversescale=True)]),
+        title="Correlation of daily returns")
+
+    benchmark_name = FinancialObject.objects.get(id=benchmark_id).name
+    others = [name for name in comparison.rolling_correlation.columns if name != benchmark_name]
+
+    rolling_correlation = style_figure(
+        go.Figure(data=[go.Scatter(x=comparison.rolling_correlation.index, y=comparison.rolling_correlation[name], name=name)
+                        for name in others]),
+        title=f"{window}-day rolling correlation with {benchmark_name}",
+        showlegend=False)
+
+    rolling_beta = style_figure(
+        go.Figure(data=[go.Scatter(x=comparison.rolling_beta.index, y=comparison.rolling_beta[name], name=name)
+                        for name in others]),
+        title=f"{window}-day rolling beta to {benchmark_name}",
+        showlegend=False)
+
+    first_date = comparison.rebased.index[0].strftime('%d/%m/%Y')
+    return rebased, correlation, rolling_correlation, rolling_beta, f"Common history starts on {first_date}."
@@ -0,0 +1,24 @@
+"""
+Lazy registration of the Dash apps.
+
+Importing a Dash app module pulls plotly, dash components and their data in, so none is imported
+with the URLconf: django_plotly_dash calls load_dash_app (PLOTLY_DASH["stateless_loader"]) the first
+time an app that is not registered yet is requested, and the module import registers it.
+"""
+from importlib import import_module
+
+DASH_APP_MODULES = {
+    "Dashboard": "quotes.dash_app",
+    "Portfolio": "quotes.dash_app_portfolio",
+    "Comparisons": "quotes.dash_instrument_comparison",
+}
+
+
+def load_dash_app(name: str):
+    """
+    Return the DjangoDash app registered under name, or None if no module defines it.
+    """
+    module = DASH_APP_MODULES.get(name)
+    if module is None:
+        return None
+    return import_module(module).app
@@ -0,0 +1,156 @@
+"""
+Data quality scan of NAV series: bad ticks found are stored as DataQualityFlag rows.
+
+All instruments are checked at once on arrays sorted by (instrument, date, row id):
+- non positive: zero or negative values
+- duplicate: several rows of an instrument on a date, all but the first inserted one are flagged
+- spike / jump: log returns with a robust z-score (against the median and MAD of the previous returns)
+  above Z_THRESHOLD. A jump immediately reversed by the next return is a spike, the others are jumps
+- flat run: values unchanged for FLAT_RUN rows or more
+- gap: more than MAX_GAP business days without a value
+
+Scans are incremental: only rows inserted since the last scan are flagged, with the previous values
+of their instruments as context. Flags in DataQualityFlag.EXCLUDED_CHECKS are left out of analytics
+(see FinancialData.valid).
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from quotes.models import DataQualityFlag, DataQualityScan, FinancialData
+
+Z_THRESHOLD = 8.
+# Previous returns the median and MAD of a return are computed on
+WINDOW = 60
+MIN_PERIODS = 20
+# Floor of the MAD, so that a move after a flat period is not infinitely unlikely
+MIN_MAD = 1e-4
+FLAT_RUN = 10
+MAX_GAP = 5
+# Calendar days of values loaded before the first new row of an instrument
+CONTEXT_DAYS = 180
+
+
+@dataclass
+class ScanResult:
+    """
+    Args:
+        flags: number of flags created, by check
+        rebuild: whether values scanned before are now excluded (ex. a jump turned out to be a spike), in which
+            case copies of the data such as the price store must be rebuilt
+    """
+    nb_rows: int
+    flags: dict[str, int]
+    rebuild: bool
+
+
+def load_values(ids: list[int], from_date) -> pd.DataFrame:
+    """
+    NAV rows of instruments, without those already excluded, sorted by instrument, date and insertion.
+    """
+    rows = FinancialData.valid().filter(id_object__in=ids, field=FinancialData.TimeSeriesField.NAV, date__gte=from_date)\
+        .order_by().values_list("id", "id_object", "date", "value")
+    return pd.DataFrame(list(rows), columns=["id", "id_object", "date", "value"])\
+        .sort_values(["id_object", "date", "id"], ignore_index=True)
+
+
+def find_flags(values: pd.DataFrame) -> pd.DataFrame:
+    """
+    Check values sorted by instrument, date and insertion.
+    Returns the flags (columns id, kind, score) of all values, new or not.
+    """
+    ids = values["id_object"].to_numpy()
+    dates = values["date"].to_numpy().astype("datetime64[D]")
+    value = values["value"].to_numpy(dtype=float)
+
+    flags = []
+
+    def flag(mask: np.ndarray, kind: str, score=None, rows: pd.DataFrame = values):
+        if not mask.any():
+            return
+        flags.append(pd.DataFrame({"id": rows["id"].to_numpy()[mask], "kind": kind,
+                                   "score": np.nan if score is None else np.asarray(score)[mask]}))
+
+    non_positive = value <= 0
+    flag(non_positive, DataQualityFlag.Check.NON_POSITIVE)
+
+    # Duplicates among the positive values only, so that a date keeps a value when its first one is not positive
+    positive = np.flatnonzero(~non_positive)
+    duplicate = np.zeros(len(values), dtype=bool)
+    duplicate[positive[1:]] = (ids[positive[1:]] == ids[positive[:-1]]) & (dates[positive[1:]] == dates[positive[:-1]])
+    flag(duplicate, DataQualityFlag.Check.DUPLICATE)
+
+    # Other checks on the remaining values
+    clean = values[~non_positive & ~duplicate].reset_index(drop=True)
+    ids, dates, value = clean["id_object"].to_numpy(), dates[~non_positive & ~duplicate], clean["value"].to_numpy(dtype=float)
+    same_object = np.r_[False, ids[1:] == ids[:-1]]
+
+    rets = np.full(len(clean), np.nan)
+    rets[same_object] = np.log(value[1:] / value[:-1])[same_object[1:]]
+
+    # Robust z-score against the previous returns of the instrument
+    previous = pd.Series(rets).groupby(ids).shift(1)
+    rolling = previous.groupby(ids).rolling(WINDOW, min_periods=MIN_PERIODS)
+    median = rolling.median().droplevel(0).sort_index().to_numpy()
+    deviation = (previous - median).abs()
+    mad = deviation.groupby(ids).rolling(WINDOW, min_periods=MIN_PERIODS).median().droplevel(0).sort_index().to_numpy()
+    z = (rets - median) / (1.4826 * np.maximum(mad, MIN_MAD))
+
+    outlier = np.abs(z) > Z_THRESHOLD
+    reversed_next = np.r_[outlier[1:] & same_object[1:] & (np.sign(z[1:]) == -np.sign(z[:-1])), False]
+    spike = outlier & reversed_next
+    # The return back to normal after a spike is not a jump
+    after_spike = np.r_[False, spike[:-1]] & same_object
+    flag(spike, DataQualityFlag.Check.SPIKE, np.abs(z), clean)
+    flag(outlier & ~spike & ~after_spike, DataQualityFlag.Check.JUMP, np.abs(z), clean)
+
+    # Position of each value in its run of unchanged values
+    unchanged = same_object & (rets == 0)
+    run = np.cumsum(~unchanged)
+    position = pd.Series(run).groupby(run).cumcount().to_numpy() + 1
+    flag(position >= FLAT_RUN, DataQualityFlag.Check.FLAT, position, clean)
+
+    missing = np.zeros(len(clean))
+    missing[1:] = np.busday_count(dates[:-1], dates[1:]) - 1
+    flag(same_object & (missing > MAX_GAP), DataQualityFlag.Check.GAP, missing, clean)
+
+    return pd.concat(flags, ignore_index=True) if flags else pd.DataFrame(columns=["id", "kind", "score"])
+
+
+def scan_data_quality(full: bool = False) -> ScanResult:
+    """
+    Flag the NAV rows inserted since the last scan, or all rows if full is set (existing flags are then replaced).
+    """
+    with transaction.atomic():
+        last_scan = DataQualityScan.objects.order_by("-id").first()
+        watermark = 0 if full or last_scan is None else last_scan.last_row_id
+        last_row_id = FinancialData.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+        if full:
+            DataQualityFlag.objects.all().delete()
+
+        new_rows = pd.DataFrame(list(FinancialData.objects.filter(id__gt=watermark, field=FinancialData.TimeSeriesField.NAV)
+                                     .order_by().values_list("id_object", "date")), columns=["id_object", "date"])
+
+        flags = pd.DataFrame(columns=["id", "kind", "score"])
+        if not new_rows.empty:
+            # New rows with the previous values of their instruments
+            from_date = new_rows["date"].min() - timedelta(days=CONTEXT_DAYS)
+            flags = find_flags(load_values(new_rows["id_object"].unique().tolist(), from_date))
+
+        # Values scanned before only get spikes: they were jumps until the reversal came in
+        old = flags["id"] <= watermark
+        flags = flags[~old | (flags["kind"] == DataQualityFlag.Check.SPIKE)]
+        spikes_on_old = flags.loc[flags["id"] <= watermark, "id"].tolist()
+
+        DataQualityFlag.objects.filter(data_id__in=spikes_on_old, kind=DataQualityFlag.Check.JUMP).delete()
+        DataQualityFlag.objects.bulk_create([
+            DataQualityFlag(data_id=int(row.id), kind=row.kind, score=None if pd.isna(row.score) else float(row.score))
+            for row in flags.itertuples()
+        ], ignore_conflicts=True)
+        DataQualityScan.objects.create(full=full, last_row_id=last_row_id, nb_rows=len(new_rows), nb_flags=len(flags))
+
+    return ScanResult(nb_rows=len(new_rows), flags=flags["kind"].value_counts().to_dict(), rebuild=full or bool(spikes_on_old))
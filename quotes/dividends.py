@@ -0,0 +1,199 @@
+"""
+Dividend analytics, per instrument and per portfolio: dividends received, trailing yields and projected calendar.
+
+Dividends are stored as sparse events (ex-date, dividend per share), read once for all instruments and brought to
+current units. Trailing sums (ex. over 12 months) are computed for any set of (instrument, date) points at once:
+events are sorted by an (instrument, day) key with their cumulative sum, and the sum over a window is the
+difference of the cumulative sums at its two ends, found by binary search. Long histories only cost a search.
+
+Dividends received are the events times the shares held at the end of the day before the ex-date, as in
+quotes.cash. The projected calendar repeats the events of the last 12 months one year later, on current holdings.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from quotes.analytics import get_series_versions
+from quotes.cache import get_market_data_version, get_or_compute
+from quotes.corporate_actions import get_adjustment_factors
+from quotes.models import FinancialData, FinancialObject, Order, Portfolio, YahooFinanceQuery
+
+DIVIDEND_EVENTS = "dividend-events"
+PORTFOLIO_DIVIDENDS = "portfolio-dividends"
+TTM_DAYS = 365
+# Instrument ids are spaced by more days than any date ordinal, so that keys sort by instrument then date
+KEY_SPACING = 10 ** 7
+
+
+def event_keys(ids, dates) -> np.ndarray:
+    ordinals = np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+    return np.asarray(ids, dtype=np.int64) * KEY_SPACING + ordinals
+
+
+@dataclass
+class DividendEvents:
+    """
+    Args:
+        events: columns date, id_object, amount (dividend per share in current units), sorted by id_object and date
+        keys: (instrument, day) key of each event
+        cumulative: cumulative sum of the amounts, after a leading 0
+    """
+    events: pd.DataFrame
+    keys: np.ndarray
+    cumulative: np.ndarray
+
+    @classmethod
+    def from_events(cls, events: pd.DataFrame) -> "DividendEvents":
+        events = events.sort_values(["id_object", "date"], ignore_index=True)
+        keys = event_keys(events["id_object"], events["date"])
+        return cls(events, keys, np.r_[0., np.cumsum(events["amount"].to_numpy(dtype=float))])
+
+    def trailing(self, ids, dates, days: int = TTM_DAYS) -> np.ndarray:
+        """
+        Sum of the dividends per share of each instrument over the days up to each date, its ex-dates included.
+        """
+        ends = event_keys(ids, dates)
+        return self.cumulative[np.searchsorted(self.keys, ends, side="right")] - \
+            self.cumulative[np.searchsorted(self.keys, ends - days, side="right")]
+
+    def between(self, ids, start: date, end: date) -> pd.DataFrame:
+        """
+        Events of instruments with an ex-date in (start, end].
+        """
+        events = self.events
+        return events[events["id_object"].isin(ids) & (events["date"] > start) & (events["date"] <= end)]
+
+
+def load_dividend_events() -> DividendEvents:
+    """
+    Dividend events of all instruments, in current units, from the same rows as the cash ledger (all origins).
+    """
+    rows = FinancialData.valid().filter(field=FinancialData.TimeSeriesField.Dividends).exclude(value=0)\
+        .order_by().values_list("date", "id_object", "value")
+    events = pd.DataFrame(list(rows), columns=["date", "id_object", "amount"])
+
+    factors = get_adjustment_factors()
+    for id_object in set(events["id_object"]) & set(factors.dates):
+        mask = (events["id_object"] == id_object).to_numpy()
+        events.loc[mask, "amount"] /= factors.factors(id_object, events["date"].to_numpy()[mask])
+    return DividendEvents.from_events(events)
+
+
+def get_dividend_events() -> DividendEvents:
+    """
+    Dividend events of all instruments, read again after each ingestion.
+    """
+    return get_or_compute(DIVIDEND_EVENTS, (), (get_market_data_version(),), load_dividend_events)
+
+
+def shares_before(ledger: pd.DataFrame, ids, dates) -> np.ndarray:
+    """
+    Number of items of each instrument held at the end of the day before each date.
+
+    Args:
+        ledger: orders, with columns date, id_object, direction, nb_items
+    """
+    ledger = ledger.assign(key=event_keys(ledger["id_object"], ledger["date"])).sort_values("key")
+    signed = np.where(ledger["direction"] == Order.OrderDirection.BUY, 1., -1.) * ledger["nb_items"].to_numpy(dtype=float)
+    held = pd.Series(signed).groupby(ledger["id_object"].to_numpy()).cumsum().to_numpy()
+
+    # Last order of the same instrument strictly before each date
+    last = np.searchsorted(ledger["key"].to_numpy(), event_keys(ids, dates), side="left") - 1
+    same = (last >= 0) & (ledger["id_object"].to_numpy()[np.maximum(last, 0)] == np.asarray(ids))
+    return np.where(same, held[np.maximum(last, 0)], 0.)
+
+
+@dataclass
+class PortfolioDividends:
+    """
+    Args:
+        received: dividends received, columns date, id_object, amount (per share), shares, received
+        summary: by object id, columns Name, Number, Price, PRU, Received, TTM Dividend (per share), TTM Yield,
+            Yield on Cost, Next 12M
+        calendar: projected dividends of the next 12 months, columns date, id_object, amount (per share), expected
+        history: trailing 12 months dividend per share at each month end (dates x object ids)
+        totals: Received, TTM Income, TTM Yield, Yield on Cost, Next 12M of the whole portfolio
+    """
+    received: pd.DataFrame
+    summary: pd.DataFrame
+    calendar: pd.DataFrame
+    history: pd.DataFrame
+    totals: dict[str, float]
+
+
+def compute_portfolio_dividends(events: DividendEvents, ledger: pd.DataFrame, inventory: pd.DataFrame,
+                                prices: pd.Series, names: dict[int, str], on: date) -> PortfolioDividends:
+    """
+    Dividend analytics of a portfolio without database access.
+
+    Args:
+        ledger: orders in current units, with columns date, id_object, direction, nb_items
+        inventory: current positions, with columns Id, Number, PRU
+        prices: latest price of each object, by id
+        names: name of each object, by id
+        on: date the trailing windows end on
+    """
+    ids = ledger["id_object"].unique()
+    positions = inventory.set_index("Id")[["Number", "PRU"]].reindex(ids, fill_value=0.)
+
+    received = events.between(ids, ledger["date"].min(), on).copy()
+    received["shares"] = shares_before(ledger, received["id_object"], received["date"])
+    received = received[received["shares"] > 0]
+    received["received"] = received["amount"] * received["shares"]
+
+    summary = positions.assign(Name=[names.get(id, str(id)) for id in ids], Price=prices.reindex(ids).to_numpy())
+    summary["Received"] = received.groupby("id_object")["received"].sum().reindex(ids, fill_value=0.)
+    summary["TTM Dividend"] = events.trailing(ids, np.full(len(ids), on, dtype="datetime64[D]"))
+    summary["TTM Yield"] = summary["TTM Dividend"] / summary["Price"]
+    summary["Yield on Cost"] = summary["TTM Dividend"] / summary["PRU"].where(summary["PRU"] > 0)
+
+    # Last 12 months of events, one year later, on the current holdings
+    held = positions.index[positions["Number"] > 0]
+    calendar = events.between(held, on - timedelta(days=TTM_DAYS), on).copy()
+    calendar["date"] = [day.replace(year=day.year + 1) if (day.month, day.day) != (2, 29) else day + timedelta(days=365)
+                        for day in calendar["date"]]
+    calendar["expected"] = calendar["amount"] * calendar["id_object"].map(positions["Number"])
+    summary["Next 12M"] = calendar.groupby("id_object")["expected"].sum().reindex(ids, fill_value=0.)
+
+    summary = summary[(summary["Number"] > 0) | (summary["Received"] > 0)]
+    summary = summary[["Name", "Number", "Price", "PRU", "Received", "TTM Dividend", "TTM Yield", "Yield on Cost", "Next 12M"]]
+
+    # Trailing 12 months dividend per share of the objects held, at each month end
+    months = pd.date_range(ledger["date"].min(), on, freq="ME").date
+    grid_ids, grid_months = np.repeat(held.to_numpy(), len(months)), np.tile(months, len(held))
+    history = pd.DataFrame(events.trailing(grid_ids, grid_months).reshape(len(held), len(months)).T,
+                           index=months, columns=held)
+
+    income = (summary["TTM Dividend"] * summary["Number"]).sum()
+    value, cost = (summary["Number"] * summary["Price"]).sum(), (summary["Number"] * summary["PRU"]).sum()
+    totals = {
+        "Received": received["received"].sum(),
+        "TTM Income": income,
+        "TTM Yield": income / value if value else np.nan,
+        "Yield on Cost": income / cost if cost else np.nan,
+        "Next 12M": calendar["expected"].sum(),
+    }
+    return PortfolioDividends(received=received.reset_index(drop=True), summary=summary,
+                              calendar=calendar.sort_values("date", ignore_index=True), history=history, totals=totals)
+
+
+def get_portfolio_dividends(portfolio: Portfolio) -> PortfolioDividends:
+    """
+    Dividend analytics of a portfolio, computed on first use after each market data or orders update.
+    """
+    def compute() -> PortfolioDividends:
+        columns = ["date", "id_object", "direction", "nb_items"]
+        ledger = pd.DataFrame(list(portfolio.orders.values(*columns)), columns=columns)
+        if ledger.empty:
+            raise ValueError("No order data.")
+        ledger = get_adjustment_factors().adjust_ledger(ledger)
+
+        on = FinancialData.get_price_most_recent_date()
+        fin_objs = list(FinancialObject.objects.filter(id__in=ledger["id_object"].unique().tolist()))
+        prices = YahooFinanceQuery.get_latest_prices(fin_objs, on)
+        return compute_portfolio_dividends(get_dividend_events(), ledger, portfolio.get_inventory(on).to_df(), prices,
+                                           {obj.id: obj.name for obj in fin_objs}, on)
+
+    return get_or_compute(PORTFOLIO_DIVIDENDS, (portfolio.id,), get_series_versions(), compute)
@@ -0,0 +1,12 @@
+from django import forms
+from .models import Order
+
+
+class OrderForm(forms.ModelForm):
+	class Meta:
+		model = Order
+		fields = ["portfolio", "id_object", "date", "direction", "nb_items", "price", "total_fee"]
+
+
+class OrderImportForm(forms.Form):
+	statement = forms.FileField(help_text="Broker CSV export")
@@ -0,0 +1,149 @@
+"""
+In-process background jobs for computations too slow to run in a request (ex. Dash callbacks).
+
+A job is submitted under a name, parameters and data versions, and runs in a thread pool: the
+caller gets its id at once and polls it (ex. from a dcc.Interval callback) for progress and result.
+Submitting the same name, parameters and versions while a job runs, or shortly after it finished,
+returns the existing job, so that concurrent users share one computation. A failed job is returned once,
+so that its pollers see the error, and submitting it again retries.
+
+Jobs live in the memory of the process that runs them: with several worker processes, a poll
+landing in another process does not find the job and has to submit it again there.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connections
+
+from quotes.cache import cache_key
+
+
+class JobStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class Job:
+    """
+    State of a background computation, as seen by pollers.
+
+    Args:
+        progress: fraction of the work done, between 0 and 1, reported by the job itself
+        message: description of the current step
+        reported: whether the failure of the job was returned by a submission
+    """
+    id: str
+    key: str
+    status: str = JobStatus.PENDING
+    progress: float = 0.
+    message: str = ""
+    result: Any = None
+    error: str | None = None
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    reported: bool = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED)
+
+
+# Job run by the current thread, for report_progress
+_local = threading.local()
+
+
+def report_progress(progress: float, message: str = ""):
+    """
+    Update the progress of the job running this code. Does nothing outside of a job.
+    """
+    job = getattr(_local, "job", None)
+    if job is not None:
+        job.progress = min(max(progress, 0.), 1.)
+        if message:
+            job.message = message
+
+
+class JobRunner:
+    """
+    Thread pool running jobs, with deduplication of identical submissions.
+    """
+
+    def __init__(self, max_workers: int, retention: float):
+        """
+        Args:
+            max_workers: number of jobs running at once
+            retention: seconds for which finished jobs are kept for polling and deduplication
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quotes-job")
+        self.retention = retention
+        self.jobs: dict[str, Job] = {}
+        self.by_key: dict[str, Job] = {}
+        self.lock = threading.Lock()
+
+    def submit(self, name: str, params: tuple, versions: tuple[str, ...], func: Callable[..., Any], *args, **kwargs) -> Job:
+        """
+        Run func(*args, **kwargs) in the background, unless the same job is already running or finished less than
+        retention seconds ago.
+
+        Args:
+            name: kind of computation (ex. "contributions")
+            params: parameters the result depends on, with a deterministic repr()
+            versions: version tokens of the data the result is computed from
+        """
+        key = cache_key(name, params, versions)
+        with self.lock:
+            self.evict()
+            # Failed jobs are returned once, for pollers to see the failure: the next submission retries
+            job = self.by_key.get(key)
+            if job is not None and job.status == JobStatus.FAILED and job.reported:
+                del self.by_key[key]
+            elif job is not None:
+                job.reported = job.status == JobStatus.FAILED
+                return job
+
+            job = Job(id=uuid4().hex, key=key)
+            self.jobs[job.id] = job
+            self.by_key[key] = job
+
+        self.executor.submit(self.run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id: str | None) -> Job | None:
+        return self.jobs.get(job_id) if job_id else None
+
+    def run(self, job: Job, func: Callable[..., Any], args: tuple, kwargs: dict):
+        _local.job = job
+        job.status = JobStatus.RUNNING
+        try:
+            job.result = func(*args, **kwargs)
+            job.progress = 1.
+            job.status = JobStatus.DONE
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = JobStatus.FAILED
+        finally:
+            job.finished_at = time.time()
+            _local.job = None
+            # Pool threads are not request threads: close their connections like Django does after a request
+            connections.close_all()
+
+    def evict(self):
+        """
+        Forget jobs finished more than retention seconds ago. Called with the lock held.
+        """
+        limit = time.time() - self.retention
+        for job in [job for job in self.jobs.values() if job.finished_at is not None and job.finished_at < limit]:
+            del self.jobs[job.id]
+            if self.by_key.get(job.key) is job:
+                del self.by_key[job.key]
+
+
+runner = JobRunner(max_workers=settings.JOB_WORKERS, retention=settings.JOB_RETENTION)
@@ -0,0 +1,96 @@
+"""
+Live valuation of portfolios, pushed to open portfolio pages over websockets (see quotes.consumers).
+
+Each server process runs one watcher of the market data version. When ingestion bumps it, the watcher
+notifies the consumers of the process through a group of the channel layer, and each consumer sends the
+new valuation of its portfolio: current holdings times latest prices plus cash, compared to the last valuation.
+The cash balance and external flows are read from the cached series of the portfolio (see quotes.analytics), which
+recompute_analytics warms after ingestion, and a valuation is computed once per portfolio and data version.
+"""
+import asyncio
+from uuid import uuid4
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+from quotes.analytics import get_portfolio_series
+from quotes.cache import get_market_data_version, get_orders_version, get_or_compute
+from quotes.models import Portfolio, FinancialData, YahooFinanceQuery
+
+# Consumers of this process only: every process has its own watcher
+MARKET_DATA_GROUP = f"market-data.{uuid4().hex}"
+
+_watcher: asyncio.Task | None = None
+
+
+def last_valuation_key(portfolio_id: int) -> str:
+    return f"quotes:live:last-valuation:{portfolio_id}"
+
+
+def compute_valuation(portfolio_id: int) -> dict:
+    """
+    Value (holdings and cash) and pnl of a portfolio at the most recent price date, as the cards of the portfolio
+    page, and change since the last valuation.
+    """
+    ptf = Portfolio.objects.get(id=portfolio_id)
+    latest_date = FinancialData.get_price_most_recent_date()
+    inventory = ptf.get_inventory(latest_date)
+
+    value = external = 0.
+    if len(inventory):
+        # Objects not quoted on the latest date are valued at their last quote, within the staleness limit
+        prices = YahooFinanceQuery.get_latest_prices(inventory.fin_objs, latest_date)
+        value = float(np.nansum(prices.to_numpy() * np.array(inventory.nbs)))
+    if ptf.orders.exists():
+        position = get_portfolio_series(ptf).loc[:latest_date, ["cash", "external"]].dropna()
+        if len(position):
+            value += float(position["cash"].iloc[-1])
+            external = float(position["external"].iloc[-1])
+
+    previous = cache.get(last_valuation_key(portfolio_id))
+    change = value - previous["value"] if previous else None
+
+    valuation = {
+        "portfolio": portfolio_id,
+        "date": latest_date.isoformat(),
+        "value": value,
+        "pnl": value - external,
+        "change": change,
+        # As displayed in the cards of the portfolio page
+        "cards": {"value": f"{value:,.2f}€", "pnl": f"{value - external:,.2f}€", "date": str(latest_date)},
+    }
+    cache.set(last_valuation_key(portfolio_id), valuation, None)
+    return valuation
+
+
+def get_valuation(portfolio_id: int) -> dict:
+    """
+    Valuation of a portfolio, computed once per market data and orders versions.
+    """
+    return get_or_compute("live-valuation", (portfolio_id,), (get_market_data_version(), get_orders_version()),
+                          lambda: compute_valuation(portfolio_id))
+
+
+async def watch_market_data():
+    """
+    Notify the consumers of this process whenever the market data version changes.
+    """
+    version = await sync_to_async(get_market_data_version)()
+    while True:
+        await asyncio.sleep(settings.LIVE_VALUATION_INTERVAL)
+        new_version = await sync_to_async(get_market_data_version)()
+        if new_version != version:
+            version = new_version
+            await get_channel_layer().group_send(MARKET_DATA_GROUP, {"type": "market.data", "version": version})
+
+
+def ensure_watcher():
+    """
+    Start the watcher of this process on the running event loop, if it is not running yet.
+    """
+    global _watcher
+    if _watcher is None or _watcher.done():
+        _watcher = asyncio.get_running_loop().create_task(watch_market_data())
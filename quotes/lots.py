@@ -0,0 +1,171 @@
+"""
+FIFO tax lots of a portfolio: realized and unrealized PnL, and holding periods, per position.
+
+The orders of each instrument are processed in one pass, by date then id. A buy opens a lot (date, quantity,
+unit cost), its fees included in the cost. A sell consumes the oldest lots first: its proceeds net of fees
+minus the cost of the quantities consumed is realized, and their ages are holding periods. Unlike the PRU of
+PortfolioEntry, the cost of the quantities still held is not changed by sells.
+
+The state of an instrument is checkpointed every CHECKPOINT_INTERVAL orders, so that memory grows with the open
+lots times orders / CHECKPOINT_INTERVAL. The LotBook of a portfolio is kept in the cache and synced with its
+orders when read: an instrument is replayed from the last checkpoint before its first order that was added,
+changed or deleted.
+"""
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+
+from quotes.cache import cache_key
+from quotes.corporate_actions import get_adjustment_factors
+from quotes.models import Order, Portfolio
+
+LOT_BOOK = "lot-book"
+ORDER_COLUMNS = ["id", "date", "direction", "nb_items", "price", "total_fee"]
+# Quantities adjusted for corporate actions are not always whole
+QUANTITY_TOLERANCE = 1e-8
+# Orders between two checkpoints of an instrument: at most this many are replayed on a change
+CHECKPOINT_INTERVAL = 32
+
+
+@dataclass(frozen=True)
+class LotState:
+    """
+    State of an instrument after an order.
+
+    Args:
+        lots: open lots (date ordinal, quantity, unit cost), oldest first
+        realized: realized PnL of the sells
+        sold: quantity sold
+        sold_days: sum of quantity x holding days of the quantities sold
+    """
+    lots: tuple[tuple[int, float, float], ...] = ()
+    realized: float = 0.
+    sold: float = 0.
+    sold_days: float = 0.
+
+
+@dataclass
+class InstrumentLots:
+    """
+    Args:
+        orders: orders processed, as tuples of ORDER_COLUMNS values
+        checkpoints: state before orders 0, CHECKPOINT_INTERVAL, 2 x CHECKPOINT_INTERVAL...
+        state: state after the last order
+    """
+    orders: list[tuple] = field(default_factory=list)
+    checkpoints: list[LotState] = field(default_factory=lambda: [LotState()])
+    state: LotState = field(default_factory=LotState)
+
+
+def process(state: LotState, orders: list[tuple], id_object: int, first: int = 0) -> tuple[LotState, list[LotState]]:
+    """
+    State after the orders of an instrument, from the state before the first one, and the checkpoints met on the way:
+    states before the orders whose index (first for the first order) is a later multiple of CHECKPOINT_INTERVAL.
+    """
+    lots = deque(state.lots)
+    realized, sold, sold_days = state.realized, state.sold, state.sold_days
+    checkpoints = []
+
+    for index, (_, day, direction, nb, price, fee) in enumerate(orders, start=first):
+        if index > first and index % CHECKPOINT_INTERVAL == 0:
+            checkpoints.append(LotState(tuple(lots), realized, sold, sold_days))
+
+        day = day.toordinal()
+        if direction == Order.OrderDirection.BUY:
+            lots.append((day, nb, (nb * price + fee) / nb))
+        else:
+            remaining, cost = nb, 0.
+            while remaining > QUANTITY_TOLERANCE:
+                if not lots:
+                    raise ValueError(f"Sell of {nb} items of object {id_object} on {date.fromordinal(day)} exceeds the quantity held.")
+                lot_day, quantity, unit_cost = lots[0]
+                taken = min(quantity, remaining)
+                cost += taken * unit_cost
+                sold_days += taken * (day - lot_day)
+                if quantity - taken > QUANTITY_TOLERANCE:
+                    lots[0] = (lot_day, quantity - taken, unit_cost)
+                else:
+                    lots.popleft()
+                remaining -= taken
+            realized += nb * price - fee - cost
+            sold += nb
+
+    return LotState(tuple(lots), realized, sold, sold_days), checkpoints
+
+
+@dataclass
+class LotBook:
+    """
+    Lots of the instruments (by id) of a portfolio.
+    """
+    instruments: dict[int, InstrumentLots] = field(default_factory=dict)
+
+    def sync(self, ledger: pd.DataFrame) -> list[int]:
+        """
+        Bring the lots up to date with the orders of a ledger (columns ORDER_COLUMNS and id_object).
+        Returns the ids of the instruments reprocessed or removed.
+        """
+        ids = set(ledger["id_object"])
+        changed = [id_object for id_object in self.instruments if id_object not in ids]
+        for id_object in changed:
+            del self.instruments[id_object]
+
+        for id_object, group in ledger.sort_values(["date", "id"]).groupby("id_object"):
+            orders = list(group[ORDER_COLUMNS].itertuples(index=False, name=None))
+            instrument = self.instruments.setdefault(int(id_object), InstrumentLots())
+
+            # Replay from the last checkpoint before the first order that differs
+            start = next((i for i, (old, new) in enumerate(zip(instrument.orders, orders)) if old != new),
+                         min(len(instrument.orders), len(orders)))
+            if start == len(orders) == len(instrument.orders):
+                continue
+
+            checkpoint = min(start // CHECKPOINT_INTERVAL, len(instrument.checkpoints) - 1)
+            first = checkpoint * CHECKPOINT_INTERVAL
+            instrument.state, checkpoints = process(instrument.checkpoints[checkpoint], orders[first:], id_object, first)
+            instrument.checkpoints = instrument.checkpoints[:checkpoint + 1] + checkpoints
+            instrument.orders = orders
+            changed.append(int(id_object))
+        return changed
+
+    def positions(self, prices: pd.Series, on: date) -> pd.DataFrame:
+        """
+        By instrument id: Number, Cost (of the open lots), Realized, Unrealized (at prices, by id), Holding Days
+        (average age of the quantities held) and Sold Holding Days (average holding period of the quantities sold).
+        """
+        rows = {}
+        for id_object, instrument in self.instruments.items():
+            state = instrument.state
+            lots = np.array(state.lots, dtype=float).reshape(-1, 3)
+            days, quantities, unit_costs = lots.T
+            number, cost = quantities.sum(), quantities @ unit_costs
+
+            rows[id_object] = {
+                "Number": number,
+                "Cost": cost,
+                "Realized": state.realized,
+                "Unrealized": number * prices.get(id_object, np.nan) - cost if number else 0.,
+                "Holding Days": (on.toordinal() - days) @ quantities / number if number else np.nan,
+                "Sold Holding Days": state.sold_days / state.sold if state.sold else np.nan,
+            }
+        return pd.DataFrame.from_dict(rows, orient="index", columns=["Number", "Cost", "Realized", "Unrealized",
+                                                                     "Holding Days", "Sold Holding Days"])
+
+
+def get_lot_book(portfolio: Portfolio) -> LotBook:
+    """
+    Lots of a portfolio, synced with its orders (in current units) and stored back in the cache if they changed.
+    """
+    ledger = pd.DataFrame(list(portfolio.orders.values("id_object", *ORDER_COLUMNS)), columns=["id_object", *ORDER_COLUMNS])
+    ledger = get_adjustment_factors().adjust_ledger(ledger)
+
+    # Books of another checkpoint layout are not reused
+    key = cache_key(LOT_BOOK, (portfolio.id, CHECKPOINT_INTERVAL), ())
+    book = cache.get(key) or LotBook()
+    if book.sync(ledger):
+        cache.set(key, book)
+    return book
@@ -0,0 +1,92 @@
+import itertools
+import os
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from quotes.analytics import get_portfolio_series
+from quotes.backtest import BacktestResult, Strategy, performance_stats, stats_table, sweep
+from quotes.models import FinancialData, FinancialObject, Portfolio, YahooFinanceQuery
+
+
+class Command(BaseCommand):
+	help = "Backtest a grid of lump sum, DCA and rebalancing strategies on the weights of a portfolio, against the real portfolios"
+
+	def add_arguments(self, parser):
+		parser.add_argument("portfolio", type=int, help="Id of the portfolio whose target weights (or else current weights) are backtested")
+		parser.add_argument("--from-date", type=date.fromisoformat, default=None, help="First date (YYYY-MM-DD, default: 5 years ago)")
+		parser.add_argument("--until-date", type=date.fromisoformat, default=None, help="Last date (YYYY-MM-DD, default: latest prices)")
+		parser.add_argument("--initial", type=float, nargs="+", default=[10000.], help="Amounts invested on the first day")
+		parser.add_argument("--monthly", type=float, nargs="+", default=[0., 500.], help="Amounts invested every month")
+		parser.add_argument("--rebalance-months", type=int, nargs="+", default=[0, 1, 3, 6, 12], help="Months between rebalancings, 0 for never")
+		parser.add_argument("--fixed-fee", type=float, nargs="+", default=[0.], help="Fees per order")
+		parser.add_argument("--fee-rate", type=float, nargs="+", default=[0.], help="Fees proportional to the amount of an order")
+		parser.add_argument("--compare", type=int, nargs="*", default=None, help="Ids of the real portfolios to compare with (default: all)")
+		parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+		parser.add_argument("--top", type=int, default=20, help="Number of strategies shown, by annualized return")
+		parser.add_argument("--output", type=Path, default=None, help="CSV file to write the statistics of all strategies to")
+
+	def handle(self, *args, **options):
+		start = time.perf_counter()
+		portfolio = Portfolio.objects.get(id=options["portfolio"])
+		until_date = options["until_date"] or FinancialData.get_price_most_recent_date()
+		from_date = options["from_date"] or until_date - timedelta(days=5 * 365)
+
+		weights = dict(portfolio.target_weights.values_list("id_object", "weight"))
+		if not weights:
+			weights = {obj.id: weight for obj, weight in portfolio.get_inventory(until_date).weights.items()}
+		if not weights:
+			raise CommandError(f"Portfolio {portfolio} has neither target weights nor holdings.")
+
+		strategies = [
+			Strategy(name=f"{initial:g} + {monthly:g}/month, rebalance {f'{months}m' if months else 'never'}, fees {fixed_fee:g} + {fee_rate:.2%}",
+					 weights=weights, initial=initial, monthly=monthly, rebalance_months=months, fixed_fee=fixed_fee, fee_rate=fee_rate)
+			for initial, monthly, months, fixed_fee, fee_rate in itertools.product(
+				options["initial"], options["monthly"], options["rebalance_months"], options["fixed_fee"], options["fee_rate"])
+		]
+
+		# Prices loaded once for all strategies
+		fin_objs = list(FinancialObject.objects.filter(id__in=list(weights)))
+		prices = YahooFinanceQuery.get_price_matrix(fin_objs, from_date, until_date)
+		self.stdout.write(f"Loaded {prices.shape[0]} dates x {prices.shape[1]} instruments in {time.perf_counter() - start:.2f}s")
+
+		# Forked workers must not share the database connections of the parent
+		connections.close_all()
+		results, errors = sweep(strategies, prices, options["workers"])
+		for error in errors:
+			self.stdout.write(self.style.ERROR(error))
+		self.stdout.write(f"Backtested {len(results)} of {len(strategies)} strategies in {time.perf_counter() - start:.2f}s")
+
+		table = stats_table(results + self.portfolio_results(options["compare"], from_date, until_date))
+		if options["output"]:
+			table.to_csv(options["output"])
+			self.stdout.write(f"Statistics written to {options['output']}")
+
+		table = table.sort_values("annualized_return", ascending=False).head(options["top"])
+		with pd.option_context("display.width", 250, "display.max_columns", None, "display.max_colwidth", 70, "display.float_format", "{:,.4f}".format):
+			self.stdout.write(str(table))
+
+	def portfolio_results(self, ids: list[int] | None, from_date: date, until_date: date) -> list[BacktestResult]:
+		"""
+		Statistics of the real portfolios over the same time frame, from their cached time series.
+		"""
+		portfolios = Portfolio.objects.all() if ids is None else Portfolio.objects.filter(id__in=ids)
+		results = []
+		for portfolio in portfolios:
+			try:
+				series = get_portfolio_series(portfolio)
+			except Exception as e:
+				self.stdout.write(self.style.WARNING(f"Portfolio {portfolio.id} skipped: {e}"))
+				continue
+
+			series = series.loc[from_date:until_date].dropna(subset=["value", "cumulative_return"])
+			if len(series) < 2:
+				continue
+			series.index = pd.to_datetime(series.index)
+			stats = performance_stats(series["return"], series["cumulative_return"])
+			stats["value"] = series["value"].iloc[-1]
+			results.append(BacktestResult(name=f"Portfolio {portfolio}", series=series, stats=stats))
+		return results
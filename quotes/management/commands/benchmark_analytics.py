@@ -0,0 +1,148 @@
+import io
+import json
+import platform
+import statistics
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from quotes.models import Portfolio, YahooFinanceQuery
+
+# name: (instruments, years, orders per portfolio)
+SCALES = {
+	"small": (10, 3, 20),
+	"medium": (50, 10, 100),
+	"large": (200, 20, 500),
+}
+
+DEFAULT_BASELINE = settings.BASE_DIR / "benchmarks" / "baseline.json"
+
+
+class Command(BaseCommand):
+	help = "Time and count the queries of the portfolio analytics on synthetic datasets, offline against SQLite"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"], help="Dataset scales to run")
+		parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs of each target")
+		parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"), help="Where to write the JSON results")
+		parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="JSON results to compare against")
+		parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+		parser.add_argument("--tolerance", type=float, default=0.25, help="Relative slowdown above which a target is a regression")
+
+	def handle(self, *args, **options):
+		results = []
+
+		# Throwaway SQLite database without migrations (0007 reads a local csv), an isolated cache, and no price store (built from the real database)
+		test_settings = connection.settings_dict.setdefault("TEST", {})
+		test_settings["MIGRATE"] = False
+		old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+		try:
+			with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}, PRICE_STORE_DIR=None):
+				for scale in options["scales"]:
+					results.extend(self.run_scale(scale, options["repeat"]))
+		finally:
+			connection.creation.destroy_test_db(old_name, verbosity=0)
+
+		report = {
+			"meta": {"python": platform.python_version(), "machine": platform.machine(), "date": date.today().isoformat()},
+			"results": results,
+		}
+		options["output"].write_text(json.dumps(report, indent=2))
+		self.stdout.write(f"Results written to {options['output']}")
+
+		if options["save_baseline"]:
+			options["baseline"].parent.mkdir(parents=True, exist_ok=True)
+			options["baseline"].write_text(json.dumps(report, indent=2))
+			self.stdout.write(f"Baseline saved to {options['baseline']}")
+
+		elif options["baseline"].exists():
+			baseline = json.loads(options["baseline"].read_text())
+			regressions = compare_to_baseline(results, baseline["results"], options["tolerance"])
+			for regression in regressions:
+				self.stdout.write(self.style.ERROR(regression))
+			if regressions:
+				raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+			self.stdout.write(self.style.SUCCESS(f"No regression against {options['baseline']}"))
+
+		else:
+			self.stdout.write(f"No baseline found at {options['baseline']}, skipping comparison")
+
+	def run_scale(self, scale: str, repeat: int) -> list[dict]:
+		"""
+		Generate the dataset of a scale, then benchmark every target on its first portfolio.
+		"""
+		instruments, years, orders = SCALES[scale]
+		call_command("generate_synthetic_data", purge=True, instruments=instruments, years=years,
+					 portfolios=1, orders=orders, seed=0, stdout=io.StringIO())
+
+		ptf = Portfolio.objects.get()
+		end_date = ptf.orders.last().date
+		start_date = end_date - timedelta(days=365)
+		fin_objs = ptf.get_inventory().fin_objs
+		first_date = ptf.orders.first().date
+
+		targets = {
+			"get_inventory": lambda: ptf.get_inventory(),
+			"get_TS": lambda: ptf.get_TS(),
+			"get_weights": lambda: ptf.get_weights(),
+			"get_individual_returns": lambda: ptf.get_individual_returns(start_date, end_date),
+			"get_prices_from_inventory": lambda: YahooFinanceQuery.get_prices_from_inventory(fin_objs, first_date, end_date),
+			"get_divs_from_inventory": lambda: YahooFinanceQuery.get_divs_from_inventory(fin_objs, first_date, end_date),
+		}
+
+		results = []
+		for name, target in targets.items():
+			timings, queries = measure(target, repeat)
+			results.append({
+				"scale": scale,
+				"target": name,
+				"instruments": instruments, "years": years, "orders": orders,
+				"median_s": statistics.median(timings),
+				"min_s": min(timings),
+				"queries": queries,
+			})
+			self.stdout.write(f"{scale:>8} {name:<28} {statistics.median(timings):>9.4f}s {queries:>7} queries")
+
+		return results
+
+
+def measure(target, repeat: int) -> tuple[list[float], int]:
+	"""
+	Wall times of repeat runs of target, and number of queries of an extra run.
+	Queries are counted separately as capturing them slows the run down.
+	"""
+	timings = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		target()
+		timings.append(time.perf_counter() - start)
+
+	with CaptureQueriesContext(connection) as ctx:
+		target()
+	return timings, len(ctx.captured_queries)
+
+
+def compare_to_baseline(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+	"""
+	Describe every (scale, target) slower than its baseline by more than tolerance, or running more queries.
+	"""
+	reference = {(item["scale"], item["target"]): item for item in baseline}
+	regressions = []
+
+	for item in results:
+		ref = reference.get((item["scale"], item["target"]))
+		if ref is None:
+			continue
+
+		if item["median_s"] > ref["median_s"] * (1 + tolerance):
+			regressions.append(f"{item['scale']} {item['target']}: {item['median_s']:.4f}s vs {ref['median_s']:.4f}s")
+		if item["queries"] > ref["queries"]:
+			regressions.append(f"{item['scale']} {item['target']}: {item['queries']} queries vs {ref['queries']}")
+
+	return regressions
@@ -0,0 +1,85 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules that must not be imported when the project starts: they are loaded on first use
+LAZY_MODULES = [
+	"yfinance",
+	"plotly.express",
+	"dash_mantine_components",
+	"quotes.dash_app",
+	"quotes.dash_app_portfolio",
+	"quotes.dash_instrument_comparison",
+]
+
+# Python code run in a fresh interpreter for each scenario
+SCENARIOS = {
+	"manage.py check": "from django.core.management import execute_from_command_line; "
+					   "execute_from_command_line(['manage.py', 'check'])",
+	"worker boot": "import pea_project.wsgi",
+}
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+class Command(BaseCommand):
+	help = "Measure the import time of manage.py check and of a worker boot with -X importtime, against a budget"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--budget-check", type=float, default=2000, help="Import time budget of manage.py check, in ms")
+		parser.add_argument("--budget-boot", type=float, default=2500, help="Import time budget of a worker boot, in ms")
+		parser.add_argument("--top", type=int, default=10, help="Number of slowest packages to show")
+
+	def handle(self, *args, **options):
+		budgets = {"manage.py check": options["budget_check"], "worker boot": options["budget_boot"]}
+		failures = []
+
+		for scenario, code in SCENARIOS.items():
+			imports = self.measure(code)
+			total = sum(own for depth, name, own, cumulative in imports) / 1000
+
+			# Time spent importing the modules of each top-level package
+			per_package = {}
+			for depth, name, own, cumulative in imports:
+				package = name.split(".")[0]
+				per_package[package] = per_package.get(package, 0) + own
+
+			self.stdout.write(f"{scenario}: {total:.0f}ms of imports (budget {budgets[scenario]:.0f}ms)")
+			for package, own in sorted(per_package.items(), key=lambda item: -item[1])[:options["top"]]:
+				self.stdout.write(f"  {own / 1000:>8.1f}ms  {package}")
+
+			if total > budgets[scenario]:
+				failures.append(f"{scenario} imports take {total:.0f}ms, over the {budgets[scenario]:.0f}ms budget")
+
+			imported = {name for depth, name, own, cumulative in imports}
+			for module in LAZY_MODULES:
+				if module in imported:
+					failures.append(f"{scenario} imports {module}, which should only be loaded when needed")
+
+		for failure in failures:
+			self.stdout.write(self.style.ERROR(failure))
+		if failures:
+			raise CommandError(f"{len(failures)} import time check(s) failed")
+		self.stdout.write(self.style.SUCCESS("Import times within budget"))
+
+	@staticmethod
+	def measure(code: str) -> list[tuple[int, str, int, int]]:
+		"""
+		Run code in a fresh interpreter with -X importtime, and return (depth, module, self us, cumulative us) per import.
+		"""
+		env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "pea_project.settings")}
+		result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+								cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+		if result.returncode != 0:
+			raise CommandError(f"Failed to run {code!r}:\n{result.stderr[-2000:]}")
+
+		imports = []
+		for line in result.stderr.splitlines():
+			match = IMPORT_LINE.match(line)
+			if match:
+				imports.append((len(match.group(3)) // 2, match.group(4), int(match.group(1)), int(match.group(2))))
+		return imports
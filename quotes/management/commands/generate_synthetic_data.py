@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from quotes.models import FinancialObject, FinancialData, AccountOwner, Portfolio, Order
+from quotes.cache import bump_market_data_version
+from quotes.price_store import update_price_store
+from quotes.data_quality import scan_data_quality
+
+# Synthetic rows are recognisable (and purgeable) by these prefixes. ZZ is a user-assigned ISIN country code.
+ISIN_PREFIX = "ZZ"
+OWNER_PREFIX = "Synthetic-"
+
+TRADING_DAYS = 252
+
+
+class Command(BaseCommand):
+	help = "Generate a reproducible synthetic dataset (instruments, NAV and dividend histories, portfolios and orders)"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--instruments", type=int, default=50, help="Number of FinancialObjects to create")
+		parser.add_argument("--years", type=int, default=5, help="Length of the NAV histories, in years")
+		parser.add_argument("--portfolios", type=int, default=10, help="Number of AccountOwners, each with one Portfolio")
+		parser.add_argument("--orders", type=int, default=50, help="Number of orders per portfolio")
+		parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+		parser.add_argument("--end-date", type=date.fromisoformat, default=date.today(), help="Last date of the histories (YYYY-MM-DD)")
+		parser.add_argument("--purge", action="store_true", help="Delete previously generated synthetic data first")
+		parser.add_argument("--batch-size", type=int, default=10000, help="Rows per bulk insert")
+
+	def handle(self, *args, **options):
+		if options["instruments"] < 1 or options["years"] < 1:
+			raise CommandError("At least one instrument and one year of history are required.")
+
+		rng = np.random.default_rng(options["seed"])
+		batch_size = options["batch_size"]
+
+		with transaction.atomic():
+			if options["purge"]:
+				self.purge()
+
+			# Step 1: instruments
+			start = FinancialObject.objects.filter(isin__startswith=ISIN_PREFIX).count()
+			fin_objs = FinancialObject.objects.bulk_create([
+				FinancialObject(name=f"Synthetic {i:05d}", category=FinancialObject.ObjectType.STOCK, isin=f"{ISIN_PREFIX}{i:010d}")
+				for i in range(start, start + options["instruments"])
+			])
+
+			# Step 2: NAV and dividend histories
+			dates = pd.bdate_range(end=options["end_date"], periods=options["years"] * TRADING_DAYS)
+			navs = simulate_gbm(rng, len(dates), len(fin_objs))
+			divs = simulate_dividends(rng, dates, navs)
+
+			for j, fin_obj in enumerate(fin_objs):
+				# Analytics read Yahoo Finance data, so synthetic data is stored under that origin
+				FinancialData.objects.bulk_create([
+					FinancialData(id_object=fin_obj, date=d, field=FinancialData.TimeSeriesField.NAV, value=v, origin=FinancialData.DataOrigin.YF)
+					for d, v in zip(dates.date, navs[:, j].tolist())
+				], batch_size=batch_size)
+
+				paid = np.flatnonzero(divs[:, j])
+				FinancialData.objects.bulk_create([
+					FinancialData(id_object=fin_obj, date=dates[i].date(), field=FinancialData.TimeSeriesField.Dividends, value=divs[i, j], origin=FinancialData.DataOrigin.YF)
+					for i in paid.tolist()
+				], batch_size=batch_size)
+
+			# Step 3: owners, portfolios and orders
+			start = AccountOwner.objects.filter(name__startswith=OWNER_PREFIX).count()
+			owners = AccountOwner.objects.bulk_create([
+				AccountOwner(name=f"{OWNER_PREFIX}{i:05d}") for i in range(start, start + options["portfolios"])
+			])
+			portfolios = Portfolio.objects.bulk_create([Portfolio(owner=owner, name="PEA") for owner in owners])
+
+			orders = []
+			for portfolio in portfolios:
+				orders.extend(simulate_orders(rng, portfolio, fin_objs, dates, navs, options["orders"]))
+			Order.objects.bulk_create(orders, batch_size=batch_size)
+
+		# Deleted rows are only dropped from the price store by a full rebuild
+		scan = scan_data_quality()
+		update_price_store(full=options["purge"] or scan.rebuild)
+		bump_market_data_version()
+
+		self.stdout.write(self.style.SUCCESS(
+			f"Created {len(fin_objs)} instruments over {len(dates)} dates, "
+			f"{int((divs != 0).sum())} dividends, {len(portfolios)} portfolios and {len(orders)} orders."))
+
+	def purge(self):
+		"""
+		Delete synthetic instruments and owners, along with their data, portfolios and orders.
+		"""
+		FinancialObject.objects.filter(isin__startswith=ISIN_PREFIX).delete()
+		AccountOwner.objects.filter(name__startswith=OWNER_PREFIX).delete()
+
+
+def simulate_gbm(rng: np.random.Generator, nb_dates: int, nb_instruments: int) -> np.ndarray:
+	"""
+	(dates x instruments) prices following geometric brownian motions, correlated through a market factor.
+	"""
+	dt = 1 / TRADING_DAYS
+	mu = rng.uniform(0.0, 0.12, nb_instruments)
+	sigma = rng.uniform(0.15, 0.45, nb_instruments)
+	beta = rng.uniform(0.3, 0.9, nb_instruments)
+
+	market = rng.standard_normal((nb_dates, 1))
+	shocks = beta * market + np.sqrt(1 - beta ** 2) * rng.standard_normal((nb_dates, nb_instruments))
+
+	log_rets = (mu - sigma ** 2 / 2) * dt + sigma * np.sqrt(dt) * shocks
+	log_rets[0] = 0
+
+	return rng.uniform(10, 500, nb_instruments) * np.exp(np.cumsum(log_rets, axis=0))
+
+
+def simulate_dividends(rng: np.random.Generator, dates: pd.DatetimeIndex, navs: np.ndarray) -> np.ndarray:
+	"""
+	Sparse (dates x instruments) dividends: most instruments pay yearly, half-yearly or quarterly.
+	"""
+	nb_instruments = navs.shape[1]
+	frequency = rng.choice([0, 1, 2, 4], size=nb_instruments, p=[0.2, 0.4, 0.2, 0.2])
+	yields = rng.uniform(0.01, 0.06, nb_instruments)
+	first_month = rng.integers(1, 13, nb_instruments)
+
+	# Pay on the first trading day of the payment months
+	first_days = np.r_[True, dates.month[1:] != dates.month[:-1]]
+	months = dates.month.to_numpy()[:, None]
+	period = 12 // np.maximum(frequency, 1)
+	paid = first_days[:, None] & (frequency > 0) & ((months - first_month) % period == 0)
+
+	return np.where(paid, navs * yields / np.maximum(frequency, 1), 0)
+
+
+def simulate_orders(rng: np.random.Generator, portfolio: Portfolio, fin_objs: list[FinancialObject],
+					dates: pd.DatetimeIndex, navs: np.ndarray, nb_orders: int) -> list[Order]:
+	"""
+	Random orders of a portfolio on a subset of instruments, never selling more than the quantity held.
+	"""
+	universe = rng.choice(len(fin_objs), size=min(len(fin_objs), rng.integers(3, 16)), replace=False)
+	order_dates = np.sort(rng.integers(0, len(dates) - 1, nb_orders))
+	held = dict.fromkeys(universe.tolist(), 0)
+
+	orders = []
+	for i in order_dates.tolist():
+		j = int(rng.choice(universe))
+		price = navs[i, j]
+
+		if held[j] > 0 and rng.random() < 0.25:
+			direction = Order.OrderDirection.SELL
+			nb_items = int(rng.integers(1, held[j] + 1))
+			held[j] -= nb_items
+		else:
+			direction = Order.OrderDirection.BUY
+			nb_items = int(rng.integers(1, max(2, int(5000 // price))))
+			held[j] += nb_items
+
+		orders.append(Order(
+			date=dates[i].date(), portfolio=portfolio, id_object=fin_objs[j], direction=direction,
+			nb_items=nb_items, price=round(float(price), 4), total_fee=round(max(1.0, 0.005 * nb_items * price), 2)))
+
+	return orders
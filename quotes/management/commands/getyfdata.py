@@ -1,19 +1,36 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
 from quotes.models import FinancialObject, FinancialData, Portfolio
+from quotes.cache import bump_market_data_version
+from quotes.price_store import update_price_store
+from quotes.data_quality import scan_data_quality
 
 class Command(BaseCommand):
 	help="Download from YF api all necessary data to get portfolio time series"
 
 	def handle(self, *args, **options):
 
-		# Step 1: get all Financial Objects currently declared in DB
-		fin_objs = FinancialObject.objects.all()
+		# Step 1: get all Financial Objects currently declared in DB, that can be found on YF
+		fin_objs = FinancialObject.objects.exclude(ticker__isnull=True).exclude(ticker="")
 
 		# Step 2: is first time or not?
 		for fin_obj in fin_objs:
 			print(fin_obj.name)
 			fin_obj.update_nav_and_divs()
 
+		# Step 3: flag bad ticks among the new data, append it to the price store (rebuilt if older values are now
+		# excluded), cached analytics computed on previous data are now stale
+		scan = scan_data_quality()
+		update_price_store(full=scan.rebuild)
+		bump_market_data_version()
+
+		# Step 4: time series and weights of all portfolios in one batch, so that pages load from the cache
+		try:
+			call_command("recompute_analytics", stdout=self.stdout, stderr=self.stderr)
+		except CommandError as e:
+			# The data is ingested: analytics not computed here are computed on first use
+			self.stderr.write(self.style.ERROR(str(e)))
+
 
 
 
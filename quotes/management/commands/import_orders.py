@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from quotes.models import Portfolio
+from quotes.order_import import import_orders
+
+
+class Command(BaseCommand):
+	help = "Import the orders of a broker statement (CSV export) into a portfolio, all or nothing"
+
+	def add_arguments(self, parser):
+		parser.add_argument("portfolio", type=int, help="Id of the portfolio")
+		parser.add_argument("path", type=Path, help="CSV statement, with columns date, isin or ticker, direction, quantity, price and optionally fee")
+
+	def handle(self, *args, **options):
+		try:
+			portfolio = Portfolio.objects.get(id=options["portfolio"])
+		except Portfolio.DoesNotExist:
+			raise CommandError(f"No portfolio with id {options['portfolio']}.")
+
+		if not options["path"].exists():
+			raise CommandError(f"No file at {options['path']}.")
+
+		orders, errors = import_orders(portfolio, options["path"])
+		if errors:
+			for error in errors:
+				self.stdout.write(self.style.ERROR(error))
+			raise CommandError(f"Statement rejected with {len(errors)} error(s), no order was imported.")
+
+		self.stdout.write(self.style.SUCCESS(f"Imported {len(orders)} orders into {portfolio}"))
@@ -0,0 +1,170 @@
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from quotes.models import FinancialObject, FinancialData
+from quotes.cache import bump_market_data_version
+from quotes.price_store import update_price_store
+from quotes.data_quality import scan_data_quality
+
+PARQUET_SUFFIXES = {".parquet", ".pq"}
+
+
+def read_chunks(path: Path, chunk_size: int) -> Iterator[pd.DataFrame]:
+	"""
+	Stream a CSV (optionally compressed) or Parquet file by chunks of rows, with lower-case column names.
+	"""
+	if path.suffix.lower() in PARQUET_SUFFIXES:
+		try:
+			import pyarrow.parquet as pq
+		except ImportError:
+			raise CommandError("Reading Parquet files requires pyarrow (pip install pyarrow).")
+		chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size))
+	else:
+		chunks = pd.read_csv(path, chunksize=chunk_size, dtype=str)
+
+	for chunk in chunks:
+		chunk.columns = chunk.columns.str.strip().str.lower()
+		yield chunk
+
+
+def validate(chunk: pd.DataFrame, identifiers: dict[str, int], key: str, default_field: str, rejected: Counter, unknown: Counter) -> pd.DataFrame:
+	"""
+	Map identifiers to objects, parse and check values, and return the valid rows (id_object, date, field, value),
+	deduplicated on (id_object, date, field) by keeping the last one. Rejected rows are counted by reason.
+	"""
+	rows = pd.DataFrame({
+		"id_object": chunk[key].astype(str).str.strip().map(identifiers),
+		"date": pd.to_datetime(chunk["date"], errors="coerce").dt.normalize(),
+		"field": chunk["field"].astype(str).str.strip() if "field" in chunk else default_field,
+		"value": pd.to_numeric(chunk["value"], errors="coerce"),
+	})
+
+	checks = {
+		"unknown instrument": rows["id_object"].notna(),
+		"invalid date": rows["date"].notna(),
+		"unknown field": rows["field"].isin(FinancialData.TimeSeriesField.values),
+		"invalid value": np.isfinite(rows["value"]),
+		"non-positive price": (rows["field"] != FinancialData.TimeSeriesField.NAV) | (rows["value"] > 0),
+		"negative dividend": (rows["field"] != FinancialData.TimeSeriesField.Dividends) | (rows["value"] >= 0),
+	}
+
+	# Each rejected row is only counted once, for the first failed check
+	valid = pd.Series(True, index=rows.index)
+	for reason, check in checks.items():
+		failed = valid & ~check
+		rejected[reason] += int(failed.sum())
+		if reason == "unknown instrument":
+			unknown.update(chunk.loc[failed, key].astype(str).tolist())
+		valid &= check
+
+	rows = rows[valid].astype({"id_object": int})
+	nb_rows = len(rows)
+	rows = rows.drop_duplicates(subset=["id_object", "date", "field"], keep="last")
+	rejected["duplicate"] += nb_rows - len(rows)
+	return rows
+
+
+def upsert(rows: pd.DataFrame, origin: str, batch_size: int) -> tuple[int, int]:
+	"""
+	Write rows of a single origin in one transaction: existing (id_object, date, field) rows are replaced, whatever
+	their origin, so that a backfill does not leave two values for a key. Rows are inserted with executemany rather
+	than through model instances.
+	Returns the number of rows of new keys and of rows replacing existing keys (of one or several origins).
+	"""
+	existing = pd.DataFrame(list(
+		FinancialData.objects.filter(id_object__in=rows["id_object"].unique().tolist(), field__in=rows["field"].unique().tolist(),
+									 date__gte=rows["date"].min().date(), date__lte=rows["date"].max().date())
+		.order_by().values_list("id", "id_object", "date", "field")), columns=["id", "id_object", "date", "field"])
+	existing["date"] = pd.to_datetime(existing["date"])
+	matches = existing.merge(rows, on=["id_object", "date", "field"])
+	replaced = matches["id"].tolist()
+	nb_replaced = len(matches[["id_object", "date", "field"]].drop_duplicates())
+
+	# Replaced rows are deleted and inserted again, so that the price store picks them up as new rows
+	meta = FinancialData._meta
+	table = connection.ops.quote_name(meta.db_table)
+	columns = ", ".join(connection.ops.quote_name(meta.get_field(name).column) for name in ["id_object", "date", "field", "value", "origin"])
+	insert = f"INSERT INTO {table} ({columns}) VALUES (%s, %s, %s, %s, %s)"
+
+	params = list(zip(rows["id_object"].tolist(),
+					  [connection.ops.adapt_datefield_value(d) for d in rows["date"].dt.date],
+					  rows["field"].tolist(), rows["value"].tolist(), [origin] * len(rows)))
+
+	with transaction.atomic():
+		for i in range(0, len(replaced), batch_size):
+			FinancialData.objects.filter(id__in=replaced[i:i + batch_size]).delete()
+		with connection.cursor() as cursor:
+			for i in range(0, len(params), batch_size):
+				cursor.executemany(insert, params[i:i + batch_size])
+
+	return len(rows) - nb_replaced, nb_replaced
+
+
+class Command(BaseCommand):
+	help = "Stream historical prices and dividends from a CSV or Parquet file (columns: date, isin or ticker, value, optionally field) into the database"
+
+	def add_arguments(self, parser):
+		parser.add_argument("path", type=Path, help="CSV (possibly compressed) or Parquet (requires pyarrow) file")
+		parser.add_argument("--key", choices=["isin", "ticker"], default=None, help="Column identifying instruments (default: isin if present, else ticker)")
+		parser.add_argument("--field", choices=FinancialData.TimeSeriesField.values, default=FinancialData.TimeSeriesField.NAV,
+							help="Field of all rows, when the file has no field column")
+		parser.add_argument("--origin", choices=FinancialData.DataOrigin.values, default=FinancialData.DataOrigin.PROVIDER, help="Origin of the data")
+		parser.add_argument("--chunk-size", type=int, default=200_000, help="Rows read, validated and written at once")
+		parser.add_argument("--batch-size", type=int, default=10_000, help="Rows per database statement")
+		parser.add_argument("--dry-run", action="store_true", help="Only validate the file")
+
+	def handle(self, *args, **options):
+		path = options["path"]
+		if not path.exists():
+			raise CommandError(f"No file at {path}.")
+
+		rejected, unknown = Counter(), Counter()
+		nb_read = nb_inserted = nb_replaced = 0
+		start = time.perf_counter()
+		identifiers, key = None, options["key"]
+
+		for i, chunk in enumerate(read_chunks(path, options["chunk_size"]), start=1):
+			if identifiers is None:
+				key = key or ("isin" if "isin" in chunk else "ticker")
+				missing = {"date", "value", key} - set(chunk.columns)
+				if missing:
+					raise CommandError(f"Missing column(s) {', '.join(sorted(missing))} in {path}.")
+
+				objects = FinancialObject.objects.exclude(**{f"{key}__isnull": True}).exclude(**{key: ""})
+				identifiers = dict(objects.values_list(key, "id"))
+
+			chunk_start = time.perf_counter()
+			rows = validate(chunk, identifiers, key, options["field"], rejected, unknown)
+			nb_read += len(chunk)
+
+			if not rows.empty and not options["dry_run"]:
+				inserted, replaced = upsert(rows, options["origin"], options["batch_size"])
+				nb_inserted += inserted
+				nb_replaced += replaced
+
+			self.stdout.write(f"Chunk {i}: {len(chunk)} rows, {len(rows)} valid, "
+							  f"{len(chunk) / (time.perf_counter() - chunk_start):,.0f} rows/s")
+
+		elapsed = time.perf_counter() - start
+		if nb_inserted or nb_replaced:
+			scan = scan_data_quality()
+			update_price_store(full=scan.rebuild)
+			bump_market_data_version()
+
+		for reason, count in rejected.items():
+			if count:
+				self.stdout.write(self.style.WARNING(f"Rejected {count} rows: {reason}"))
+		if unknown:
+			self.stdout.write(self.style.WARNING(
+				f"Unknown {key}s: {', '.join(f'{id} ({count})' for id, count in unknown.most_common(10))}"
+				+ (f" and {len(unknown) - 10} more" if len(unknown) > 10 else "")))
+
+		action = "Validated" if options["dry_run"] else f"Inserted {nb_inserted} and replaced {nb_replaced} rows out of"
+		self.stdout.write(self.style.SUCCESS(
+			f"{action} {nb_read} rows in {elapsed:.1f}s ({nb_read / elapsed if elapsed else 0:,.0f} rows/s)"))
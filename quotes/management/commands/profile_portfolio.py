@@ -0,0 +1,140 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from quotes.models import Portfolio, FinancialData
+from quotes.profiling import record_queries
+
+
+class StackSampler(threading.Thread):
+	"""
+	Sample the stack of a thread at a fixed interval, and count identical stacks in collapsed format
+	("root;caller;callee" -> nb of samples), the input of flamegraph.pl and speedscope.
+	"""
+
+	def __init__(self, thread_id: int, interval: float):
+		super().__init__(daemon=True)
+		self.thread_id = thread_id
+		self.interval = interval
+		self.stage = None
+		self.stacks = Counter()
+		self._stop_event = threading.Event()
+
+	def run(self):
+		while not self._stop_event.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			stage = self.stage
+			if frame is None or stage is None:
+				continue
+
+			names = []
+			while frame is not None:
+				code = frame.f_code
+				names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+				frame = frame.f_back
+			self.stacks[";".join([stage] + names[::-1])] += 1
+
+	def stop(self):
+		self._stop_event.set()
+		self.join()
+
+
+class Command(BaseCommand):
+	help = "Run the analytics pipeline of one portfolio under cProfile, with per-stage timings and flamegraph stacks"
+
+	def add_arguments(self, parser):
+		parser.add_argument("id", type=int, help="Id of the portfolio")
+		parser.add_argument("--output-dir", type=Path, default=None, help="Where to write the profiles (default: profile_portfolio_<id>)")
+		parser.add_argument("--sql", action="store_true", help="Also write the SQL queries of each stage")
+		parser.add_argument("--interval", type=float, default=1, help="Stack sampling interval for the flamegraph, in ms")
+		parser.add_argument("--days", type=int, default=365, help="Length of the contribution period ending on the most recent price date")
+
+	def handle(self, *args, **options):
+		# Imported here, as the Dash app is only needed for this stage
+		from quotes.dash_app_portfolio import performance_overview
+
+		try:
+			ptf = Portfolio.objects.get(id=options["id"])
+		except Portfolio.DoesNotExist:
+			raise CommandError(f"No portfolio with id {options['id']}.")
+
+		output_dir = options["output_dir"] or Path(f"profile_portfolio_{ptf.id}")
+		output_dir.mkdir(parents=True, exist_ok=True)
+
+		latest_date = FinancialData.get_price_most_recent_date()
+		start_date = latest_date - timedelta(days=options["days"])
+
+		stages = [
+			("get_inventory", lambda: ptf.get_inventory(latest_date)),
+			("get_TS", lambda: ptf.get_TS()),
+			("get_weights", lambda: ptf.get_weights()),
+			("performance_overview", lambda: performance_overview(ptf.id)),
+			("contributions", lambda: ptf.get_individual_returns(start_date, latest_date)),
+		]
+
+		sampler = StackSampler(threading.get_ident(), options["interval"] / 1000)
+		switch_interval = sys.getswitchinterval()
+		# Let the sampler take the GIL as often as it wants to sample
+		sys.setswitchinterval(min(switch_interval, options["interval"] / 1000))
+		sampler.start()
+
+		rows = []
+		try:
+			for i, (name, stage) in enumerate(stages, start=1):
+				profiler = cProfile.Profile()
+
+				# Only record statements when asked, it slows queries down
+				capture = CaptureQueriesContext(connection) if options["sql"] else nullcontext()
+
+				with record_queries() as stats, capture as captured:
+					sampler.stage = name
+					start, cpu_start = time.perf_counter(), time.process_time()
+					profiler.enable()
+					try:
+						stage()
+					finally:
+						profiler.disable()
+						wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+						sampler.stage = None
+
+				profiler.dump_stats(output_dir / f"{i:02d}_{name}.prof")
+				if options["sql"]:
+					with open(output_dir / f"{i:02d}_{name}.sql", "w") as f:
+						for query in captured.captured_queries:
+							f.write(f"-- {query['time']}s\n{query['sql']};\n")
+
+				rows.append((name, wall, cpu, stats.count, stats.duration, stats.rows))
+		finally:
+			sampler.stop()
+			sys.setswitchinterval(switch_interval)
+
+		with open(output_dir / f"portfolio_{ptf.id}.collapsed", "w") as f:
+			for stack, count in sampler.stacks.most_common():
+				f.write(f"{stack} {count}\n")
+
+		table = self.timing_table(rows)
+		(output_dir / "timings.txt").write_text(table)
+		self.stdout.write(table)
+		self.stdout.write(f"Profiles written to {output_dir}/ (open .prof files with snakeviz or pstats, "
+						  f"render portfolio_{ptf.id}.collapsed with flamegraph.pl or speedscope)")
+
+	@staticmethod
+	def timing_table(rows: list[tuple]) -> str:
+		header = f"{'stage':<22}{'wall (s)':>10}{'cpu (s)':>10}{'queries':>9}{'sql (s)':>10}{'rows':>10}"
+		lines = [header, "-" * len(header)]
+		for name, wall, cpu, queries, sql, nb_rows in rows:
+			lines.append(f"{name:<22}{wall:>10.3f}{cpu:>10.3f}{queries:>9}{sql:>10.3f}{nb_rows:>10}")
+
+		lines.append("-" * len(header))
+		lines.append(f"{'total':<22}{sum(r[1] for r in rows):>10.3f}{sum(r[2] for r in rows):>10.3f}"
+					 f"{sum(r[3] for r in rows):>9}{sum(r[4] for r in rows):>10.3f}{sum(r[5] for r in rows):>10}")
+		return "\n".join(lines) + "\n"
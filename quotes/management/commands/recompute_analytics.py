@@ -0,0 +1,112 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import django
+import pandas as pd
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from quotes.analytics import get_series_versions, set_portfolio_series, set_portfolio_weights, to_series_frame
+from quotes.consolidation import compute_consolidation, get_owners, set_consolidation
+from quotes.corporate_actions import get_adjustment_factors
+from quotes.models import Portfolio, Order, FinancialObject, FinancialData, YahooFinanceQuery, CashMovement
+
+# Price and dividend matrices of all instruments, set once in each worker process
+_prices: pd.DataFrame | None = None
+_dividends: pd.DataFrame | None = None
+
+
+def init_worker(prices: pd.DataFrame, dividends: pd.DataFrame):
+	global _prices, _dividends
+	# Workers started with spawn (ex. macOS) import the models again
+	if not apps.ready:
+		django.setup()
+	_prices, _dividends = prices, dividends
+
+
+def compute_portfolio(portfolio_id: int, ledger: pd.DataFrame, movements: pd.DataFrame, until_date) -> tuple[int, tuple | None, str | None, float]:
+	"""
+	Time series and weights of a portfolio from its ledger, its cash movements and the shared matrices, without
+	database access. Returns (portfolio id, (series, weights), error, elapsed seconds).
+	"""
+	start = time.perf_counter()
+	try:
+		series = to_series_frame(*Portfolio.compute_TS(ledger, _prices, until_date, _dividends, movements))
+		weights = Portfolio.compute_weights(ledger, _prices)
+		return portfolio_id, (series, weights), None, time.perf_counter() - start
+	except Exception as e:
+		return portfolio_id, None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+class Command(BaseCommand):
+	help = "Recompute the cached analytics (time series and weights) of all portfolios over a process pool, and the consolidated views, ex. after getyfdata"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+		parser.add_argument("--batch-size", type=int, default=50, help="Results written to the cache at once")
+		parser.add_argument("--portfolios", type=int, nargs="+", default=None, help="Ids of the portfolios (default: all)")
+
+	def handle(self, *args, **options):
+		start = time.perf_counter()
+		versions = get_series_versions()
+		until_date = datetime.today().date()
+
+		# All ledgers in one query, split by portfolio
+		orders = Order.objects.all() if options["portfolios"] is None else Order.objects.filter(portfolio__in=options["portfolios"])
+		columns = ["portfolio", "date", "id_object", "direction", "nb_items", "price", "total_fee"]
+		ledgers = pd.DataFrame(list(orders.order_by("date").values(*columns)), columns=columns)
+		if ledgers.empty:
+			raise CommandError("No orders to compute analytics from.")
+
+		# Quantities in current units, as prices
+		ledgers = get_adjustment_factors().adjust_ledger(ledgers)
+
+		# Prices and dividends of every instrument ever held, loaded once and shared by the workers
+		fin_objs = list(FinancialObject.objects.filter(id__in=ledgers["id_object"].unique().tolist()))
+		prices = YahooFinanceQuery.get_price_matrix(fin_objs, ledgers["date"].min(), until_date)
+		dividends = YahooFinanceQuery.get_price_matrix(fin_objs, ledgers["date"].min(), until_date, FinancialData.TimeSeriesField.Dividends)
+		movements = CashMovement.objects.all() if options["portfolios"] is None else CashMovement.objects.filter(portfolio__in=options["portfolios"])
+		movements = CashMovement.signed_amounts(movements)
+		self.stdout.write(f"Loaded {len(ledgers)} orders and {prices.shape[0]} dates x {prices.shape[1]} instruments "
+						  f"in {time.perf_counter() - start:.2f}s")
+
+		# Forked workers must not share the database connections of the parent
+		connections.close_all()
+
+		groups = ledgers.groupby("portfolio")
+		results, weights, errors, nb_done = {}, {}, [], 0
+		with ProcessPoolExecutor(max_workers=options["workers"], initializer=init_worker, initargs=(prices, dividends)) as executor:
+			futures = [executor.submit(compute_portfolio, portfolio_id, ledger.drop(columns="portfolio"),
+									   movements[movements["portfolio"] == portfolio_id], until_date)
+					   for portfolio_id, ledger in groups]
+
+			for future in as_completed(futures):
+				portfolio_id, result, error, elapsed = future.result()
+				nb_done += 1
+
+				if error:
+					errors.append((portfolio_id, error))
+					self.stdout.write(self.style.ERROR(f"[{nb_done}/{len(futures)}] portfolio {portfolio_id} failed in {elapsed:.3f}s: {error}"))
+				else:
+					results[portfolio_id], weights[portfolio_id] = result
+					self.stdout.write(f"[{nb_done}/{len(futures)}] portfolio {portfolio_id} in {elapsed:.3f}s")
+
+				if len(results) >= options["batch_size"]:
+					set_portfolio_series(results, versions)
+					set_portfolio_weights(weights, versions)
+					results, weights = {}, {}
+
+		set_portfolio_series(results, versions)
+		set_portfolio_weights(weights, versions)
+
+		# Consolidated views of all owners, from the same ledgers and prices
+		if options["portfolios"] is None:
+			names = {obj.id: obj.name for obj in fin_objs}
+			set_consolidation(compute_consolidation(ledgers, prices, get_owners(), names, dividends, movements), versions)
+
+		message = f"Recomputed {len(futures) - len(errors)} of {len(futures)} portfolios in {time.perf_counter() - start:.2f}s"
+		if errors:
+			raise CommandError(f"{message}, {len(errors)} failed")
+		self.stdout.write(self.style.SUCCESS(message))
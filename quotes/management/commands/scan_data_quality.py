@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from quotes.cache import bump_market_data_version
+from quotes.data_quality import scan_data_quality
+from quotes.price_store import update_price_store
+
+
+class Command(BaseCommand):
+	help = "Flag bad ticks (spikes, non positive values, duplicates, flat runs, gaps) in NAV rows inserted since the last scan"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--full", action="store_true", help="Rescan all rows, ex. after changing the thresholds")
+
+	def handle(self, *args, **options):
+		start = time.perf_counter()
+		scan = scan_data_quality(full=options["full"])
+		elapsed = time.perf_counter() - start
+
+		for check, count in scan.flags.items():
+			self.stdout.write(f"{check}: {count}")
+
+		# Values excluded from analytics change prices as read by YahooFinanceQuery
+		if scan.flags or scan.rebuild:
+			update_price_store(full=scan.rebuild)
+			bump_market_data_version()
+
+		self.stdout.write(self.style.SUCCESS(
+			f"Scanned {scan.nb_rows} rows in {elapsed:.2f}s ({scan.nb_rows / max(elapsed, 1e-9):,.0f} rows/s), "
+			f"{sum(scan.flags.values())} flags"))
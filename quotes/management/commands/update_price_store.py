@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from quotes.price_store import get_store_dir, update_price_store, PriceStore
+
+
+class Command(BaseCommand):
+	help = "Bring the memory-mapped price store (settings.PRICE_STORE_DIR) up to date with the database"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--full", action="store_true", help="Rebuild the whole store, ex. after rows were updated or deleted")
+
+	def handle(self, *args, **options):
+		if get_store_dir() is None:
+			raise CommandError("PRICE_STORE_DIR is not set, there is no price store to update.")
+
+		start = time.perf_counter()
+		update_price_store(full=options["full"])
+		store = PriceStore.open()
+
+		self.stdout.write(self.style.SUCCESS(
+			f"Price store at {store.path} holds {store.meta['n_dates']} dates x {store.meta['n_instruments']} instruments "
+			f"(updated in {time.perf_counter() - start:.2f}s)"))
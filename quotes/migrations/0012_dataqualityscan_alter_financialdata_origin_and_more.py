@@ -0,0 +1,43 @@
+# Generated by Django 4.2.14 on 2026-10-19 04:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0011_alter_financialdata_options_alter_order_portfolio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataQualityScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('finished_at', models.DateTimeField(auto_now_add=True)),
+                ('full', models.BooleanField(default=False)),
+                ('last_row_id', models.IntegerField()),
+                ('nb_rows', models.IntegerField()),
+                ('nb_flags', models.IntegerField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='financialdata',
+            name='origin',
+            field=models.CharField(choices=[('Yahoo Finance', 'Yf'), ('Provider', 'Provider'), ('Financial Times', 'Ft')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='DataQualityFlag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('Non positive', 'Non Positive'), ('Duplicate', 'Duplicate'), ('Spike', 'Spike'), ('Jump', 'Jump'), ('Flat run', 'Flat'), ('Gap', 'Gap')], max_length=15)),
+                ('score', models.FloatField(blank=True, null=True)),
+                ('data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quality_flags', to='quotes.financialdata')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dataqualityflag',
+            constraint=models.UniqueConstraint(fields=('data', 'kind'), name='unique_data_kind'),
+        ),
+    ]
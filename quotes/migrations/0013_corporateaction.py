@@ -0,0 +1,43 @@
+# Generated by Django 4.2.14 on 2026-10-19 04:18
+
+from datetime import date
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def record_isin_changes(apps, schema_editor):
+    """
+    ISIN change formerly hard-coded in FinancialObject.update_nav_and_divs.
+    """
+    FinancialObject = apps.get_model("quotes", "FinancialObject")
+    CorporateAction = apps.get_model("quotes", "CorporateAction")
+    for fin_obj in FinancialObject.objects.filter(isin="LU1834983477"):
+        CorporateAction.objects.get_or_create(id_object=fin_obj, date=date(2022, 1, 19), action="ISIN change",
+                                              defaults={"ratio": 1, "new_isin": "LU1834983477"})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0012_dataqualityscan_alter_financialdata_origin_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorporateAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('action', models.CharField(choices=[('Split', 'Split'), ('Reverse split', 'Reverse Split'), ('ISIN change', 'Isin Change')], max_length=15)),
+                ('ratio', models.FloatField(default=1)),
+                ('old_isin', models.CharField(blank=True, default='', max_length=12)),
+                ('new_isin', models.CharField(blank=True, default='', max_length=12)),
+                ('id_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='corporate_actions', to='quotes.financialobject')),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.RunPython(record_isin_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.14 on 2026-10-19 04:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0013_corporateaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TargetWeight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.FloatField()),
+                ('id_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quotes.financialobject')),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='target_weights', to='quotes.portfolio')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='targetweight',
+            constraint=models.UniqueConstraint(fields=('portfolio', 'id_object'), name='unique_portfolio_target'),
+        ),
+    ]
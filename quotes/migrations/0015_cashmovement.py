@@ -0,0 +1,27 @@
+# Generated by Django 4.2.14 on 2026-10-19 04:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0014_targetweight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CashMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('Deposit', 'Deposit'), ('Withdrawal', 'Withdrawal')], max_length=10)),
+                ('amount', models.FloatField()),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cash_movements', to='quotes.portfolio')),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+    ]
@@ -3,14 +3,15 @@ django_stubs_ext.monkeypatch()
 
 from typing import Iterable
 from django.db import models
-import yfinance as yf
-from datetime import date, datetime, time
+from datetime import date, datetime, time, timedelta
 import pandas as pd
 import numpy as np
 import warnings
-warnings.filterwarnings("error")
+# Warnings raised from this app (ex. pandas deprecations) are errors, third-party ones are left alone
+warnings.filterwarnings("error", module="quotes")
 from dataclasses import dataclass
 from typing import Self
+from quotes.alignment import AlignedPrices, align_prices
 
 class FinancialObject(models.Model):
     
@@ -42,6 +43,8 @@ class FinancialObject(models.Model):
         """
         Updates time series
         """
+        # Only ingestion needs yfinance, which is slow to import
+        import yfinance as yf
 
         stock = yf.Ticker(self.ticker)
         data = []
@@ -66,8 +69,13 @@ class FinancialObject(models.Model):
 
         else:
             last_date = self.get_latest_available_nav()
-            if self.isin == "LU1834983477":
-                  last_date = date(2022,1,19)
+            stored_dates = set()
+            # After an ISIN change, the history of the new line is downloaded again from the change date,
+            # without the dates already stored
+            isin_change = self.corporate_actions.filter(action=CorporateAction.Action.ISIN_CHANGE).order_by("-date").first()
+            if isin_change is not None and isin_change.date < last_date:
+                  last_date = isin_change.date
+                  stored_dates = set(FinancialData.objects.filter(id_object=self, date__gt=last_date).values_list("date", "field"))
             df = stock.history(start=datetime.combine(last_date, time.min),
                                end=datetime.now())
 
@@ -80,7 +88,7 @@ class FinancialObject(models.Model):
             divs = list(df["Dividends"][df["Dividends"] != 0].items()) #type: ignore
 
             for i,price in prices:
-                if i.date() == last_date:
+                if i.date() == last_date or (i.date(), "NAV") in stored_dates:
                     continue
                 new = FinancialData(id_object=self, date=i.date(), field="NAV", value=price, origin="Yahoo Finance")
                 data.append(new)
@@ -89,7 +97,7 @@ class FinancialObject(models.Model):
 
             data = []
             for i, div in divs:
-                if i.date() == last_date:
+                if i.date() == last_date or (i.date(), "Dividends") in stored_dates:
                     continue
                 new = FinancialData(id_object=self, date=i.date(), field="Dividends", value=div, origin="Yahoo Finance")
                 data.append(new)
@@ -213,7 +221,12 @@ class PortfolioInventory:
 
     @property
     def weights(self) -> dict[FinancialObject, float]:
-        pass
+        """
+        Weight of each object in the value of the inventory, at the most recent prices.
+        """
+        prices = YahooFinanceQuery.get_latest_prices(self.fin_objs, FinancialData.get_price_most_recent_date())
+        amounts = prices.to_numpy() * np.array(self.nbs, dtype=float)
+        return dict(zip(self.fin_objs, amounts / np.nansum(amounts)))
 
     def to_df(self) -> pd.DataFrame:
         """
@@ -234,6 +247,8 @@ class Portfolio(models.Model):
     ts_ret = None
     ts_val = None
     ts_cumul_ret = None
+    ts_cash = None
+    ts_external = None
 
     def __str__(self):
         return f"{self.owner} - {self.name}"
@@ -256,12 +271,21 @@ class Portfolio(models.Model):
     def get_inventory(self, date=datetime.today()) -> PortfolioInventory:
         """
         Given a date, return a list of Portfolio Entries with current inventory.
+        Numbers and PRUs are in current units, after all recorded corporate actions.
         """        
-        all_orders = self.orders.filter(date__lte=date).order_by("date")
+        from quotes.corporate_actions import get_adjustment_factors
+
+        all_orders = self.orders.filter(date__lte=date).select_related("id_object").order_by("date")
+        factors = get_adjustment_factors()
         
         curr_inventory: PortfolioInventory = []
 
         for order in all_orders:
+            # Orders placed before a split are replayed as if on the shares of today (instances are not saved)
+            factor = factors.factor(order.id_object_id, order.date)
+            if factor != 1:
+                order.nb_items, order.price = order.nb_items * factor, order.price / factor
+
             if curr_inventory and order.id_object.id in [entry.fin_obj.id for entry in curr_inventory]:
                 # Inventory not empty and Financial Instrument already in Portfolio
                 for entry in curr_inventory:
@@ -275,100 +299,112 @@ class Portfolio(models.Model):
 
     def get_weights(self) -> dict[str, float]:
         """
-        Returns dictionary {FinancialInstrument: weight} for most recent portfolio data
+        Returns dictionary {object name: weight} for most recent portfolio data
         """
+        inventory = self.get_inventory(FinancialData.get_price_most_recent_date())
+        return {obj.name: weight for obj, weight in inventory.weights.items()}
 
-        most_recent_date = FinancialData.get_price_most_recent_date()
-        
-        inventory = self.get_inventory(most_recent_date)
-        
-        # Get NAV df
-        qs = [FinancialData.objects\
-                    .filter(id_object=obj, field="NAV", origin="Yahoo Finance", date=most_recent_date)\
-                    .values_list("value", flat=True) for obj in inventory.fin_objs]
-        
-        # Evaluate Query set to only have lists
-        qs = [list(q) for q in qs]
 
-        # unlist
-        prices = [x for xs in qs for x in xs]
-        
-        amounts = [price * nb for price, nb in zip(prices, inventory.nbs)]
+    def get_ledger(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Orders of the portfolio (columns date, id_object, direction, nb_items, price, total_fee) in current units,
+        and the prices of all instruments ever held from the first order until today, loaded with a single query.
+        """
+        from quotes.corporate_actions import get_adjustment_factors
+
+        columns = ["date", "id_object", "direction", "nb_items", "price", "total_fee"]
+        ledger = pd.DataFrame(list(self.orders.values(*columns)), columns=columns)
 
-        return {k: v/sum(amounts) for k,v in zip(inventory.names, amounts)}
+        if ledger.empty:
+            raise Exception("No order data.")
+
+        # Quantities in current units, as prices
+        ledger = get_adjustment_factors().adjust_ledger(ledger)
 
+        fin_objs = list(FinancialObject.objects.filter(id__in=ledger["id_object"].unique().tolist()))
+        prices = YahooFinanceQuery.get_price_matrix(fin_objs, ledger["date"].min(), datetime.today().date())
+        return ledger, prices
+
+    def get_cash_flows(self, ledger: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Dividends per share (dates x object ids) of the objects of a ledger since its first order, and the deposits
+        (positive) and withdrawals (negative) of the portfolio, with columns date, amount.
+        """
+        fin_objs = list(FinancialObject.objects.filter(id__in=ledger["id_object"].unique().tolist()))
+        dividends = YahooFinanceQuery.get_price_matrix(fin_objs, ledger["date"].min(), datetime.today().date(),
+                                                       FinancialData.TimeSeriesField.Dividends)
+        return dividends, CashMovement.signed_amounts(self.cash_movements.all())
 
     def get_TS(self) -> None:
         """
         Returns the time series of the portfolio since its inception
         """
-        # Retrieve all orders
-        all_order_dates = set([order.date for order in self.orders.all()])
-        all_order_dates = sorted(all_order_dates, reverse=False)
-
-        if len(all_order_dates) == 0:
-            raise Exception("No order data.")
+        ledger, prices = self.get_ledger()
+        dividends, movements = self.get_cash_flows(ledger)
+        self.ts_val, self.ts_ret, self.ts_cumul_ret, self.ts_cash, self.ts_external = \
+            Portfolio.compute_TS(ledger, prices, datetime.today().date(), dividends, movements)
 
-        # Add today so that the time series is computed until today
-        all_order_dates.append(datetime.today().date())
+    @staticmethod
+    def compute_TS(ledger: pd.DataFrame, prices: pd.DataFrame, until_date: date, dividends: pd.DataFrame | None = None,
+                   movements: pd.DataFrame | None = None) -> tuple[pd.Series, pd.Series, pd.Series, pd.Series, pd.Series]:
+        """
+        Value, return, cumulative return, cash and cumulative net external flows time series of a portfolio,
+        without database access.
+
+        The value includes the cash of the account (see quotes.cash), and returns are time-weighted.
+        Changes in number of stocks only come into effect at the end of the day when the order was placed.
+
+        Args:
+            ledger: orders of the portfolio, with columns date, id_object, direction, nb_items, price, total_fee
+            prices: NAV (dates x object ids) of the ledger objects, at least from the first order date until until_date
+            until_date: end of the time series
+            dividends: dividends per share (dates x object ids) of the ledger objects
+            movements: deposits (positive) and withdrawals (negative), with columns date, amount
+        """
+        from quotes.cash import cash_ledger, value_series
 
-        ts = []
-        ts_ret = []
+        # Common calendar of all instruments from the first order, with quotes carried over the days an instrument is not quoted
+        aligned = align_prices(prices)
+        kept = (aligned.prices.index >= ledger["date"].min()) & (aligned.prices.index <= until_date)
+        aligned = AlignedPrices(aligned.prices[kept], aligned.gaps[kept], aligned.stale[kept])
+        dates = aligned.prices.index
 
-        for i, order_date in enumerate(all_order_dates):
-            if i == 0:
-                continue
+        holdings = Portfolio.compute_holdings(ledger, dates).reindex(columns=aligned.prices.columns, fill_value=0)
+        held = holdings != 0
+        for id_object in holdings.columns[held.any() & ~(held & ~aligned.gaps).any()]:
+            raise ValueError(f"No data for object {id_object} while it is held.")
 
-            start = all_order_dates[i-1]
-            inventory = self.get_inventory(start)
-            prices_df = YahooFinanceQuery.get_prices_from_inventory(fin_objs = inventory.fin_objs,
-                                                                 from_date = start,
-                                                                 until_date = order_date)
+        cash = cash_ledger(dates, ledger, holdings, dividends, movements)
+        return value_series(holdings.to_numpy(), aligned, cash["cash"].to_numpy(), cash["external"].to_numpy())
 
-            # Make inventory a 2d numpy array
-            inventory = np.array(inventory.nbs)
-            
-            ##### Return computation
-            # Approximation: change in number of stocks only come into
-            # effect at the end of the day when the order was placed.
-            
-            # Remove rows with NA, compute returns and remove first NA row
-            prices_without_na = prices_df.dropna(axis=0, how="any")
-            rets = prices_without_na.pct_change()[1:]
-
-            # EUR amount in each stock is stock_price x nb_stock
-            # Dimensions: (n_stocks, 1) = (n_dates -1, n_stocks) x (1, n_stocks)
-            amount_per_stock = prices_without_na[:-1] * inventory
-            
-
-            # div because element-wise division
-            weights = amount_per_stock.div(amount_per_stock.sum(axis=1), axis=0)
-            
-            # Keep rets date index
-            ptf_ret = (rets * weights.set_index(rets.index)).sum(axis=1)        
+    @staticmethod
+    def compute_weights(ledger: pd.DataFrame, prices: pd.DataFrame) -> pd.DataFrame:
+        """
+        Weight of each object (dates x object ids) in the value of a portfolio, without database access.
 
-            ts_ret.append(ptf_ret)
+        Args:
+            ledger: orders of the portfolio, with columns date, id_object, direction, nb_items
+            prices: NAV (dates x object ids) of the ledger objects, from the first order date
+        """
+        aligned = align_prices(prices)
+        dates = aligned.prices.index[aligned.prices.index >= ledger["date"].min()]
+        holdings = Portfolio.compute_holdings(ledger, dates)
 
-            ##### Portfolio TS computation
-            # matrix multiplication
-            if i == len(all_order_dates) -1:
-                # last one
-                ts.append(prices_without_na.dot(inventory))
-            else:
-                ts.append(prices_without_na.dot(inventory).iloc[:-1])
-            
+        amounts = holdings * aligned.prices.loc[dates, holdings.columns]
+        return amounts.div(amounts.sum(axis=1, min_count=1), axis=0).dropna(how="all")
 
-        self.ts_ret = pd.concat(ts_ret, axis=0).squeeze()
-        self.ts_val = pd.concat(ts, axis=0).squeeze()
-        self.ts_cumul_ret = pd.concat([
-            self.ts_ret.add(1), 
-            pd.Series([1], index=[all_order_dates[0]])
-            ])
-        self.ts_cumul_ret.sort_index(inplace=True)
-        self.ts_cumul_ret = self.ts_cumul_ret.cumprod()
+    @staticmethod
+    def compute_holdings(ledger: pd.DataFrame, dates) -> pd.DataFrame:
+        """
+        Number of items of each object held (dates x object ids) at the end of each date, without database access.
 
-        self.ts_val.to_excel("TS_val.xlsx")
-        self.ts_ret.to_excel("TS_ret.xlsx")
+        Args:
+            ledger: orders of the portfolio, with columns date, id_object, direction, nb_items
+        """
+        signed = ledger["nb_items"].where(ledger["direction"] == Order.OrderDirection.BUY, -ledger["nb_items"])
+        # Rounded as in compute_TS
+        holdings = signed.groupby([ledger["date"], ledger["id_object"]]).sum().unstack(fill_value=0).cumsum().round(8)
+        return holdings.reindex(holdings.index.union(dates)).ffill().reindex(dates).fillna(0)
 
     def get_individual_returns(self, start_date: str, end_date: str) -> pd.DataFrame:
         """
@@ -381,43 +417,95 @@ class Portfolio(models.Model):
         fin_ins.extend([ord.id_object for ord in subsequent_orders])
         all_fin_instr = list(set(fin_ins))
 
-        # Load Time Series during the time frame
+        # Load Time Series during the time frame, on the common calendar of the instruments
         prices = YahooFinanceQuery.get_prices_from_inventory(fin_objs = all_fin_instr, from_date = start_date, until_date = end_date)        
-        prices.index = pd.to_datetime(prices.index)
         divs = YahooFinanceQuery.get_divs_from_inventory(fin_objs = all_fin_instr, from_date = start_date, until_date = end_date)
-        divs.index = pd.to_datetime(divs.index)
-
-        available_start_date = prices.index[0]
-        available_end_date = prices.index[-1]
+        aligned = align_prices(prices)
 
-        rets = dict()
+        # First and last dates on which all instruments have a price
+        priced = aligned.prices[aligned.priced()]
+        if priced.empty:
+            raise ValueError(f"No date between {start_date} and {end_date} on which all instruments have a price.")
+        start_prices, end_prices = priced.iloc[0], priced.iloc[-1]
 
-        for fin in all_fin_instr:
-            # quantity did not vary during time frame
-            price_ret_tf = prices.loc[available_end_date][fin.name] / prices.loc[available_start_date][fin.name] - 1
-            div_ret_tf = sum(divs[fin.name]) / prices[fin.name][available_start_date]
-            total_ret_tf = price_ret_tf + div_ret_tf
-            
-            rets[fin.name] = [price_ret_tf, div_ret_tf, total_ret_tf]
+        # quantity did not vary during time frame
+        price_ret_tf = end_prices / start_prices - 1
+        div_ret_tf = divs.sum().reindex(price_ret_tf.index, fill_value=0) / start_prices
+        rets = pd.DataFrame({"Price": price_ret_tf, "Dividends": div_ret_tf, "Total": price_ret_tf + div_ret_tf})
 
-        return pd.DataFrame.from_dict(rets, orient="index", columns=["Price", "Dividends", "Total"])
+        return rets
 
 class YahooFinanceQuery:
 
+    @staticmethod
+    def get_price_store(fin_objs: list[FinancialObject]):
+        """
+        The memory-mapped price store (see quotes.price_store), if there is one and it holds all objects.
+        """
+        from quotes.price_store import PriceStore
+        store = PriceStore.open()
+        return store if store is not None and store.covers([obj.id for obj in fin_objs]) else None
+
+    @staticmethod
+    def get_price_matrix(fin_objs: list[FinancialObject], from_date: date, until_date: date, field: str = "NAV") -> pd.DataFrame:
+        """
+        Queries the database once for all objects, and returns dataframe (dates x object ids).
+        Dates on which an object has no value are NaN. Values are adjusted for corporate actions.
+        """
+        from quotes.corporate_actions import get_adjustment_factors
+
+        ids = [obj.id for obj in fin_objs]
+        store = YahooFinanceQuery.get_price_store(fin_objs) if field == FinancialData.TimeSeriesField.NAV else None
+        if store is not None:
+            return get_adjustment_factors().adjust_matrix(store.get_matrix(ids, from_date, until_date, field), ids)
+
+        rows = FinancialData.valid().filter(id_object__in=ids, field=field, date__gte=from_date, date__lte=until_date)\
+            .order_by().values_list("date", "id_object", "value")
+
+        matrix = pd.DataFrame(list(rows), columns=["date", "id_object", "value"])\
+            .pivot_table(index="date", columns="id_object", values="value", aggfunc="last")
+
+        # Objects without any data still get a (NaN) column, in the requested order
+        return get_adjustment_factors().adjust_matrix(matrix.reindex(columns=ids).sort_index(), ids)
+
+    @staticmethod
+    def get_latest_prices(fin_objs: list[FinancialObject], on_date: date, lookback_days: int = 30) -> pd.Series:
+        """
+        Price of each object (by id) on a date. Objects not quoted that day get their last quote, within the
+        staleness limit of quotes.alignment, and NaN beyond.
+        """
+        ids = [obj.id for obj in fin_objs]
+        prices = align_prices(YahooFinanceQuery.get_price_matrix(fin_objs, on_date - timedelta(days=lookback_days), on_date)).prices
+        return prices.iloc[-1].reindex(ids) if len(prices) else pd.Series(np.nan, index=ids)
+
     @staticmethod
     def get_prices_from_inventory(fin_objs: list[FinancialObject], from_date: date, until_date: date) -> pd.DataFrame:
         """
-        Queries the database for prices, and returns dataframe (objs x dates)
+        Queries the database for prices, and returns dataframe (objs x dates), adjusted for corporate actions
         """
+        from quotes.corporate_actions import get_adjustment_factors
+
         if not all(isinstance(x, FinancialObject) for x in fin_objs):
               raise TypeError(f"Not a list of Financial Objects:{type(fin_objs[0])}")
+
+        factors = get_adjustment_factors()
+        store = YahooFinanceQuery.get_price_store(fin_objs)
+        if store is not None:
+            prices = store.get_matrix([obj.id for obj in fin_objs], from_date, until_date, FinancialData.TimeSeriesField.NAV)
+            prices = factors.adjust_matrix(prices)
+            for obj in fin_objs:
+                if prices[obj.id].isna().all():
+                    raise ValueError(f"No data for {obj.name} (ISIN is {obj.isin}) between "
+                                     f"{from_date} and {until_date}.")
+            prices.columns = [obj.name for obj in fin_objs]
+            return prices
         
         def query_price_from_db(obj: FinancialObject, from_date: date, until_date: date) -> pd.DataFrame:
             """
             Query the database for prices of a single financial object
             """
             df = pd.DataFrame(list(
-                FinancialData.objects.filter(id_object=obj.id, field="NAV", date__gte=from_date, date__lte=until_date)
+                FinancialData.valid().filter(id_object=obj.id, field="NAV", date__gte=from_date, date__lte=until_date)
                 .values("date", "value")))
             
             if df.empty:
@@ -443,19 +531,31 @@ class YahooFinanceQuery:
         # => messes up return calculation
         prices.sort_index(inplace=True)
 
-        return prices
+        return factors.adjust_matrix(prices, [obj.id for obj in fin_objs])
     
     @staticmethod
     def get_divs_from_inventory(fin_objs: list[FinancialObject], from_date: str, until_date: str) -> pd.DataFrame:
 
         if not all(isinstance(x, FinancialObject) for x in fin_objs):
               raise TypeError(f"Not a list of Financial Objects:{type(fin_objs[0])}")
+
+        from quotes.corporate_actions import get_adjustment_factors
+
+        # Dividends are per share: adjusted as prices
+        factors = get_adjustment_factors()
+        store = YahooFinanceQuery.get_price_store(fin_objs)
+        if store is not None:
+            divs = store.get_matrix([obj.id for obj in fin_objs], from_date, until_date, FinancialData.TimeSeriesField.Dividends)
+            divs = factors.adjust_matrix(divs)
+            divs.columns = [obj.name for obj in fin_objs]
+            return divs.fillna(0)
         
-        # Query prices
+        # Query dividends of all origins, the last one inserted on dates with several, as get_price_matrix
         dfs = [pd.DataFrame(list(
-                FinancialData.objects.filter(
-                      id_object=obj.id, field=FinancialData.TimeSeriesField.Dividends, origin="Yahoo Finance", date__gte=from_date, date__lte=until_date)
-                .values("date", "value"))) for obj in fin_objs]
+                FinancialData.valid().filter(
+                      id_object=obj.id, field=FinancialData.TimeSeriesField.Dividends, date__gte=from_date, date__lte=until_date)
+                .order_by("date", "id").values("date", "value")), columns=["date", "value"])
+               .drop_duplicates("date", keep="last") for obj in fin_objs]
 
         # ISSUE IS HERE => PUT 0 WHEN NO DIVIDEND WAS PROVIDED
         # Adjust dfs to series with date index and relevant column names 
@@ -465,7 +565,7 @@ class YahooFinanceQuery:
                 df = pd.Series(data=df.squeeze(), index=df.index, name=fin_objs[i].name) if df.shape == (1,1) else\
                      df.squeeze().rename(fin_objs[i].name)
             else:
-                df = pd.Series(name=fin_objs[i].name)
+                df = pd.Series(name=fin_objs[i].name, dtype=float)
 
             dfs[i] = df
         
@@ -473,7 +573,7 @@ class YahooFinanceQuery:
         divs = dfs[0].to_frame() if len(dfs) == 1 else pd.concat(dfs, axis=1, sort=True)
         divs.fillna(0, inplace=True)
 
-        return divs
+        return factors.adjust_matrix(divs, [obj.id for obj in fin_objs])
         
 
 
@@ -518,9 +618,156 @@ class FinancialData(models.Model):
     def __str__(self):
         return f"object: {self.id_object}, date: {self.date}, value: {self.value}"
     
+    @staticmethod
+    def valid() -> models.QuerySet:
+        """
+        Rows not excluded by the data quality scan (see quotes.data_quality), for analytics.
+        """
+        return FinancialData.objects.exclude(quality_flags__kind__in=DataQualityFlag.EXCLUDED_CHECKS)
+
     @staticmethod          
     def get_price_most_recent_date() -> float:
         """
         Get the second most recent date from price dates, in case all values were not updated to the most recent one
         """
-        return sorted(FinancialData.objects.values_list("date", flat=True).distinct(), reverse=True)[1]
\ No newline at end of file
+        return sorted(FinancialData.objects.values_list("date", flat=True).distinct(), reverse=True)[1]
+
+
+class DataQualityFlag(models.Model):
+    """
+    Suspicious NAV value found by the data quality scan.
+    """
+
+    class Check(models.TextChoices):
+        NON_POSITIVE = "Non positive"
+        DUPLICATE = "Duplicate"
+        SPIKE = "Spike"
+        JUMP = "Jump"
+        FLAT = "Flat run"
+        GAP = "Gap"
+
+    # Flags of values excluded from analytics. Others are reported only: a jump may be a real move, and
+    # excluding flat runs or the value after a gap would only widen the hole
+    EXCLUDED_CHECKS = [Check.NON_POSITIVE, Check.DUPLICATE, Check.SPIKE]
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["data", "kind"], name="unique_data_kind")]
+
+    data = models.ForeignKey(FinancialData, on_delete=models.CASCADE, related_name="quality_flags")
+    kind = models.CharField(max_length=15, choices=Check.choices)
+    # Robust z-score of a jump, length of a flat run, business days missing before a gap
+    score = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind}: {self.data}"
+
+
+class DataQualityScan(models.Model):
+    """
+    Run of the data quality scan. The next incremental run starts after last_row_id.
+    """
+    finished_at = models.DateTimeField(auto_now_add=True)
+    full = models.BooleanField(default=False)
+    last_row_id = models.IntegerField()
+    nb_rows = models.IntegerField()
+    nb_flags = models.IntegerField()
+
+    def __str__(self):
+        return f"scan of {self.nb_rows} rows until row {self.last_row_id}: {self.nb_flags} flags"
+
+
+class CorporateAction(models.Model):
+    """
+    Event changing the number of shares of an instrument, or its identity.
+
+    Prices stored before the action date are in units of before the action: analytics bring them, and
+    order quantities and prices, to current units with the adjustment factors of quotes.corporate_actions.
+
+    Args:
+        date: first date on which prices and orders are in units of after the action (ex-date)
+        ratio: shares after the action per share before (2 for a 2-for-1 split, 0.1 for a 1-for-10 reverse split,
+            the conversion parity for an ISIN change)
+    """
+
+    class Action(models.TextChoices):
+        SPLIT = "Split"
+        REVERSE_SPLIT = "Reverse split"
+        ISIN_CHANGE = "ISIN change"
+
+    class Meta:
+        ordering = ["date"]
+
+    id_object = models.ForeignKey(FinancialObject, on_delete=models.CASCADE, related_name="corporate_actions")
+    date = models.DateField()
+    action = models.CharField(max_length=15, choices=Action.choices)
+    ratio = models.FloatField(default=1)
+    old_isin = models.CharField(max_length=12, blank=True, default="")
+    new_isin = models.CharField(max_length=12, blank=True, default="")
+
+    def __str__(self):
+        return f"{self.action} of {self.id_object.name} on {self.date} (ratio {self.ratio:g})"
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+
+        if self.ratio <= 0:
+            raise ValidationError({"ratio": "The ratio must be positive."})
+        if self.action == CorporateAction.Action.SPLIT and self.ratio <= 1:
+            raise ValidationError({"ratio": "A split gives more shares: the ratio must be above 1."})
+        if self.action == CorporateAction.Action.REVERSE_SPLIT and self.ratio >= 1:
+            raise ValidationError({"ratio": "A reverse split gives fewer shares: the ratio must be below 1."})
+        if self.action == CorporateAction.Action.ISIN_CHANGE and not self.new_isin:
+            raise ValidationError({"new_isin": "An ISIN change needs the new ISIN."})
+
+
+class TargetWeight(models.Model):
+    """
+    Weight an object should have in the value of a portfolio. Objects held without a target are meant to be sold.
+    """
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["portfolio", "id_object"], name="unique_portfolio_target")]
+
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name="target_weights")
+    id_object = models.ForeignKey(FinancialObject, on_delete=models.CASCADE)
+    weight = models.FloatField()
+
+    def __str__(self):
+        return f"{self.portfolio}: {self.id_object.name} at {self.weight:.1%}"
+
+
+class CashMovement(models.Model):
+    """
+    Deposit or withdrawal of cash on the account of a portfolio. Recording them is optional: buys not covered by
+    the cash of the account are assumed funded by a deposit on their date (see quotes.cash).
+    """
+
+    class Kind(models.TextChoices):
+        DEPOSIT = "Deposit"
+        WITHDRAWAL = "Withdrawal"
+
+    class Meta:
+        ordering = ["date"]
+
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name="cash_movements")
+    date = models.DateField()
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    amount = models.FloatField()
+
+    def __str__(self):
+        return f"{self.portfolio} | {self.date} | {self.kind} of {self.amount:,.2f}"
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+
+        if self.amount <= 0:
+            raise ValidationError({"amount": "The amount must be positive, the kind gives the direction."})
+
+    @staticmethod
+    def signed_amounts(movements: models.QuerySet["CashMovement"]) -> pd.DataFrame:
+        """
+        Movements with columns date, amount (withdrawals negative), and portfolio.
+        """
+        df = pd.DataFrame(list(movements.values("portfolio", "date", "kind", "amount")), columns=["portfolio", "date", "kind", "amount"])
+        df["amount"] = df["amount"].where(df["kind"] == CashMovement.Kind.DEPOSIT, -df["amount"])
+        return df.drop(columns="kind")
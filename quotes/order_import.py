@@ -0,0 +1,165 @@
+"""
+Bulk import of orders from broker statements (CSV exports).
+
+The whole statement is validated at once with vectorized checks, before anything is written:
+any error rejects the import, so that a statement is either fully imported or not at all.
+"""
+from typing import IO
+
+import pandas as pd
+from django.db import transaction
+
+from quotes.cache import bump_orders_version
+from quotes.corporate_actions import get_adjustment_factors
+from quotes.models import FinancialObject, Order, Portfolio
+
+# Column names found in broker exports -> Order field
+COLUMN_ALIASES = {
+    "date": "date", "trade date": "date", "date d'exécution": "date", "date opération": "date",
+    "isin": "isin", "code isin": "isin",
+    "ticker": "ticker", "symbol": "ticker",
+    "direction": "direction", "side": "direction", "sens": "direction",
+    "nb_items": "nb_items", "quantity": "nb_items", "qty": "nb_items", "quantité": "nb_items",
+    "price": "price", "cours": "price", "prix": "price",
+    "total_fee": "total_fee", "fee": "total_fee", "fees": "total_fee", "frais": "total_fee", "commission": "total_fee",
+}
+
+DIRECTIONS = {
+    "BUY": Order.OrderDirection.BUY, "B": Order.OrderDirection.BUY, "ACHAT": Order.OrderDirection.BUY, "A": Order.OrderDirection.BUY,
+    "SELL": Order.OrderDirection.SELL, "S": Order.OrderDirection.SELL, "VENTE": Order.OrderDirection.SELL, "V": Order.OrderDirection.SELL,
+}
+
+ORDER_FIELDS = ["id_object", "date", "direction", "nb_items", "price", "total_fee"]
+
+
+def to_number(values: pd.Series) -> pd.Series:
+    """
+    Parse numbers written either way (1 234,5 or 1234.5). Unparsable values are NaN.
+    """
+    values = values.astype(str).str.replace(r"[\s ]", "", regex=True).str.replace(",", ".")
+    return pd.to_numeric(values, errors="coerce")
+
+
+def read_statement(file: IO | str) -> pd.DataFrame:
+    """
+    Read a broker CSV export (comma or semicolon separated) with columns renamed after Order fields.
+    """
+    statement = pd.read_csv(file, dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+    statement.columns = statement.columns.str.strip().str.lower().map(lambda column: COLUMN_ALIASES.get(column, column))
+
+    missing = {"date", "direction", "nb_items", "price"} - set(statement.columns)
+    if not {"isin", "ticker"} & set(statement.columns):
+        missing.add("isin or ticker")
+    if missing:
+        raise ValueError(f"Missing column(s) in the statement: {', '.join(sorted(missing))}")
+
+    return statement
+
+
+def validate_orders(portfolio: Portfolio, statement: pd.DataFrame) -> tuple[pd.DataFrame, list[str]]:
+    """
+    Check a statement against instruments and the existing orders of the portfolio.
+
+    Returns:
+        orders: the parsed statement, with columns ORDER_FIELDS
+        errors: one message per problem found, with the line of the statement it is on
+    """
+    key = "isin" if "isin" in statement else "ticker"
+    identifiers = dict(FinancialObject.objects.exclude(**{f"{key}__isnull": True}).values_list(key, "id"))
+
+    orders = pd.DataFrame({
+        "id_object": statement[key].astype(str).str.strip().map(identifiers),
+        "date": pd.to_datetime(statement["date"], errors="coerce", dayfirst=True, format="mixed").dt.normalize(),
+        "direction": statement["direction"].astype(str).str.strip().str.upper().map(DIRECTIONS),
+        "nb_items": to_number(statement["nb_items"]),
+        "price": to_number(statement["price"]),
+        "total_fee": to_number(statement["total_fee"]) if "total_fee" in statement else 0.,
+    }, index=statement.index)
+
+    checks = {
+        f"unknown {key}": orders["id_object"].notna(),
+        "invalid date": orders["date"].notna(),
+        "invalid direction (BUY or SELL)": orders["direction"].notna(),
+        "quantity is not a positive integer": (orders["nb_items"] > 0) & (orders["nb_items"] % 1 == 0),
+        "price is not positive": orders["price"] > 0,
+        "fee is negative or invalid": orders["total_fee"] >= 0,
+    }
+
+    # (line, message), the header being line 1
+    errors = []
+    valid = pd.Series(True, index=orders.index)
+    for message, check in checks.items():
+        errors += [(i + 2, message) for i in orders.index[~check]]
+        valid &= check
+
+    orders = orders[valid].astype({"id_object": "int64", "nb_items": "int64"})
+    lines = orders.index + 2
+
+    existing = pd.DataFrame(list(Order.objects.filter(portfolio=portfolio).values_list(*ORDER_FIELDS)), columns=ORDER_FIELDS)\
+        .astype({"id_object": "int64", "nb_items": "int64"})
+    existing["date"] = pd.to_datetime(existing["date"])
+
+    # Orders already in the portfolio, ex. when a statement is imported twice
+    duplicates = orders.assign(line=lines).merge(existing, on=ORDER_FIELDS)
+    errors += [(line, "already imported") for line in duplicates["line"]]
+
+    errors += check_holdings(orders.assign(line=lines), existing)
+    return orders, [f"line {line}: {message}" if line else message for line, message in sorted(errors)]
+
+
+def check_holdings(orders: pd.DataFrame, existing: pd.DataFrame) -> list[tuple[int, str]]:
+    """
+    Replay existing and new orders by date, as Portfolio.get_inventory does, and report sells beyond the held quantity.
+    On a given date, existing orders come first. Errors on existing orders have line 0.
+    """
+    replay = pd.concat([existing.assign(line=0), orders], ignore_index=True).sort_values("date", kind="stable")
+
+    # Quantities in current units, so that sells after a split are compared to the shares held then
+    adjusted = get_adjustment_factors().adjust_ledger(replay)["nb_items"]
+    signed = adjusted.where(replay["direction"] == Order.OrderDirection.BUY, -adjusted)
+    held = signed.groupby(replay["id_object"]).cumsum().round(8)
+    oversold = replay[held < 0]
+    if oversold.empty:
+        return []
+
+    names = dict(FinancialObject.objects.filter(id__in=oversold["id_object"].unique().tolist()).values_list("id", "name"))
+    # Back in units of the date of the sell
+    held_before = ((held + adjusted) * replay["nb_items"] / adjusted)[held < 0]
+
+    errors = []
+    for order, nb_held in zip(oversold.itertuples(), held_before):
+        sale = f"sells {order.nb_items} {names[order.id_object]} on {order.date.date()}, but only {nb_held:g} are held"
+        errors.append((order.line, sale if order.line else f"Existing order {sale} once the statement is imported"))
+    return errors
+
+
+def import_orders(portfolio: Portfolio, file: IO | str) -> tuple[list[Order], list[str]]:
+    """
+    Validate a broker statement and, if there are no errors, create all its orders in one transaction.
+
+    Returns:
+        orders: the created orders (none if there were errors)
+        errors: messages describing why the statement was rejected
+    """
+    try:
+        statement = read_statement(file)
+    except (ValueError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        return [], [str(e)]
+
+    if statement.empty:
+        return [], ["The statement has no orders"]
+
+    orders, errors = validate_orders(portfolio, statement)
+    if errors:
+        return [], errors
+
+    with transaction.atomic():
+        created = Order.objects.bulk_create([
+            Order(portfolio=portfolio, id_object_id=int(order.id_object), date=order.date.date(), direction=order.direction,
+                  nb_items=int(order.nb_items), price=float(order.price), total_fee=float(order.total_fee))
+            for order in orders.itertuples()
+        ])
+
+    # bulk_create does not send post_save: analytics are invalidated once for the whole statement
+    bump_orders_version()
+    return created, []
@@ -0,0 +1,249 @@
+"""
+Optional memory-mapped columnar copy of FinancialData, for analytics reads without database traffic.
+
+The store lives in settings.PRICE_STORE_DIR (disabled when unset) and holds, for each field, a raw
+float64 (dates x instruments) matrix with NaN where there is no value, plus the date and instrument
+indices. Files are mapped read-only, so that all worker processes share one page-cached copy.
+
+The store is refreshed incrementally after each ingestion: new dates are appended in place, new
+instruments get new columns. Anything else (ex. a date inserted in the past) triggers a full rebuild.
+Matrix files are versioned by a generation number recorded in meta.json, which is replaced last:
+readers never see a half-written layout, and keep their mapping of the previous generation until
+they reopen the store.
+"""
+import json
+import os
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from quotes.models import FinancialData, FinancialObject
+
+# Fields stored, built from the rows of all origins as read by YahooFinanceQuery
+FIELDS = [FinancialData.TimeSeriesField.NAV, FinancialData.TimeSeriesField.Dividends]
+
+# Opened stores by directory, along with the meta.json modification time they were opened at
+_open_stores: dict[Path, tuple[int, "PriceStore"]] = {}
+
+
+def get_store_dir() -> Path | None:
+    store_dir = getattr(settings, "PRICE_STORE_DIR", None)
+    return Path(store_dir) if store_dir else None
+
+
+class PriceStore:
+    """
+    Read-only view of the store files.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text())
+        n_dates, n_instruments = self.meta["n_dates"], self.meta["n_instruments"]
+
+        # Indices are append-only: their prefix is consistent with meta.json even while being updated
+        self.dates = np.load(path / "dates.npy")[:n_dates]
+        self.instruments = np.load(path / "instruments.npy")[:n_instruments]
+        self.columns = {int(id): i for i, id in enumerate(self.instruments)}
+
+        self.matrices = {
+            field: np.memmap(path / self.matrix_file(field), dtype=np.float64, mode="r", shape=(n_dates, n_instruments))
+            if n_dates and n_instruments else np.empty((n_dates, n_instruments))
+            for field in FIELDS
+        }
+
+    def matrix_file(self, field: str, generation: int | None = None) -> str:
+        generation = self.meta["generation"] if generation is None else generation
+        return f"{field}.{generation}.f8"
+
+    @classmethod
+    def open(cls) -> "PriceStore | None":
+        """
+        The store of settings.PRICE_STORE_DIR, or None if there is none.
+        Opened stores are reused by the process until the store is updated.
+        """
+        path = get_store_dir()
+        if path is None:
+            return None
+
+        try:
+            mtime = (path / "meta.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        opened = _open_stores.get(path)
+        if opened is None or opened[0] != mtime:
+            opened = (mtime, cls(path))
+            _open_stores[path] = opened
+        return opened[1]
+
+    def covers(self, ids: list[int]) -> bool:
+        return all(id in self.columns for id in ids)
+
+    def get_matrix(self, ids: list[int], from_date: date, until_date: date, field: str) -> pd.DataFrame:
+        """
+        (dates x ids) values of a field, restricted to the dates on which at least one of the ids has a value.
+        """
+        start, end = np.searchsorted(self.dates, [np.datetime64(from_date, "D"), np.datetime64(until_date, "D")])
+        end += end < len(self.dates) and self.dates[end] == np.datetime64(until_date, "D")
+
+        # Contiguous date range: a view on the mapping. Only the selected columns are copied
+        values = self.matrices[field][start:end][:, [self.columns[id] for id in ids]]
+        has_value = ~np.isnan(values).all(axis=1)
+
+        return pd.DataFrame(values[has_value],
+                            index=pd.Index(self.dates[start:end][has_value].astype(object), name="date"),
+                            columns=pd.Index(ids, name="id_object"))
+
+
+def load_rows(**filters) -> pd.DataFrame:
+    """
+    FinancialData rows as a dataframe with columns id, date, id_object, field, value, in insertion order.
+    Rows excluded by the data quality scan are left out.
+    """
+    rows = FinancialData.valid().filter(**filters).order_by("id").values_list("id", "date", "id_object", "field", "value")
+    df = pd.DataFrame(list(rows), columns=["id", "date", "id_object", "field", "value"])
+    df["date"] = df["date"].astype("datetime64[s]")
+    return df
+
+
+def to_days(rows: pd.DataFrame) -> np.ndarray:
+    return rows["date"].to_numpy().astype("datetime64[D]")
+
+
+def fill(matrix: np.ndarray, rows: pd.DataFrame, dates: np.ndarray, columns: dict[int, int], field: str):
+    """
+    Write the rows of a field in a (dates x instruments) matrix. Later rows override earlier ones.
+    """
+    rows = rows[rows["field"] == field]
+    if rows.empty:
+        return
+
+    row_idx = np.searchsorted(dates, to_days(rows))
+    col_idx = rows["id_object"].map(columns).to_numpy()
+    matrix[row_idx, col_idx] = rows["value"].to_numpy()
+
+
+def write_meta(path: Path, meta: dict):
+    tmp = path / "meta.json.tmp"
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, path / "meta.json")
+
+
+def save_index(path: Path, name: str, values: np.ndarray):
+    tmp = path / f"{name}.tmp.npy"
+    np.save(tmp, values)
+    os.replace(tmp, path / f"{name}.npy")
+
+
+def build(path: Path, generation: int = 0):
+    """
+    Build the whole store from the database.
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    rows = load_rows()
+
+    instruments = np.array(sorted(FinancialObject.objects.values_list("id", flat=True)), dtype=np.int64)
+    dates = np.unique(to_days(rows))
+    columns = {int(id): i for i, id in enumerate(instruments)}
+
+    for field in FIELDS:
+        matrix = np.full((len(dates), len(instruments)), np.nan)
+        fill(matrix, rows, dates, columns, field)
+        matrix.tofile(path / f"{field}.{generation}.f8")
+
+    save_index(path, "dates", dates)
+    save_index(path, "instruments", instruments)
+    write_meta(path, {
+        "generation": generation,
+        "n_dates": len(dates),
+        "n_instruments": len(instruments),
+        "last_row_id": int(rows["id"].max()) if not rows.empty else 0,
+    })
+
+
+def update_price_store(full: bool = False) -> bool:
+    """
+    Bring the store up to date with FinancialData, if a store directory is configured.
+    Only rows inserted since the last update are read, unless full is set.
+    Rows updated in place are not detected: callers updating existing rows pass full=True.
+
+    Returns whether the store is enabled.
+    """
+    path = get_store_dir()
+    if path is None:
+        return False
+
+    if full or not (path / "meta.json").exists():
+        old = json.loads((path / "meta.json").read_text()) if (path / "meta.json").exists() else None
+        build(path, generation=old["generation"] + 1 if old else 0)
+        if old:
+            remove_generation(path, old["generation"])
+        return True
+
+    store = PriceStore(path)
+    meta = store.meta
+
+    new_instruments = np.array(sorted(
+        FinancialObject.objects.exclude(id__in=store.instruments.tolist()).values_list("id", flat=True)), dtype=np.int64)
+
+    # New rows of known instruments, and the full history of new ones
+    rows = load_rows(id__gt=meta["last_row_id"])
+    if len(new_instruments):
+        rows = pd.concat([rows[~rows["id_object"].isin(new_instruments)], load_rows(id_object__in=new_instruments.tolist())])\
+            .sort_values("id")
+
+    if rows.empty and not len(new_instruments):
+        return True
+
+    new_dates = np.setdiff1d(to_days(rows), store.dates)
+    if len(store.dates) and len(new_dates) and new_dates.min() < store.dates[-1]:
+        # A date inserted in the middle shifts every row after it
+        return update_price_store(full=True)
+
+    dates = np.concatenate([store.dates, new_dates])
+    instruments = np.concatenate([store.instruments, new_instruments])
+    columns = {int(id): i for i, id in enumerate(instruments)}
+    shape = (len(dates), len(instruments))
+
+    if len(new_instruments) or not len(store.dates):
+        # Columns change the layout of every row: write a new generation
+        generation = meta["generation"] + 1
+        for field in FIELDS:
+            matrix = np.full(shape, np.nan)
+            matrix[:len(store.dates), :len(store.instruments)] = store.matrices[field]
+            fill(matrix, rows, dates, columns, field)
+            matrix.tofile(path / store.matrix_file(field, generation))
+    else:
+        # Same columns: append the new dates in place, and write the new values
+        generation = meta["generation"]
+        for field in FIELDS:
+            with open(path / store.matrix_file(field), "ab") as f:
+                np.full((len(new_dates), len(instruments)), np.nan).tofile(f)
+            matrix = np.memmap(path / store.matrix_file(field), dtype=np.float64, mode="r+", shape=shape)
+            fill(matrix, rows, dates, columns, field)
+            matrix.flush()
+
+    save_index(path, "dates", dates)
+    save_index(path, "instruments", instruments)
+    write_meta(path, {
+        "generation": generation,
+        "n_dates": shape[0],
+        "n_instruments": shape[1],
+        "last_row_id": max(meta["last_row_id"], int(rows["id"].max()) if not rows.empty else 0),
+    })
+
+    if generation != meta["generation"]:
+        remove_generation(path, meta["generation"])
+    return True
+
+
+def remove_generation(path: Path, generation: int):
+    """
+    Delete the matrix files of a generation. Processes still mapping them keep their copy until they reopen the store.
+    """
+    for field in FIELDS:
+        (path / f"{field}.{generation}.f8").unlink(missing_ok=True)
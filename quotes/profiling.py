@@ -0,0 +1,288 @@
+"""
+Opt-in instrumentation of Django views and Dash callbacks (settings.PROFILING).
+
+Every profiled view or callback records its wall time, SQL query count and time, rows fetched and
+response payload size. Each measure is logged on one line of the "quotes.profiling" logger, and
+aggregated in process-wide histograms exposed in Prometheus text format by the metrics view.
+"""
+import functools
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger("quotes.profiling")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def profiling_enabled() -> bool:
+    return getattr(settings, "PROFILING", False)
+
+
+@dataclass
+class QueryStats:
+    """
+    SQL activity recorded while a view or callback runs.
+    """
+    count: int = 0
+    duration: float = 0
+    rows: int = 0
+
+
+# Recorders active in the current thread: nested recorders (a callback inside its view) all see the queries
+_local = threading.local()
+
+
+def _active_recorders() -> list[QueryStats]:
+    if not hasattr(_local, "recorders"):
+        _local.recorders = []
+    return _local.recorders
+
+
+class _RowCountingMixin:
+    """
+    Count the rows fetched through a cursor in every active recorder.
+    """
+    def _count_rows(self, nb):
+        for stats in _active_recorders():
+            stats.rows += nb
+
+    def fetchone(self):
+        with self.db.wrap_database_errors:
+            row = self.cursor.fetchone()
+        if row is not None:
+            self._count_rows(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        with self.db.wrap_database_errors:
+            rows = self.cursor.fetchmany(*args, **kwargs)
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        with self.db.wrap_database_errors:
+            rows = self.cursor.fetchall()
+        self._count_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        with self.db.wrap_database_errors:
+            for row in self.cursor:
+                self._count_rows(1)
+                yield row
+
+
+class RowCountingCursorWrapper(_RowCountingMixin, CursorWrapper):
+    pass
+
+
+class RowCountingCursorDebugWrapper(_RowCountingMixin, CursorDebugWrapper):
+    pass
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for stats in _active_recorders():
+            stats.count += 1
+            stats.duration += duration
+
+
+@contextmanager
+def record_queries():
+    """
+    Context manager yielding the QueryStats of the queries run on the default connection within its block.
+    """
+    stats = QueryStats()
+    recorders = _active_recorders()
+    connection = connections[DEFAULT_DB_ALIAS]
+
+    if not recorders:
+        # Outermost recorder: hook into the connection of the thread for the duration of the block
+        connection.execute_wrappers.append(_execute_wrapper)
+        connection.make_cursor = lambda cursor: RowCountingCursorWrapper(cursor, connection)
+        connection.make_debug_cursor = lambda cursor: RowCountingCursorDebugWrapper(cursor, connection)
+
+    recorders.append(stats)
+    try:
+        yield stats
+    finally:
+        recorders.remove(stats)
+        if not recorders:
+            connection.execute_wrappers.remove(_execute_wrapper)
+            del connection.make_cursor
+            del connection.make_debug_cursor
+
+
+@dataclass
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus sense: counts[i] counts observations <= buckets[i].
+    """
+    buckets: tuple
+    counts: list = field(default_factory=list)
+    total: float = 0
+    nb: int = 0
+
+    def __post_init__(self):
+        self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float):
+        for i in range(bisect_left(self.buckets, value), len(self.buckets)):
+            self.counts[i] += 1
+        self.total += value
+        self.nb += 1
+
+
+@dataclass
+class Series:
+    """
+    Everything aggregated for one view or callback.
+    """
+    duration: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS))
+    queries: Histogram = field(default_factory=lambda: Histogram(QUERY_BUCKETS))
+    query_seconds: float = 0
+    rows: int = 0
+    payload_bytes: int = 0
+
+
+class MetricsRegistry:
+    """
+    Process-wide aggregation of the measures, keyed by (kind, name) with kind "view" or "callback".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: dict[tuple[str, str], Series] = {}
+
+    def observe(self, kind: str, name: str, duration: float, stats: QueryStats, payload_bytes: int):
+        with self._lock:
+            series = self._series.setdefault((kind, name), Series())
+            series.duration.observe(duration)
+            series.queries.observe(stats.count)
+            series.query_seconds += stats.duration
+            series.rows += stats.rows
+            series.payload_bytes += payload_bytes
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def to_prometheus(self) -> str:
+        """
+        Render all series in the Prometheus text exposition format.
+        """
+        with self._lock:
+            items = sorted(self._series.items())
+
+        lines = []
+
+        def histogram(metric, help_text, get):
+            lines.extend([f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"])
+            for (kind, name), series in items:
+                hist = get(series)
+                labels = f'kind="{kind}",name="{name}"'
+                for bucket, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'{metric}_bucket{{{labels},le="{bucket}"}} {count}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {hist.nb}')
+                lines.append(f"{metric}_sum{{{labels}}} {hist.total}")
+                lines.append(f"{metric}_count{{{labels}}} {hist.nb}")
+
+        def counter(metric, help_text, get):
+            lines.extend([f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"])
+            for (kind, name), series in items:
+                lines.append(f'{metric}{{kind="{kind}",name="{name}"}} {get(series)}')
+
+        histogram("pea_duration_seconds", "Wall time of views and Dash callbacks.", lambda s: s.duration)
+        histogram("pea_sql_queries", "SQL queries per view or Dash callback.", lambda s: s.queries)
+        counter("pea_sql_seconds_total", "Time spent in SQL queries.", lambda s: s.query_seconds)
+        counter("pea_sql_rows_total", "Rows fetched from the database.", lambda s: s.rows)
+        counter("pea_payload_bytes_total", "Size of the responses.", lambda s: s.payload_bytes)
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def report(kind: str, name: str, duration: float, stats: QueryStats, payload_bytes: int):
+    """
+    Log one measure and add it to the registry.
+    """
+    registry.observe(kind, name, duration, stats, payload_bytes)
+    logger.info("%s %s wall=%.1fms queries=%d sql=%.1fms rows=%d payload=%dB",
+                kind, name, duration * 1000, stats.count, stats.duration * 1000, stats.rows, payload_bytes)
+
+
+class ProfilingMiddleware:
+    """
+    Profile every Django view, including the django_plotly_dash endpoints.
+    """
+
+    def __init__(self, get_response):
+        if not profiling_enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with record_queries() as stats:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        name = match.view_name if match else request.path
+        payload_bytes = 0 if response.streaming else len(response.content)
+
+        report("view", name, duration, stats, payload_bytes)
+        return response
+
+
+def profile_callback(func):
+    """
+    Profile a Dash callback. To be placed under the app.callback decorator.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not profiling_enabled():
+            return func(*args, **kwargs)
+
+        # Imported here: plotly is only needed once a callback runs
+        from plotly.utils import PlotlyJSONEncoder
+
+        start = time.perf_counter()
+        with record_queries() as stats:
+            result = func(*args, **kwargs)
+        duration = time.perf_counter() - start
+
+        payload_bytes = len(json.dumps(result, cls=PlotlyJSONEncoder))
+        report("callback", func.__name__, duration, stats, payload_bytes)
+        return result
+
+    return wrapper
+
+
+def metrics(request):
+    """
+    Prometheus endpoint, only served to staff users and clients of settings.METRICS_ALLOWED_IPS when profiling
+    is enabled.
+    """
+    allowed = request.user.is_staff or request.META.get("REMOTE_ADDR") in getattr(settings, "METRICS_ALLOWED_IPS", [])
+    if not profiling_enabled() or not allowed:
+        raise Http404()
+    return HttpResponse(registry.to_prometheus(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,152 @@
+"""
+Monte Carlo projection of the value of a portfolio, for planning contributions.
+
+Monthly returns of the instruments currently held are simulated jointly, so that their correlation is kept:
+- bootstrap: historical months drawn with replacement, all instruments of a month together
+- normal: multivariate normal log returns, with the historical mean and covariance
+
+Holdings are kept, and monthly contributions are invested with the current weights. Paths are simulated by
+chunks of CHUNK_SIZE, a month at a time on (paths x instruments) arrays, in threads if asked (NumPy releases
+the GIL). Every chunk has its own random stream: results only depend on the seed, not on the number of workers.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from quotes.alignment import align_prices
+from quotes.jobs import report_progress
+from quotes.models import FinancialData, Portfolio, YahooFinanceQuery
+
+PERCENTILES = [5, 25, 50, 75, 95]
+CHUNK_SIZE = 1000
+# Years of history the returns are estimated from
+HISTORY_YEARS = 10
+MIN_MONTHS = 12
+
+
+class ProjectionMethod:
+    BOOTSTRAP = "bootstrap"
+    NORMAL = "normal"
+
+
+@dataclass
+class Projection:
+    """
+    Args:
+        bands: (months x PERCENTILES) portfolio value, month 0 being today
+        invested: (months) current value plus the contributions made since
+    """
+    bands: pd.DataFrame
+    invested: pd.Series
+    n_paths: int
+    n_months: int
+
+
+def monthly_returns(prices: pd.DataFrame) -> pd.DataFrame:
+    """
+    Simple monthly returns of aligned prices, on the months all instruments have one.
+    """
+    aligned = align_prices(prices)
+    monthly = aligned.prices.set_axis(pd.to_datetime(aligned.prices.index)).resample("ME").last()
+    return monthly.pct_change(fill_method=None).dropna(how="any")
+
+
+def simulate_chunk(rng: np.random.Generator, n_paths: int, n_months: int, values: np.ndarray, contribution: float,
+                   method: str, growths: np.ndarray, mean: np.ndarray, chol: np.ndarray) -> np.ndarray:
+    """
+    Portfolio values (n_months x n_paths) of paths starting from instrument values.
+    Arrays are month-major and float32: each month is a contiguous (paths x instruments) block.
+    """
+    if method == ProjectionMethod.BOOTSTRAP:
+        growth = growths[rng.integers(0, len(growths), size=(n_months, n_paths))]
+    else:
+        growth = rng.standard_normal((n_months, n_paths, len(values)), dtype=np.float32) @ chol.T
+        growth += mean
+        np.exp(growth, out=growth)
+
+    # Contributions are invested at the start of each month, with the current weights
+    invested = (contribution * values / values.sum()).astype(np.float32)
+    current = np.tile(values.astype(np.float32), (n_paths, 1))
+    totals = np.empty((n_months, n_paths), dtype=np.float32)
+    for month in range(n_months):
+        if contribution:
+            current += invested
+        current *= growth[month]
+        current.sum(axis=1, out=totals[month])
+    return totals
+
+
+def simulate(values: np.ndarray, returns: np.ndarray, n_months: int, n_paths: int, contribution: float = 0.,
+             method: str = ProjectionMethod.BOOTSTRAP, seed: int | None = None, workers: int = 1) -> np.ndarray:
+    """
+    Portfolio values (n_months x n_paths) of simulated paths, without month 0.
+
+    Args:
+        values: current value of each instrument held
+        returns: (months x instruments) historical simple monthly returns
+        contribution: amount invested at the start of each month
+        workers: threads simulating chunks at once
+    """
+    growths = (1 + returns).astype(np.float32)
+    log_returns = np.log1p(returns)
+    mean, chol = log_returns.mean(axis=0).astype(np.float32), None
+    if method == ProjectionMethod.NORMAL:
+        # Jitter for instruments moving together exactly (ex. two lines of one fund)
+        cov = np.cov(log_returns, rowvar=False).reshape(len(values), len(values))
+        chol = np.linalg.cholesky(cov + np.eye(len(values)) * 1e-12).astype(np.float32)
+    elif method != ProjectionMethod.BOOTSTRAP:
+        raise ValueError(f"Unknown projection method {method!r}")
+
+    sizes = [min(CHUNK_SIZE, n_paths - start) for start in range(0, n_paths, CHUNK_SIZE)]
+    rngs = [np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(len(sizes))]
+    paths = np.empty((n_months, n_paths), dtype=np.float32)
+
+    def run(i: int):
+        start = i * CHUNK_SIZE
+        paths[:, start:start + sizes[i]] = simulate_chunk(rngs[i], sizes[i], n_months, values, contribution, method,
+                                                          growths, mean, chol)
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for done, _ in enumerate(executor.map(run, range(len(sizes))), start=1):
+                report_progress(done / len(sizes), "Simulating paths")
+    else:
+        for i in range(len(sizes)):
+            run(i)
+            report_progress((i + 1) / len(sizes), "Simulating paths")
+    return paths
+
+
+def project_portfolio(portfolio: Portfolio, years: int = 20, n_paths: int = 10000, contribution: float = 0.,
+                      method: str = ProjectionMethod.BOOTSTRAP, seed: int | None = None, workers: int = 1) -> Projection:
+    """
+    Percentile bands of the monthly value of a portfolio over the next years, from its current holdings.
+    """
+    latest_date = FinancialData.get_price_most_recent_date()
+    inventory = portfolio.get_inventory(latest_date)
+    if not len(inventory.portfolio_entries):
+        raise ValueError("The portfolio holds nothing to project.")
+
+    history_start = date(latest_date.year - HISTORY_YEARS, latest_date.month, 1)
+    prices = YahooFinanceQuery.get_price_matrix(inventory.fin_objs, history_start, latest_date)
+    returns = monthly_returns(prices)
+    if len(returns) < MIN_MONTHS:
+        raise ValueError(f"Only {len(returns)} months of history common to all holdings, {MIN_MONTHS} are needed.")
+
+    last_prices = align_prices(prices).prices.iloc[-1].to_numpy()
+    if np.isnan(last_prices).any():
+        raise ValueError(f"Some holdings have no recent price on {latest_date}.")
+    values = last_prices * np.array(inventory.nbs, dtype=float)
+    n_months = years * 12
+
+    paths = simulate(values, returns.to_numpy(), n_months, n_paths, contribution, method, seed, workers)
+
+    months = np.arange(n_months + 1)
+    bands = np.percentile(paths, PERCENTILES, axis=1).T
+    bands = pd.DataFrame(np.vstack([np.full(len(PERCENTILES), values.sum()), bands]), index=months, columns=PERCENTILES)
+    invested = pd.Series(values.sum() + contribution * months, index=months)
+
+    return Projection(bands=bands, invested=invested, n_paths=n_paths, n_months=n_months)
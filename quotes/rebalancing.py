@@ -0,0 +1,176 @@
+"""
+Rebalancing of a portfolio towards its target weights (see TargetWeight) with whole shares.
+
+The drift of a portfolio is the sum of squared differences between the weights of its objects and their
+targets. While solving, weights are relative to the value of the positions plus the cash, so that selling to
+hold cash is not a way to reduce it. The solver starts from the continuous solution rounded down, then applies
+one move at a time: one share more or less of an object, one share of an object bought for as many shares of
+another as it is worth or fewer, the trade of an object cancelled, and with few objects one share more or less of
+several objects at once. All candidate moves are evaluated at once with array operations.
+It first restores the cash constraint if the start does not meet it, then applies the move reducing the
+drift the most while the cash left, fees included, stays positive, until no move reduces it. The result is
+the best solution around it for these moves, which is not always the best one with whole shares.
+"""
+from dataclasses import dataclass
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from quotes.models import FinancialData, Portfolio, YahooFinanceQuery
+
+MAX_MOVES = 10000
+# Most shares of an object sold for one share of another in a single move
+MAX_EXCHANGED = 100
+# Most objects for which moves of one share of every object at once are tried
+MAX_COMBINED_OBJECTS = 8
+
+
+@dataclass
+class RebalancingPlan:
+    """
+    Args:
+        trades: by object name, columns Price, Number, Target, Weight, Trade, New Number, New Weight
+        fees: fees of the trades
+        cash_left: cash budget left after the trades and fees
+    """
+    trades: pd.DataFrame
+    fees: float
+    cash_left: float
+    drift_before: float
+    drift_after: float
+
+
+def drift(nbs: np.ndarray, prices: np.ndarray, targets: np.ndarray, total: float | None = None) -> np.ndarray:
+    """
+    Drift of one (nbs: objects) or several (nbs: candidates x objects) portfolios.
+
+    Args:
+        total: value the weights are relative to (default: the value of the positions)
+    """
+    values = nbs * prices
+    total = values.sum(axis=-1, keepdims=True) if total is None else np.full(values.shape[:-1] + (1,), float(total))
+    weights = np.divide(values, total, out=np.zeros_like(values), where=total > 0)
+    return ((weights - targets) ** 2).sum(axis=-1)
+
+
+def cash_left(nbs: np.ndarray, current: np.ndarray, prices: np.ndarray, cash: float, fixed_fee: float, fee_rate: float) -> np.ndarray:
+    """
+    Cash left after trading from current to nbs, for one or several candidates. Sells bring cash in.
+    """
+    trades = nbs - current
+    amounts = np.abs(trades) * prices
+    fees = ((trades != 0) * fixed_fee + amounts * fee_rate).sum(axis=-1)
+    return cash - (trades * prices).sum(axis=-1) - fees
+
+
+def solve(current: np.ndarray, prices: np.ndarray, targets: np.ndarray, cash: float, fixed_fee: float = 0.,
+          fee_rate: float = 0.) -> np.ndarray:
+    """
+    Numbers of shares (integers) after rebalancing, the best around them for the moves of the solver.
+
+    Args:
+        current: shares held of each object
+        targets: target weight of each object, summing to 1
+        cash: cash available for the trades, fees included
+        fixed_fee: fee of each order, fee_rate: fee proportional to the amount traded
+    """
+    # Continuous solution on the total value, minus an estimate of fees, rounded down. Weights are relative to
+    # the total value so that cash left idle counts as drift
+    total = current @ prices + cash
+    budget = total - fixed_fee * len(prices) - fee_rate * np.abs(targets * total - current * prices).sum()
+    nbs = np.floor(np.maximum(targets * max(budget, 0.), 0.) / prices)
+
+    n = len(prices)
+    # One share more or less of an object, or one share of an object bought for 1 to k shares of another sold,
+    # k being the number of shares of the other it is worth (rounded up)
+    bought, sold = np.nonzero(~np.eye(n, dtype=bool))
+    counts = np.minimum(np.ceil(prices[bought] / prices[sold]), MAX_EXCHANGED).astype(int)
+    offsets = np.cumsum(counts) - counts
+    swaps = np.zeros((counts.sum(), n))
+    rows = np.arange(counts.sum())
+    swaps[rows, np.repeat(bought, counts)] = 1
+    swaps[rows, np.repeat(sold, counts)] = -(rows - np.repeat(offsets, counts) + 1)
+    steps = np.vstack([np.eye(n), -np.eye(n), swaps])
+    if n <= MAX_COMBINED_OBJECTS:
+        # Few objects: one share more, less or the same of every object at once
+        steps = np.unique(np.vstack([steps, list(product([-1., 0., 1.], repeat=n))]), axis=0)
+        steps = steps[(steps != 0).any(axis=1)]
+
+    def candidates(nbs: np.ndarray) -> np.ndarray:
+        # One step from nbs, or the trade of an object cancelled
+        cancels = np.tile(nbs, (n, 1))
+        cancels[np.arange(n), np.arange(n)] = current
+        moves = np.vstack([nbs + steps, cancels])
+        return moves[(moves >= 0).all(axis=1)]
+
+    for _ in range(MAX_MOVES):
+        moves = candidates(nbs)
+        left = cash_left(moves, current, prices, cash, fixed_fee, fee_rate)
+        drifts = drift(moves, prices, targets, total)
+
+        current_left = cash_left(nbs, current, prices, cash, fixed_fee, fee_rate)
+        if current_left < 0:
+            # Restore the cash constraint: the move meeting it with the lowest drift, or else the one freeing most cash
+            freeing = left > current_left
+            if not freeing.any():
+                break
+            meeting = freeing & (left >= 0)
+            nbs = moves[np.argmin(np.where(meeting, drifts, np.inf))] if meeting.any() else moves[np.argmax(left)]
+            continue
+
+        feasible = left >= 0
+        if not feasible.any():
+            break
+        best = np.argmin(np.where(feasible, drifts, np.inf))
+        if drifts[best] >= drift(nbs, prices, targets, total) - 1e-12:
+            break
+        nbs = moves[best]
+
+    return nbs
+
+
+def rebalance(portfolio: Portfolio, cash: float = 0., fixed_fee: float = 0., fee_rate: float = 0.) -> RebalancingPlan:
+    """
+    Trades bringing a portfolio close to its target weights, at the most recent prices: a local minimum of the drift
+    with whole shares (see solve).
+    """
+    targets = {target.id_object: target.weight for target in portfolio.target_weights.select_related("id_object")}
+    if not targets:
+        raise ValueError("The portfolio has no target weights.")
+
+    latest_date = FinancialData.get_price_most_recent_date()
+    inventory = portfolio.get_inventory(latest_date)
+    held = dict(zip(inventory.fin_objs, inventory.nbs))
+
+    fin_objs = list(held) + [obj for obj in targets if obj not in held]
+    prices = YahooFinanceQuery.get_latest_prices(fin_objs, latest_date).to_numpy()
+    if np.isnan(prices).any():
+        missing = [obj.name for obj, price in zip(fin_objs, prices) if np.isnan(price)]
+        raise ValueError(f"No recent price for {', '.join(missing)}.")
+
+    current = np.array([held.get(obj, 0) for obj in fin_objs], dtype=float)
+    weights = np.array([targets.get(obj, 0.) for obj in fin_objs])
+    weights = weights / weights.sum()
+
+    nbs = solve(current, prices, weights, cash, fixed_fee, fee_rate)
+    left = float(cash_left(nbs, current, prices, cash, fixed_fee, fee_rate))
+
+    values, new_values = current * prices, nbs * prices
+    trades = pd.DataFrame({
+        "Price": prices,
+        "Number": current,
+        "Target": weights,
+        "Weight": values / values.sum() if values.sum() else 0.,
+        "Trade": nbs - current,
+        "New Number": nbs,
+        "New Weight": new_values / new_values.sum() if new_values.sum() else 0.,
+    }, index=[obj.name for obj in fin_objs])
+
+    return RebalancingPlan(
+        trades=trades,
+        fees=cash - left - float(((nbs - current) * prices).sum()),
+        cash_left=left,
+        drift_before=float(drift(current, prices, weights)),
+        drift_after=float(drift(nbs, prices, weights)),
+    )
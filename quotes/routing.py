@@ -0,0 +1,7 @@
+from django.urls import path
+
+from quotes import consumers
+
+websocket_urlpatterns = [
+    path("ws/portfolio/<int:pk>/", consumers.PortfolioValuationConsumer.as_asgi()),
+]
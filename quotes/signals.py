@@ -0,0 +1,23 @@
+"""
+Cache invalidation on changes made through the ORM, one order, cash movement or corporate action at a time (admin, Dash order form).
+Bulk writes do not send these signals: they bump the versions themselves, once.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from quotes.cache import bump_corporate_actions_version, bump_market_data_version, bump_orders_version
+from quotes.models import CashMovement, CorporateAction, Order
+
+
+# Cash movements change the values and returns of their portfolio, as orders
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=CashMovement)
+def order_changed(sender, **kwargs):
+    bump_orders_version()
+
+
+@receiver([post_save, post_delete], sender=CorporateAction)
+def corporate_action_changed(sender, **kwargs):
+    # Adjustment factors are recomputed, and every analytics result read adjusted prices or quantities
+    bump_corporate_actions_version()
+    bump_market_data_version()
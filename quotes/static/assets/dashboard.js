@@ -0,0 +1,68 @@
+/*
+Clientside callbacks of the Dashboard app: the series of all portfolios are sent once in a dcc.Store,
+horizons and date ranges are sliced in the browser.
+*/
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: {
+        /*
+        Start date (YYYY-MM-DD) of a horizon button (ex. 6m), assuming the end date is today.
+        Same horizons as timeframe_to_limit_date in dash_app.py.
+        */
+        limitDate: function(timeFrame) {
+            const day = new Date();
+            switch (timeFrame.toLowerCase()) {
+                case "1m": case "3m": case "6m":
+                    day.setMonth(day.getMonth() - parseInt(timeFrame[0]));
+                    break;
+                case "ytd":
+                    day.setMonth(0, 1);
+                    break;
+                case "1y": case "3y":
+                    day.setFullYear(day.getFullYear() - parseInt(timeFrame[0]));
+                    break;
+                default:
+                    return "2000-01-01";
+            }
+            const pad = (n) => String(n).padStart(2, "0");
+            return `${day.getFullYear()}-${pad(day.getMonth() + 1)}-${pad(day.getDate())}`;
+        },
+
+        /*
+        Figure on the horizon pressed (max on page load), or on the date range when it or the mode changes,
+        and the date range actually charted.
+        */
+        updateGraph: function(mode, btn1m, btn3m, btn6m, btnYtd, btn1y, btn3y, btnMax, dateRange, store) {
+            const triggered = dash_clientside.callback_context.triggered
+                .map((t) => t.prop_id.split(".")[0]).filter((id) => id);
+            const last = triggered.length ? triggered[0] : null;
+
+            let start, end = null;
+            if (last === null) {
+                start = window.dash_clientside.dashboard.limitDate("max");
+            } else if (last.includes("btn-horizon-")) {
+                start = window.dash_clientside.dashboard.limitDate(last.split("-").pop());
+            } else {
+                [start, end] = dateRange.map((day) => String(day).slice(0, 10));
+            }
+
+            const data = store.traces.map((trace) => {
+                const rows = trace.x.map((day, i) => i).filter((i) => trace.x[i] >= start && (end === null || trace.x[i] <= end));
+                const base = rows.length ? trace.cumulative_return[rows[0]] : 1;
+                return {
+                    type: "scatter",
+                    name: trace.name,
+                    line: {color: trace.color, width: 4},
+                    x: rows.map((i) => trace.x[i]),
+                    // All start from 0% if returns are requested, else the values
+                    y: rows.map((i) => mode === "Prices" ? trace.value[i] : trace.cumulative_return[i] / base - 1),
+                };
+            });
+
+            const charted = data.filter((trace) => trace.x.length);
+            const range = charted.length ?
+                [charted.map((trace) => trace.x[0]).sort()[0], charted.map((trace) => trace.x[trace.x.length - 1]).sort().pop()] :
+                dash_clientside.no_update;
+            return [{data: data, layout: store.layouts[mode]}, range];
+        },
+    },
+});
@@ -1,9 +1,18 @@
 from django.urls import path, include
-from quotes import views, dash_app, dash_app_portfolio, dash_instrument_comparison
+from quotes import views, profiling, api
 
 urlpatterns = [
 	path('', views.home, name="home"),
 	path('about.html', views.about, name="about"),
 	path("portfolio/<str:pk>/", views.portfolio, name="portfolio"),
+	path("portfolio/<str:pk>/import-orders", views.import_portfolio_orders, name="import_portfolio_orders"),
     path("instrument-comparison", views.instrument_comparison, name="instrument_comparison"),
+    path("metrics", profiling.metrics, name="metrics"),
+    path("api/portfolio/<int:pk>/series", api.portfolio_series, name="api_portfolio_series"),
+    path("api/portfolio/<int:pk>/inventory", api.portfolio_inventory, name="api_portfolio_inventory"),
+    path("api/owner/<int:pk>/series", api.consolidated_series, name="api_owner_series"),
+    path("api/owner/<int:pk>/inventory", api.consolidated_inventory, name="api_owner_inventory"),
+    path("api/household/series", api.consolidated_series, name="api_household_series"),
+    path("api/household/inventory", api.consolidated_inventory, name="api_household_inventory"),
+    path("api/instrument/<int:pk>/prices", api.instrument_prices, name="api_instrument_prices"),
 ]
\ No newline at end of file
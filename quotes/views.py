@@ -1,11 +1,12 @@
-from plotly.graph_objs import YAxis
 import datetime as dt
-from django.shortcuts import render
+from io import TextIOWrapper
+from django.http import JsonResponse
+from django.shortcuts import render, get_object_or_404
+from django.views.decorators.http import require_POST
 from .models import Portfolio, Order, FinancialObject
+from .forms import OrderImportForm
+from .order_import import import_orders
 from django.db.models import Q
-import plotly.express as px
-import plotly.graph_objects as go
-import pandas as pd
 import json
 
 def home(request):
@@ -29,11 +30,32 @@ def portfolio(request, pk):
 	"""
 	# Send back a string to dash template in the context
 	context = {
-		"dash_context": {"pk": {"title": pk}}
+		"dash_context": {"pk": {"title": pk}},
+		"pk": pk,
+		"import_form": OrderImportForm(),
 			   }
 	return render(request, "portfolio.html", context)
 
 
+@require_POST
+def import_portfolio_orders(request, pk):
+	"""
+	Upload of a broker statement: all its orders are imported, or none if any is invalid
+	"""
+	portfolio = get_object_or_404(Portfolio, id=pk)
+
+	form = OrderImportForm(request.POST, request.FILES)
+	if not form.is_valid():
+		return JsonResponse({"errors": [error for errors in form.errors.values() for error in errors]}, status=400)
+
+	statement = TextIOWrapper(form.cleaned_data["statement"].file, encoding="utf-8-sig")
+	orders, errors = import_orders(portfolio, statement)
+	if errors:
+		return JsonResponse({"errors": errors}, status=400)
+
+	return JsonResponse({"imported": len(orders)})
+
+
 def instrument_comparison(request):
 	
     return render(request, "instrument_comparison.html", {})